@@ -0,0 +1,361 @@
+"""
+Lockstep batch simulator for the 4-AI training game.
+
+Plays N independent tables at once with the game_4AI rules: 4-4-4 + 2/1 deal,
+exchange-three, banned suit, Hu on self-draw or on a discard, Peng with a fixed
+probability (the peng player discards straight away and the turn does not pass),
+and the 250-round cap. Decks, hands (27-slot counts), discards and exposed melds
+are NumPy arrays and every step advances all unfinished tables together.
+
+Seat 0 is the dealer of every table (the dice only decide who deals). As in
+play_game the dealer also draws on the first turn, so it plays with one tile
+too many and never wins.
+
+Discards come from a batched policy: any object with
+    choose_discards(sim, tables, seats) -> tile IDs
+called with the table indices and seats that must discard now
+(HeuristicPolicy, the default, or QTablePolicy over an RLAgent Q-table).
+"""
+import time
+import numpy as np
+
+import hu_table
+from features import FeatureEncoder
+from q_store import N_ACTIONS
+from tiles import TIE_ORDER
+
+DECK_SIZE = 108
+MAX_ROUNDS = 250
+
+HU_TABLE = np.frombuffer(hu_table.TABLE, dtype=np.uint8)
+POW5 = np.array(hu_table.POW5, dtype=np.int64)
+_TIE_ORDER = np.array(TIE_ORDER)
+
+# Seat receiving each dealt tile, in the order tiles leave the end of the deck
+DEAL_SEATS = np.array(
+    [seat for _ in range(3) for seat in range(4) for _ in range(4)] + [0, 0, 1, 2, 3],
+    dtype=np.int64,
+)
+
+
+def is_complete(counts):
+    """
+    Vectorized win check of (M, 27) count vectors: seven pairs or melds + 1 pair
+    Returns (seven_pairs, regular) boolean arrays
+    """
+    counts = counts.astype(np.int64)
+    suits = counts.reshape(-1, 3, 9)
+    sizes = suits.sum(axis=2)
+    remainder = sizes % 3
+    flags = HU_TABLE[suits @ POW5]
+    suit_ok = np.where(remainder == 0, flags & hu_table.MELDS, np.where(remainder == 2, flags & hu_table.MELDS_WITH_PAIR, 0))
+    regular = (suit_ok != 0).all(axis=1) & (sizes.sum(axis=1) % 3 == 2)
+    seven_pairs = (counts.sum(axis=1) == 14) & ((counts == 0) | (counts == 2)).all(axis=1)
+    return seven_pairs, regular
+
+
+def sample_three(counts, rng):
+    """
+    Uniformly pick 3 tile copies from each row of (M, 9) suit counts
+    Returns the picked tiles as (M, 9) counts
+    """
+    m = len(counts)
+    keys = rng.random((m, 9, 4))
+    keys[np.arange(4)[None, None, :] >= counts[:, :, None]] = 2.0  # Copies not held
+    picked = np.argpartition(keys.reshape(m, 36), 3, axis=1)[:, :3] // 4
+    out = np.zeros((m, 9), dtype=np.int8)
+    np.add.at(out, (np.repeat(np.arange(m), 3), picked.ravel()), 1)
+    return out
+
+
+class HeuristicPolicy:
+    """
+    Batched counterpart of Player._find_worst_tile: banned suit tiles go first
+    (singles before pairs), otherwise the tile with the lowest value, where
+    pairs are worth 5 and every 2-of-3 straight window the tile sits in 3
+    """
+
+    def choose_discards(self, sim, tables, seats):
+        hands = sim.hands[tables, seats].astype(np.int64)
+        banned = sim.banned[tables, seats]
+        held = hands > 0
+
+        in_banned = (np.arange(27)[None, :] // 9) == banned[:, None]
+        banned_held = held & in_banned
+        has_banned = banned_held.any(axis=1)
+
+        # Banned suit: singles first, then anything of that suit
+        banned_score = np.where(banned_held, np.where(hands == 1, 0, 1), 9)
+
+        # Tile values as in _find_worst_tile
+        present = held.reshape(-1, 3, 9).astype(np.int64)
+        windows = present[:, :, :-2] + present[:, :, 1:-1] + present[:, :, 2:]  # (M, 3, 7)
+        good = (windows >= 2).astype(np.int64)
+        padded = np.pad(good, ((0, 0), (0, 0), (2, 2)))
+        in_windows = padded[:, :, :-2] + padded[:, :, 1:-1] + padded[:, :, 2:]  # (M, 3, 9)
+        value = 5 * (hands >= 2) + 3 * in_windows.reshape(-1, 27)
+        value = np.where(held, value, 1 << 20)
+
+        return np.where(has_banned, banned_score.argmin(axis=1), value.argmin(axis=1))
+
+
+class QTablePolicy:
+    """
+    Batched greedy policy of an RLAgent Q-table (q_store.QStore): banned suit
+    tiles go first as in HeuristicPolicy, otherwise the held tile with the
+    highest discard Q-value in the seat's get_state state (features.FeatureEncoder),
+    unset values counting as 0. Seats in states the table has no row for
+    follow HeuristicPolicy.
+    """
+
+    def __init__(self, q_table, capacity=1024):
+        self.q_table = q_table
+        self.fallback = HeuristicPolicy()
+        self._grow(capacity)
+
+    def _grow(self, capacity):
+        self.encoder = FeatureEncoder(capacity)
+        self.masks = np.zeros((capacity, N_ACTIONS), dtype=bool)  # Columns past the discards stay False
+
+    def choose_discards(self, sim, tables, seats):
+        tiles = self.fallback.choose_discards(sim, tables, seats)
+        if len(tables) > self.encoder.capacity:
+            self._grow(len(tables))
+        n = self.encoder.from_sim(sim, tables, seats)
+        states, _ = self.encoder.encode(n)
+        keys = [tuple(row) for row in states.tolist()]
+
+        hands = sim.hands[tables, seats]
+        masks = self.masks[:n]
+        np.greater(hands, 0, out=masks[:, :27])
+        best, _ = self.q_table.best_actions(keys, masks)
+
+        has_banned = hands.reshape(n, 3, 9).sum(axis=2)[np.arange(n), sim.banned[tables, seats]] > 0
+        greedy = (self.q_table.rows_of(keys) >= 0) & ~has_banned
+        tiles[greedy] = best[greedy]
+        return tiles
+
+
+class BatchMahjong:
+    def __init__(self, n_tables, policy=None, seed=None, peng_prob=0.8, max_rounds=MAX_ROUNDS, deal=True):
+        """deal=False leaves every table empty, for the caller to set up (see planner.py)"""
+        self.n = n_tables
+        self.policy = policy if policy is not None else HeuristicPolicy()
+        self.rng = np.random.default_rng(seed)
+        self.peng_prob = peng_prob  # 0.8 is the rate of game_4AI players with an agent
+        self.max_rounds = max_rounds
+        if deal:
+            self.reset()
+        else:
+            self.clear()
+
+    def clear(self):
+        """Empty every table: no deck, hands, melds or discards, seat 0 to play"""
+        n = self.n
+        self.deck = np.zeros((n, DECK_SIZE), dtype=np.int8)
+        self.top = np.zeros(n, dtype=np.int64)  # Tiles are drawn from the end
+        self.hands = np.zeros((n, 4, 27), dtype=np.int8)
+        self.exposed = np.zeros((n, 4, 27), dtype=np.int8)
+        self.melds = np.zeros((n, 4), dtype=np.int8)
+        self.banned = np.zeros((n, 4), dtype=np.int64)
+        self.discards = np.zeros((n, 27), dtype=np.int8)
+        self.last_discard = np.full(n, -1, dtype=np.int64)
+        self.current = np.zeros(n, dtype=np.int64)
+        self.rounds = np.zeros(n, dtype=np.int64)
+        self.done = np.zeros(n, dtype=bool)
+        self.winner = np.full(n, -1, dtype=np.int64)
+        self.loser = np.full(n, -1, dtype=np.int64)  # Seat whose discard the winner took
+        self.zimo = np.zeros(n, dtype=bool)
+
+    def reset(self):
+        """
+        Shuffle, deal, exchange three and pick banned suits on every table
+        """
+        n = self.n
+        tables = np.arange(n)
+        self.clear()
+        self.deck = np.argsort(self.rng.random((n, DECK_SIZE)), axis=1).astype(np.int8) % 27
+        self.top[:] = DECK_SIZE
+
+        # Deal: the end of the deck goes 4-4-4 to every seat, then 2 to the dealer and 1 to the others
+        dealt = self.deck[:, DECK_SIZE - len(DEAL_SEATS):][:, ::-1].astype(np.int64)
+        flat = (tables[:, None] * 4 + DEAL_SEATS[None, :]) * 27 + dealt
+        self.hands[:] = np.bincount(flat.ravel(), minlength=n * 4 * 27).reshape(n, 4, 27)
+        self.top -= len(DEAL_SEATS)
+
+        # Exchange three: every seat gives 3 tiles of its smallest suit (with at
+        # least 3 tiles) to the next seat and takes 3 of that suit back
+        for giver in range(4):
+            receiver = (giver + 1) % 4
+            giver_sizes = self.hands[:, giver].reshape(n, 3, 9).sum(axis=2)
+            receiver_sizes = self.hands[:, receiver].reshape(n, 3, 9).sum(axis=2)
+            # Ties go to the first suit in TIE_ORDER, as Player.exchange_three
+            suit = _TIE_ORDER[np.where(giver_sizes >= 3, giver_sizes, 99)[:, _TIE_ORDER].argmin(axis=1)]
+            ok = (giver_sizes >= 3).any(axis=1) & (receiver_sizes[tables, suit] >= 3)
+            rows, suit = tables[ok], suit[ok]
+            if not len(rows):
+                continue
+            cols = suit[:, None] * 9 + np.arange(9)[None, :]
+            given = sample_three(self.hands[rows, giver][np.arange(len(rows))[:, None], cols], self.rng)
+            taken = sample_three(self.hands[rows, receiver][np.arange(len(rows))[:, None], cols], self.rng)
+            self.hands[rows[:, None], giver, cols] += taken - given
+            self.hands[rows[:, None], receiver, cols] += given - taken
+
+        # Banned suit: the smallest suit, ties broken at random
+        sizes = self.hands.reshape(n, 4, 3, 9).sum(axis=3)
+        smallest = sizes == sizes.min(axis=2, keepdims=True)
+        self.banned = np.where(smallest, self.rng.random((n, 4, 3)), 2.0).argmin(axis=2)
+
+    def _discard(self, tables, seats):
+        tiles = np.asarray(self.policy.choose_discards(self, tables, seats), dtype=np.int64)
+        self.hands[tables, seats, tiles] -= 1
+        self.discards[tables, tiles] += 1
+        self.last_discard[tables] = tiles
+        return tiles
+
+    def step(self):
+        """
+        Play one turn on every unfinished table
+        Returns the number of tables still playing
+        """
+        # Empty deck or round cap ends the game without a winner
+        self.done |= (self.top == 0) | (self.rounds >= self.max_rounds)
+        tables = np.flatnonzero(~self.done)
+        if not len(tables):
+            return 0
+        seats = self.current[tables]
+
+        # Draw
+        self.top[tables] -= 1
+        drawn = self.deck[tables, self.top[tables]].astype(np.int64)
+        self.hands[tables, seats, drawn] += 1
+
+        # Self-draw Hu (no banned suit tiles allowed in the hand)
+        hands = self.hands[tables, seats]
+        seven_pairs, regular = is_complete(hands)
+        holds_banned = hands.reshape(-1, 3, 9).sum(axis=2)[np.arange(len(tables)), self.banned[tables, seats]] > 0
+        won = (seven_pairs | regular) & ~holds_banned
+        self.winner[tables[won]] = seats[won]
+        self.zimo[tables[won]] = True
+        self.done[tables[won]] = True
+        tables, seats = tables[~won], seats[~won]
+        if not len(tables):
+            return int((~self.done).sum())
+
+        # Discard
+        tiles = self._discard(tables, seats)
+        return self.resolve_discards(tables, seats, tiles)
+
+    def resolve_discards(self, tables, seats, tiles):
+        """
+        Finish the turns of tables whose current seat just discarded: Hu on the
+        discard, peng, and passing the turn on
+        Returns the number of tables still playing
+        """
+        # Hu on the discard: first other seat in seat order, as check_hu_with_tile
+        # judges it (tile not in the banned suit; regular Hu without banned tiles)
+        m = len(tables)
+        with_tile = self.hands[tables].astype(np.int64)
+        with_tile[np.arange(m), :, tiles] += 1
+        seven_pairs, regular = is_complete(with_tile.reshape(m * 4, 27))
+        seven_pairs, regular = seven_pairs.reshape(m, 4), regular.reshape(m, 4)
+        banned = self.banned[tables]
+        holds_banned = with_tile.reshape(m, 4, 3, 9).sum(axis=3)[np.arange(m)[:, None], np.arange(4)[None, :], banned] > 0
+        can_hu = (tiles[:, None] // 9 != banned) & (seven_pairs | (regular & ~holds_banned))
+        can_hu[np.arange(m), seats] = False
+        ron = can_hu.any(axis=1)
+        self.winner[tables[ron]] = can_hu[ron].argmax(axis=1)
+        self.loser[tables[ron]] = seats[ron]
+        self.done[tables[ron]] = True
+        tables, seats, tiles = tables[~ron], seats[~ron], tiles[~ron]
+        m = len(tables)
+        if not m:
+            return int((~self.done).sum())
+
+        # Peng: the next seats in turn order, each taking it with peng_prob
+        order = (seats[:, None] + np.arange(1, 4)[None, :]) % 4
+        rows = np.arange(m)[:, None]
+        can_peng = (
+            (self.hands[tables[:, None], order, tiles[:, None]] >= 2)
+            & (tiles[:, None] // 9 != self.banned[tables[:, None], order])
+            & (self.rng.random((m, 3)) < self.peng_prob)
+        )
+        peng = can_peng.any(axis=1)
+        peng_tables = tables[peng]
+        peng_seats = order[rows[peng, 0], can_peng[peng].argmax(axis=1)]
+        peng_tiles = tiles[peng]
+        self.hands[peng_tables, peng_seats, peng_tiles] -= 2
+        self.exposed[peng_tables, peng_seats, peng_tiles] += 3
+        self.melds[peng_tables, peng_seats] += 1
+        # The peng player discards at once (unless the peng emptied its hand);
+        # the turn stays with the current seat
+        holding = self.hands[peng_tables, peng_seats].any(axis=1)
+        if holding.any():
+            self._discard(peng_tables[holding], peng_seats[holding])
+
+        # Everyone else passes the turn on
+        passed = tables[~peng]
+        self.current[passed] = (self.current[passed] + 1) % 4
+        self.rounds[passed] += 1
+        return int((~self.done).sum())
+
+    def play(self):
+        """Play every table to the end"""
+        while self.step():
+            pass
+        return self
+
+    def scores(self):
+        """
+        Score of each table's win as Player.calculate_score (2 ** fan: all
+        triplets 1, one suit 2, seven pairs 2, self-draw 1; there are no gangs),
+        0 without a winner
+        """
+        tables = np.flatnonzero(self.winner >= 0)
+        seats = self.winner[tables]
+        hands = self.hands[tables, seats].astype(np.int64)
+        melds = self.melds[tables, seats].astype(np.int64)
+        all_triplets = (melds + (hands == 3).sum(axis=1) == 4) & ((hands == 2).sum(axis=1) == 1)
+        suits = (hands + self.exposed[tables, seats]).reshape(-1, 3, 9).sum(axis=2) > 0
+        one_suit = suits.sum(axis=1) == 1
+        seven_pairs = (hands.sum(axis=1) == 14) & ((hands == 0) | (hands == 2)).all(axis=1)
+        fan = all_triplets + 2 * one_suit + 2 * seven_pairs + self.zimo[tables]
+        scores = np.zeros(self.n, dtype=np.int64)
+        scores[tables] = 1 << fan
+        return scores
+
+    def results(self):
+        """Per-seat wins, draws and average game length"""
+        return {
+            "tables": self.n,
+            "wins": np.bincount(self.winner[self.winner >= 0], minlength=4).tolist(),
+            "zimo": int(self.zimo.sum()),
+            "draws": int((self.winner < 0).sum()),
+            "avg_rounds": float(self.rounds.mean()),
+        }
+
+
+def run_batches(games, batch_size=1024, policy=None, seed=None, peng_prob=0.8):
+    """Play `games` games in batches and sum up the results"""
+    rng = np.random.default_rng(seed)
+    totals = {"tables": 0, "wins": [0, 0, 0, 0], "zimo": 0, "draws": 0, "rounds": 0}
+    start = time.time()
+    while totals["tables"] < games:
+        n = min(batch_size, games - totals["tables"])
+        sim = BatchMahjong(n, policy=policy, seed=rng.integers(1 << 63), peng_prob=peng_prob).play()
+        result = sim.results()
+        totals["tables"] += n
+        totals["wins"] = [a + b for a, b in zip(totals["wins"], result["wins"])]
+        totals["zimo"] += result["zimo"]
+        totals["draws"] += result["draws"]
+        totals["rounds"] += int(sim.rounds.sum())
+    totals["seconds"] = time.time() - start
+    return totals
+
+
+if __name__ == "__main__":
+    totals = run_batches(10240, seed=0)
+    print(f"Played {totals['tables']} games in {totals['seconds']:.2f}s "
+          f"({totals['tables'] / totals['seconds']:.0f} games/sec)")
+    print(f"Wins per seat: {totals['wins']} (zimo {totals['zimo']}), draws: {totals['draws']}")
+    print(f"Average length: {totals['rounds'] / totals['tables']:.1f} rounds")
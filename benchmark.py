@@ -0,0 +1,637 @@
+"""
+Benchmarks.
+
+The default run is the benchmark suite: fixed-seed microbenchmarks of the win
+checks, the agent methods and game state snapshots, games/sec of both game
+modules and Q-table load / save times. Results go to a JSON file; --compare checks them against a
+stored baseline and fails on regressions beyond --threshold.
+
+--comparisons runs the side-by-side benchmarks of the old and new engines.
+"""
+import io
+import os
+import sys
+import copy
+import json
+import random
+import platform
+import tempfile
+import time
+import argparse
+import contextlib
+import hu_table
+import batch_sim
+import q_store
+import features
+from tiles import SUITS, Hand, tile_id
+
+def recursive_is_regular_hu(hand):
+    """
+    The original recursive win check (dict copy per pair, f-string tiles)
+    Kept only as the reference for the table-driven engine
+    """
+    if len(hand) != 14:
+        return False
+
+    counts = {}
+    for tile in hand:
+        counts[tile] = counts.get(tile, 0) + 1
+
+    pairs = [tile for tile, count in counts.items() if count >= 2]
+    for pair in pairs:
+        temp_counts = counts.copy()
+        temp_counts[pair] -= 2
+        if _recursive_can_form_melds(temp_counts):
+            return True
+
+    return False
+
+def _recursive_can_form_melds(counts):
+    if not any(counts.values()):
+        return True
+
+    first_tile = next((tile for tile, count in counts.items() if count > 0), None)
+    if not first_tile:
+        return True
+
+    if counts[first_tile] >= 3:
+        counts[first_tile] -= 3
+        if _recursive_can_form_melds(counts):
+            return True
+        counts[first_tile] += 3
+
+    suit = first_tile[-1]
+    num = int(first_tile[:-1])
+    if num <= 7:
+        straight_possible = True
+        for i in range(3):
+            straight_tile = f"{num+i}{suit}"
+            if straight_tile not in counts or counts[straight_tile] == 0:
+                straight_possible = False
+                break
+
+        if straight_possible:
+            for i in range(3):
+                counts[f"{num+i}{suit}"] -= 1
+            if _recursive_can_form_melds(counts):
+                return True
+            for i in range(3):
+                counts[f"{num+i}{suit}"] += 1
+
+    return False
+
+def sort_key(tile):
+    return (tile[-1], int(tile[:-1]))
+
+def hand_corpus(size=2000, seed=1234):
+    """
+    Fixed corpus of sorted 14-tile hands: half random deals, half built from
+    random melds + pair so that plenty of them are winning hands
+    """
+    rng = random.Random(seed)
+    deck = [f"{num}{suit}" for suit in SUITS for num in range(1, 10)] * 4
+    hands = []
+    while len(hands) < size:
+        if len(hands) % 2 == 0:
+            hand = rng.sample(deck, 14)
+        else:
+            hand = []
+            suits = rng.sample(SUITS, 2)
+            for _ in range(4):
+                suit = rng.choice(suits)
+                if rng.random() < 0.5:
+                    num = rng.randint(1, 9)
+                    hand.extend([f"{num}{suit}"] * 3)
+                else:
+                    num = rng.randint(1, 7)
+                    hand.extend(f"{num+i}{suit}" for i in range(3))
+            num = rng.randint(1, 9)
+            hand.extend([f"{num}{rng.choice(suits)}"] * 2)
+            if any(hand.count(t) > 4 for t in hand):
+                continue
+        hands.append(sorted(hand, key=sort_key))
+    return hands
+
+def bench_hu(repeat=5):
+    """Checks per second of the recursive path vs the table-driven engine"""
+    hands = hand_corpus()
+
+    def counts_of(hand):
+        return Hand(tile_id(t) for t in hand).counts
+
+    # Both paths must agree on every hand of the corpus
+    for hand in hands:
+        assert recursive_is_regular_hu(hand) == hu_table.is_regular_hu(counts_of(hand)), hand
+
+    # "table" includes the tile string -> count vector conversion,
+    # "table-counts" is the lookup alone on hands already held as counts
+    counts = [counts_of(hand) for hand in hands]
+    results = {}
+    for name, check, corpus in (
+        ("recursive", recursive_is_regular_hu, hands),
+        ("table", lambda hand: hu_table.is_regular_hu(counts_of(hand)), hands),
+        ("table-counts", hu_table.is_regular_hu, counts),
+    ):
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for hand in corpus:
+                check(hand)
+            best = min(best, time.perf_counter() - start)
+        results[name] = len(corpus) / best
+
+    winning = sum(1 for hand in hands if recursive_is_regular_hu(hand))
+    print(f"Hand corpus: {len(hands)} hands ({winning} winning)")
+    for name, rate in results.items():
+        print(f"{name:>12}: {rate:,.0f} checks/sec")
+    print(f"Speedup: {results['table'] / results['recursive']:.1f}x "
+          f"({results['table-counts'] / results['recursive']:.1f}x on count vectors)")
+    return results
+
+class _HeuristicAgent:
+    """
+    Serial counterpart of batch_sim.HeuristicPolicy, in the agent slot of
+    every player (so pengs happen at the agent rate, as in the simulator):
+    banned suit singles first, then any banned tile, else
+    Player._find_worst_tile. No rewards, no learning.
+    """
+
+    def choose_action(self, player, game):
+        banned = player.hand.suit_tiles(player.banned_suit)
+        if banned:
+            singles = [tile for tile in banned if player.hand.counts[tile] == 1]
+            return "discard", (singles or banned)[0]
+        return "discard", player._find_worst_tile()
+
+    def calculate_reward(self, player, game, action, hu_achieved=False):
+        return 0
+
+    def get_state(self, player, game):
+        return None
+
+    def update_q_table(self, player, game, next_state, reward, hu_achieved=False):
+        pass
+
+    def finish_game(self, game):
+        pass
+
+def bench_batch(tables=1024, serial_games=200, seed=0):
+    """
+    Games per second of the serial 4-AI game vs the lockstep batch simulator,
+    both under the heuristic discard policy (so the ratio compares the
+    engines), and of the simulator under QTablePolicy over MODEL
+    """
+    from game_4AI import MahjongGame
+
+    rng = random.Random(seed)
+    agent = _HeuristicAgent()
+    start = time.perf_counter()
+    for _ in range(serial_games):
+        game = MahjongGame(agent, rng=rng)
+        game.play_game(quiet=True)
+    serial = serial_games / (time.perf_counter() - start)
+
+    # One warm-up batch, then the timed one
+    batch_sim.BatchMahjong(64, seed=seed).play()
+    start = time.perf_counter()
+    sim = batch_sim.BatchMahjong(tables, seed=seed).play()
+    batch = tables / (time.perf_counter() - start)
+
+    policy = batch_sim.QTablePolicy(q_store.load(MODEL))
+    batch_sim.BatchMahjong(64, policy=policy, seed=seed).play()
+    start = time.perf_counter()
+    batch_sim.BatchMahjong(tables, policy=policy, seed=seed).play()
+    batch_q = tables / (time.perf_counter() - start)
+
+    result = sim.results()
+    print(f"Serial game: {serial:,.0f} games/sec ({serial_games} games)")
+    print(f"Batch (N={tables}): {batch:,.0f} games/sec, wins per seat {result['wins']}, "
+          f"draws {result['draws']}, avg {result['avg_rounds']:.1f} rounds")
+    print(f"Speedup: {batch / serial:.1f}x")
+    print(f"Batch with the Q-table policy: {batch_q:,.0f} games/sec")
+    return {"serial": serial, "batch": batch, "batch_q": batch_q}
+
+def bench_model_load(path="models/q_table.pkl", repeat=5):
+    """
+    Time to load a Q-table from its pickle vs mapping its binary conversion,
+    each followed by the same 1000 lookups
+    """
+    store = q_store.load(path)
+    binary_path = os.path.join(tempfile.mkdtemp(), "q_table" + q_store.BINARY_SUFFIX)
+    q_store.save_binary(store, binary_path)
+    keys = list(store.to_dict())[:1000]
+
+    results = {}
+    for name, load in (
+        ("pickle", lambda: q_store.load(path)),
+        ("binary", lambda: q_store.load_binary(binary_path)),
+    ):
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            table = load()
+            for key in keys:
+                table.get(key, 0)
+            best = min(best, time.perf_counter() - start)
+        results[name] = best
+
+    print(f"Q-table {path}: {len(store)} entries, pickle {os.path.getsize(path):,} bytes, "
+          f"binary {os.path.getsize(binary_path):,} bytes")
+    for name, seconds in results.items():
+        print(f"{name:>12}: {seconds * 1000:.2f} ms to load + 1000 lookups")
+    print(f"Speedup: {results['pickle'] / results['binary']:.0f}x")
+    os.remove(binary_path)
+    return results
+
+MODEL = "models/q_table.pkl"
+RESULTS_FILE = "results/benchmark.json"
+BASELINE_FILE = "benchmark_baseline.json"
+
+def _best_time(run, repeat, min_time=0.1):
+    """
+    Shortest time of one run() over repeat timings, each timing looping run()
+    for at least min_time seconds so that short runs are not lost in noise
+    """
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            run()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        loops *= 2
+    best = elapsed / loops
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(loops):
+            run()
+        best = min(best, (time.perf_counter() - start) / loops)
+    return best
+
+def _rate(value):
+    return {"value": value, "unit": "ops/s"}
+
+def _quiet_agent(**settings):
+    """RLAgent over a fresh copy of MODEL (without the load message)"""
+    from rl_agent import RLAgent
+    return RLAgent(q_table=q_store.load(MODEL), **settings)
+
+def position_corpus(size=300, seed=99):
+    """
+    Fixed corpus of mid-game 4-AI positions (game, player, tile): after the
+    deal, 0-50 turns of random draws and discards, with the player to move
+    holding a freshly drawn hand and tile a tile it could discard
+    """
+    from game_4AI import MahjongGame
+
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < size:
+        game = MahjongGame(rng=rng)
+        game.deal_tiles()
+        turns = rng.randint(0, 50)
+        for turn in range(turns + 1):
+            player = game.players[turn % 4]
+            if turn:
+                player.draw_tile(game.deck)
+            tile = rng.choice(player.hand.distinct())
+            if turn < turns:
+                player.hand.remove(tile)
+                game.discards.append(tile)
+                game.show(tile)
+        positions.append((game, player, tile))
+    return positions
+
+def bench_player(repeat=5):
+    """Win checks of game_4AI.Player on the fixed hand corpus, caches cleared per call"""
+    from game_4AI import Player
+
+    rng = random.Random(7)
+    complete, waiting = [], []
+    for hand in hand_corpus():
+        ids = [tile_id(t) for t in hand]
+        for tiles, players in ((ids, complete), (ids[1:], waiting)):
+            player = Player("Bench", rng=rng)
+            player.hand = Hand(tiles)
+            player.determine_banned_suit()
+            players.append((player, ids[0]))
+    counts = [player.hand.counts for player, _ in complete]
+    checker = complete[0][0]
+
+    def check_hu():
+        for player, _ in complete:
+            player._hu_key = None
+            player.check_hu()
+
+    def check_hu_with_tile():
+        for player, tile in waiting:
+            player._waits_key = None
+            player.check_hu_with_tile(tile)
+
+    def is_regular_hu():
+        for c in counts:
+            checker.is_regular_hu(c)
+
+    return {
+        "player.check_hu": _rate(len(complete) / _best_time(check_hu, repeat)),
+        "player.check_hu_with_tile": _rate(len(waiting) / _best_time(check_hu_with_tile, repeat)),
+        "player.is_regular_hu": _rate(len(counts) / _best_time(is_regular_hu, repeat)),
+    }
+
+def bench_agent(repeat=5):
+    """RLAgent.get_state / choose_action / calculate_reward / update_q_table on the position corpus"""
+    positions = position_corpus()
+    after = copy.deepcopy(positions)
+    for game, player, tile in after:
+        player.hand.remove(tile)
+        game.discards.append(tile)
+        game.show(tile)
+    agent = _quiet_agent()
+
+    agent.rng = random.Random(11)
+    decisions = []
+    for game, player, _ in positions:
+        agent.reset_for_new_game()
+        action = agent.choose_action(player, game)
+        decisions.append((game, player, agent.last_state, agent.legal_actions(player, game), action))
+
+    def get_state():
+        for game, player, _ in positions:
+            agent.get_state(player, game)
+
+    def choose_action():
+        agent.rng = random.Random(11)
+        agent.trajectories = {}
+        for game, player, _ in positions:
+            agent.choose_action(player, game)
+
+    def calculate_reward():
+        for game, player, tile in after:
+            agent.calculate_reward(player, game, ("discard", tile))
+
+    def update_q_table():
+        for game, player, state, mask, action in decisions:
+            # A decision closed at the previous turn boundary is learned from at this one
+            agent.trajectories = {player: [[state, action, (1.0, state, mask, False)], [state, action, None]]}
+            agent.update_q_table(player, game, state, 1.0)
+
+    n = len(positions)
+    return {
+        "agent.get_state": _rate(n / _best_time(get_state, repeat)),
+        "agent.choose_action": _rate(n / _best_time(choose_action, repeat)),
+        "agent.calculate_reward": _rate(n / _best_time(calculate_reward, repeat)),
+        "agent.update_q_table": _rate(n / _best_time(update_q_table, repeat)),
+    }
+
+def bench_features(repeat=5):
+    """
+    features.FeatureEncoder on the position corpus as one batch: filling the
+    inputs from the players, and encoding them (compare agent.get_state)
+    """
+    positions = [(player, game) for game, player, _ in position_corpus()]
+    encoder = features.FeatureEncoder(len(positions))
+
+    def gather():
+        encoder.gather(positions)
+
+    def encode():
+        encoder.encode(len(positions))
+
+    n = len(positions)
+    gather()
+    return {
+        "features.gather": _rate(n / _best_time(gather, repeat)),
+        "features.encode": _rate(n / _best_time(encode, repeat)),
+    }
+
+def bench_state(repeat=5):
+    """
+    MahjongGame.snapshot (with and without the RNG state) / restore / clone on
+    the position corpus games (an agent in every seat), against copy.deepcopy
+    of the game with the agent shared
+    """
+    from game_4AI import MahjongGame
+
+    # A clone played out (learning, with the agent shared) must leave the
+    # decisions still pending in the original game alone
+    learner = _quiet_agent(rng=random.Random(0))
+    original = MahjongGame(learner, rng=random.Random(0))
+    original.play_game(quiet=True, until_round=10)
+    pending = copy.deepcopy({player.name: learner.trajectories.get(player) for player in original.players})
+    assert any(pending.values())
+    original.clone().play_game(quiet=True, deal=False)
+    assert {player.name: learner.trajectories.get(player) for player in original.players} == pending
+
+    games = [game for game, _, _ in position_corpus()]
+    agent = _quiet_agent()
+    for game in games:
+        for player in game.players:
+            player.rl_agent = agent
+    snapshots = [game.snapshot() for game in games]
+
+    def snapshot():
+        for game in games:
+            game.snapshot()
+
+    def snapshot_board():
+        for game in games:
+            game.snapshot(rng=False)
+
+    def restore():
+        for game, state in zip(games, snapshots):
+            game.restore(state)
+
+    def clone():
+        for game in games:
+            game.clone()
+
+    def deepcopy():
+        for game in games:
+            copy.deepcopy(game, {id(agent): agent})
+
+    n = len(games)
+    return {
+        "state.snapshot": _rate(n / _best_time(snapshot, repeat)),
+        "state.snapshot_board": _rate(n / _best_time(snapshot_board, repeat)),
+        "state.restore": _rate(n / _best_time(restore, repeat)),
+        "state.clone": _rate(n / _best_time(clone, repeat)),
+        "state.deepcopy": _rate(n / _best_time(deepcopy, repeat)),
+    }
+
+def bench_planner(repeat=5, positions=4, rollouts=2048):
+    """Rollouts per second of planner.RolloutPlanner on the first positions of the position corpus"""
+    import planner
+
+    corpus = [(game, player, player.hand.distinct()) for game, player, _ in position_corpus()[:positions]]
+    rollout_planner = planner.RolloutPlanner(rollouts=rollouts, seed=0)
+    # Every candidate is played in rollouts // candidates worlds
+    played = sum(rollouts // len(candidates) * len(candidates) for _, _, candidates in corpus)
+
+    def plan():
+        for game, player, candidates in corpus:
+            rollout_planner.evaluate(player, game, candidates)
+
+    return {"planner.rollouts": _rate(played / _best_time(plan, repeat))}
+
+def bench_games(games=100, seed=0):
+    """
+    Games per second of game_4AI (one learning agent in every seat, as in
+    training) and game_1AI (a frozen agent against random players, as in
+    evaluation)
+    """
+    import game_4AI
+    import game_1AI
+
+    results = {}
+    for name, module, agent in (
+        ("game_4AI.play_game", game_4AI, _quiet_agent(alpha=0.15, epsilon=0.25)),
+        ("game_1AI.play_game", game_1AI, _quiet_agent(epsilon=0.05, frozen=True)),
+    ):
+        rng = random.Random(seed)
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            for _ in range(games):
+                game = module.MahjongGame(agent, rng=rng)
+                agent.reset_for_new_game(rng)
+                game.play_game(quiet=True)
+        results[name] = {"value": games / (time.perf_counter() - start), "unit": "games/s"}
+    return results
+
+def bench_model_io(repeat=5):
+    """Load and save times of MODEL in the pickle and binary formats"""
+    from rl_agent import RLAgent
+
+    store = q_store.load(MODEL)
+    directory = tempfile.mkdtemp()
+    binary_path = os.path.join(directory, "q_table" + q_store.BINARY_SUFFIX)
+    pickle_path = os.path.join(directory, "q_table.pkl")
+    q_store.save_binary(store, binary_path)
+    agent = RLAgent(q_table=store, q_table_file=pickle_path)
+
+    def save_pickle():
+        with contextlib.redirect_stdout(io.StringIO()):
+            agent.save_q_table()
+
+    results = {}
+    for name, run in (
+        ("q_table.load_pickle", lambda: q_store.load(MODEL)),
+        ("q_table.load_binary", lambda: q_store.load_binary(binary_path)),
+        ("q_table.save_pickle", save_pickle),
+        ("q_table.save_binary", lambda: q_store.save_binary(store, binary_path)),
+    ):
+        results[name] = {"value": _best_time(run, repeat) * 1000, "unit": "ms"}
+    for path in (binary_path, pickle_path):
+        os.remove(path)
+    os.rmdir(directory)
+    return results
+
+# Suite benchmarks by name (result names start with the benchmark name or its prefix)
+SUITE = {
+    "player": bench_player,
+    "agent": bench_agent,
+    "features": bench_features,
+    "state": bench_state,
+    "planner": bench_planner,
+    "games": bench_games,
+    "q_table": bench_model_io,
+}
+
+def run_suite(repeat=5, games=100, only=None):
+    """Run the suite benchmarks (or only those named) and return the results document"""
+    import shanten
+    shanten.load_tables("models/shanten_tables.pkl")
+
+    results = {}
+    for name, bench in SUITE.items():
+        if only and name not in only:
+            continue
+        print(f"Running {name} benchmarks...")
+        results.update(bench(games=games) if bench is bench_games else bench(repeat=repeat))
+    return {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "repeat": repeat,
+            "games": games,
+        },
+        "results": results,
+    }
+
+def higher_is_better(unit):
+    return unit.endswith("/s")
+
+def compare(results, baseline, threshold=0.10):
+    """
+    Print every result against the baseline
+    Returns the names of the results worse than the baseline by more than threshold
+    """
+    regressions = []
+    print(f"{'benchmark':<28} {'baseline':>12} {'current':>12} {'unit':>8} {'change':>8}")
+    for name, result in results["results"].items():
+        old = baseline["results"].get(name)
+        if old is None:
+            print(f"{name:<28} {'-':>12} {result['value']:>12.2f} {result['unit']:>8} {'new':>8}")
+            continue
+        change = result["value"] / old["value"] - 1
+        worse = -change if higher_is_better(result["unit"]) else change
+        flag = ""
+        if worse > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<28} {old['value']:>12.2f} {result['value']:>12.2f} {result['unit']:>8} "
+              f"{change:>+8.1%}{flag}")
+    return regressions
+
+def run_comparisons(repeat=5, tables=1024, serial_games=200):
+    """Side-by-side benchmarks of the old and new engines"""
+    bench_hu(repeat=repeat)
+    bench_batch(tables=tables, serial_games=serial_games)
+    bench_model_load(repeat=repeat)
+
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='Mahjong benchmarks')
+    parser.add_argument('--repeat', type=int, default=5, help='Timing repetitions (best is kept)')
+    parser.add_argument('--games', type=int, default=100, help='Games per game module in the games benchmark')
+    parser.add_argument('--only', nargs='*', choices=sorted(SUITE), help='Run only these suite benchmarks')
+    parser.add_argument('--out', default=RESULTS_FILE, help='JSON results file')
+    parser.add_argument('--compare', nargs='?', const=BASELINE_FILE, default=None, metavar='BASELINE',
+                        help=f'Compare with a baseline results file (default {BASELINE_FILE}); '
+                             'exits with status 1 on regressions')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='Relative slowdown that counts as a regression')
+    parser.add_argument('--save-baseline', action='store_true', help=f'Also write the results to {BASELINE_FILE}')
+    parser.add_argument('--comparisons', action='store_true',
+                        help='Run the old vs new engine comparisons instead of the suite')
+    parser.add_argument('--tables', type=int, default=1024, help='Tables in the batch simulator comparison')
+    parser.add_argument('--serial-games', type=int, default=200, help='Games played by the serial baseline')
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    if args.comparisons:
+        run_comparisons(args.repeat, args.tables, args.serial_games)
+        sys.exit(0)
+
+    results = run_suite(repeat=args.repeat, games=args.games, only=args.only)
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    outputs = [args.out] + ([BASELINE_FILE] if args.save_baseline else [])
+    for path in outputs:
+        with open(path, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results saved to {path}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+        print(f"No regressions beyond {args.threshold:.0%}")
+    else:
+        for name, result in results["results"].items():
+            print(f"{name:<28} {result['value']:>12.2f} {result['unit']}")
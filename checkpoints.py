@@ -0,0 +1,342 @@
+"""
+Incremental Q-table checkpoints.
+
+A checkpoint directory holds base snapshots (base_ep<N>.seg, one segment with
+every entry of the table) and, for every base, an append-only log of delta
+segments (deltas_ep<N>.log). A delta segment holds only the (state, action)
+entries written since the previous save, so a save costs as much as the
+learning done since then. When a base's log grows past compact_ratio times the
+base, the next save folds everything into a new base instead; with keep_bases,
+only that many of the latest bases (and their logs) are kept.
+
+A segment is a header and the zlib-compressed entries, sorted by (state,
+action): state ID differences, action IDs, and the value bytes grouped by byte
+position (which compresses the exponent bytes). Values keep the store's dtype,
+so checkpoints are exact.
+
+Any saved episode can be rebuilt with materialize(): the latest base at or
+before it plus its segments up to that episode.
+
+Training runs each checkpoint into their own directory, RUNS_DIR/train_<time>.
+
+CheckpointWriter moves the writes to a background process: the training loop
+only snapshots the changed entries (or the whole table, for a new base).
+"""
+import os
+import re
+import glob
+import time
+import zlib
+import struct
+import argparse
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+import q_store
+from q_store import QStore, N_ACTIONS, action_of, decode_state
+
+SEGMENT_MAGIC = b"MJQZ"
+SEGMENT_HEADER = struct.Struct("<4sQQII")  # magic, episode, entries, value item size, compressed bytes
+
+BASE_PATTERN = re.compile(r"base_ep(\d+)\.seg$")
+RUN_PATTERN = re.compile(r"train_(\d+)$")
+
+RUNS_DIR = "models/checkpoints"
+
+
+def base_path(directory, episode):
+    return os.path.join(directory, f"base_ep{episode}.seg")
+
+
+def log_path(directory, episode):
+    return os.path.join(directory, f"deltas_ep{episode}.log")
+
+
+def latest_run(root=RUNS_DIR):
+    """Checkpoint directory of the latest training run under root (None if there is none)"""
+    runs = {}
+    for path in glob.glob(os.path.join(root, "train_*")):
+        match = RUN_PATTERN.search(path)
+        if match and os.path.isdir(path):
+            runs[int(match.group(1))] = path
+    return runs[max(runs)] if runs else None
+
+
+def base_episodes(directory):
+    """Episodes of the base snapshots in a directory, ascending"""
+    episodes = []
+    for path in glob.glob(os.path.join(directory, "base_ep*.seg")):
+        match = BASE_PATTERN.search(path)
+        if match:
+            episodes.append(int(match.group(1)))
+    return sorted(episodes)
+
+
+def encode_segment(episode, state_ids, actions, values):
+    """Segment of (state ID, action ID, value) entries"""
+    order = np.lexsort((actions, state_ids))
+    state_ids = state_ids[order].astype(np.int64)
+    values = np.ascontiguousarray(values[order])
+    itemsize = values.dtype.itemsize
+    payload = zlib.compress(np.diff(state_ids, prepend=0).tobytes()
+                            + actions[order].astype(np.uint8).tobytes()
+                            + values.view(np.uint8).reshape(-1, itemsize).T.tobytes())
+    return SEGMENT_HEADER.pack(SEGMENT_MAGIC, episode, len(order), itemsize, len(payload)) + payload
+
+
+def read_segments(path):
+    """Yield (episode, state IDs, action IDs, values) for every segment of a file"""
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return
+    with f:
+        while True:
+            header = f.read(SEGMENT_HEADER.size)
+            if len(header) < SEGMENT_HEADER.size:
+                return  # End of file (or a segment cut short by a crash)
+            magic, episode, n, itemsize, size = SEGMENT_HEADER.unpack(header)
+            if magic != SEGMENT_MAGIC:
+                raise ValueError(f"{path} is not a checkpoint segment file")
+            data = f.read(size)
+            if len(data) < size:
+                return
+            data = zlib.decompress(data)
+            state_ids = np.cumsum(np.frombuffer(data, dtype=np.int64, count=n))
+            actions = np.frombuffer(data, dtype=np.uint8, count=n, offset=8 * n)
+            values = (np.frombuffer(data, dtype=np.uint8, count=n * itemsize, offset=9 * n)
+                      .reshape(itemsize, n).T.copy().view(q_store.VALUE_TYPES[itemsize]).ravel())
+            yield episode, state_ids, actions, values
+
+
+def apply_segment(store, state_ids, actions, values):
+    for code, a, value in zip(state_ids.tolist(), actions.tolist(), values.tolist()):
+        store[(decode_state(code), action_of(a))] = value
+
+
+def saved_episodes(directory):
+    """Every episode that can be materialized"""
+    episodes = []
+    for base in base_episodes(directory):
+        episodes.append(base)
+        episodes.extend(episode for episode, _, _, _ in read_segments(log_path(directory, base)))
+    return sorted(set(episodes))
+
+
+def materialize(directory, episode=None):
+    """
+    QStore as it was saved at an episode (default: the latest save)
+    Raises ValueError if that episode was never saved
+    """
+    bases = base_episodes(directory)
+    if episode is None:
+        saved = saved_episodes(directory)
+        if not saved:
+            raise ValueError(f"No checkpoints in {directory}")
+        episode = saved[-1]
+    candidates = [base for base in bases if base <= episode]
+    if not candidates:
+        raise ValueError(f"No checkpoint at episode {episode} in {directory}")
+    base = candidates[-1]
+
+    store = None
+    for _, state_ids, actions, values in read_segments(base_path(directory, base)):
+        store = QStore(capacity=max(1024, len(np.unique(state_ids))), dtype=values.dtype)
+        apply_segment(store, state_ids, actions, values)
+    if store is None:
+        raise ValueError(f"Base of episode {base} in {directory} is incomplete")
+    found = base == episode
+    for segment_episode, state_ids, actions, values in read_segments(log_path(directory, base)):
+        if segment_episode > episode:
+            break
+        apply_segment(store, state_ids, actions, values)
+        found = found or segment_episode == episode
+    if not found:
+        raise ValueError(f"No checkpoint at episode {episode} in {directory}")
+    return store
+
+
+def _append_segment(path, segment):
+    with open(path, "ab") as f:
+        f.write(segment)
+
+
+def _write_base(segment, path, log, pruned):
+    """Write a base (starting a new log), then remove the pruned bases and logs"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(segment)
+    os.replace(tmp_path, path)
+    if os.path.exists(log):
+        os.remove(log)
+    for old_path in pruned:
+        if os.path.exists(old_path):
+            os.remove(old_path)
+
+
+class DeltaCheckpointer:
+    """
+    Saves a QStore into a checkpoint directory: a base the first time, then
+    delta segments of the entries changed since the previous save
+    keep_bases: bases (with their logs) kept once a new one is written, None for all
+    """
+
+    def __init__(self, store, directory, compact_ratio=4.0, keep_bases=None):
+        self.store = store
+        self.directory = directory
+        self.compact_ratio = compact_ratio
+        self.keep_bases = keep_bases
+        self.base = None  # Episode of the current base
+        self.bases = []  # Episodes of the bases written and kept
+        self.base_bytes = 0
+        self.log_bytes = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def prepare(self, episode):
+        """
+        Encode what a checkpoint at this episode has to write, so the store
+        can keep changing while it is written
+        Returns (write function, its arguments, bytes it will write)
+        """
+        if self.base is None or self.log_bytes > self.compact_ratio * self.base_bytes:
+            return self._prepare_base(episode)
+
+        changed = np.fromiter(self.store.changed, dtype=np.int64, count=len(self.store.changed))
+        rows, actions = changed // N_ACTIONS, changed % N_ACTIONS
+        segment = encode_segment(episode, self.store.state_ids[rows], actions, self.store.values[rows, actions])
+        self.store.changed = set()
+        self.log_bytes += len(segment)
+        return _append_segment, (log_path(self.directory, self.base), segment), len(segment)
+
+    def _prepare_base(self, episode):
+        store = self.store
+        rows, actions = np.nonzero(store.present[:store.n_rows])
+        segment = encode_segment(episode, store.state_ids[rows], actions, store.values[rows, actions])
+        store.changed = set()
+        self.base = episode
+        self.base_bytes = len(segment)
+        self.log_bytes = 0
+        self.bases.append(episode)
+        pruned = []
+        if self.keep_bases is not None and len(self.bases) > self.keep_bases:
+            dropped, self.bases = self.bases[:-self.keep_bases], self.bases[-self.keep_bases:]
+            print(f"Checkpoints: removing the bases of episodes {dropped} from {self.directory} "
+                  f"(keeping the latest {self.keep_bases})")
+            for old in dropped:
+                pruned += [base_path(self.directory, old), log_path(self.directory, old)]
+        args = (segment, base_path(self.directory, episode), log_path(self.directory, episode), pruned)
+        return _write_base, args, self.base_bytes
+
+    def save(self, episode):
+        """
+        Checkpoint the store as of an episode, synchronously
+        Returns the number of bytes written
+        """
+        write, args, size = self.prepare(episode)
+        write(*args)
+        return size
+
+    def compact(self, episode):
+        """
+        Fold the current table into a new base at an episode (older bases and
+        their logs are kept up to keep_bases, so earlier episodes stay
+        materializable)
+        Returns the number of bytes written
+        """
+        write, args, size = self._prepare_base(episode)
+        write(*args)
+        return size
+
+
+class CheckpointWriter:
+    """
+    Writes a DeltaCheckpointer's checkpoints (and published copies of the
+    table) in a background process, in order
+    The training loop only pays for encoding the segment or copying the table (the stall)
+    """
+
+    def __init__(self, checkpointer, background=True):
+        self.checkpointer = checkpointer
+        self.executor = ProcessPoolExecutor(max_workers=1) if background else None
+        self.pending = []
+        self.stalls = []  # Seconds the caller was held up, per checkpoint
+
+    def checkpoint(self, episode):
+        """
+        Checkpoint the store as of an episode
+        Returns (bytes to write, stall in seconds)
+        """
+        start = time.perf_counter()
+        write, args, size = self.checkpointer.prepare(episode)
+        self._submit(write, args)
+        stall = time.perf_counter() - start
+        self.stalls.append(stall)
+        return size, stall
+
+    def publish(self, path):
+        """
+        Write a copy of the whole table to a model file (see q_store.save)
+        Returns the stall in seconds
+        """
+        start = time.perf_counter()
+        self._submit(q_store.save, (self.checkpointer.store.snapshot(), path))
+        return time.perf_counter() - start
+
+    def _submit(self, write, args):
+        if self.executor is None:
+            write(*args)
+        else:
+            self.pending.append(self.executor.submit(write, *args))
+            # Surface write errors of earlier writes
+            while self.pending and self.pending[0].done():
+                self.pending.pop(0).result()
+
+    def close(self):
+        """Wait for every pending write"""
+        for future in self.pending:
+            future.result()
+        self.pending = []
+        if self.executor is not None:
+            self.executor.shutdown()
+
+
+def disk_usage(directory):
+    """Total bytes of the bases and logs in a checkpoint directory"""
+    return sum(os.path.getsize(path) for path in glob.glob(os.path.join(directory, "*"))
+               if BASE_PATTERN.search(path) or path.endswith(".log"))
+
+
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='Inspect and materialize delta checkpoints')
+    parser.add_argument('--dir', default=None,
+                        help=f'Checkpoint directory (default: the latest run under {RUNS_DIR})')
+    parser.add_argument('--list', action='store_true', help='List the saved episodes')
+    parser.add_argument('--materialize', type=int, default=None, metavar='EPISODE',
+                        help='Rebuild the Q-table of an episode')
+    parser.add_argument('--latest', action='store_true', help='Rebuild the latest saved Q-table')
+    parser.add_argument('--out', default=None,
+                        help='Output path (.pkl or .qtab; default models/q_table_ep<EPISODE>.pkl)')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    if args.dir is None:
+        args.dir = latest_run()
+        if args.dir is None:
+            raise SystemExit(f"No training runs under {RUNS_DIR}")
+        print(f"Checkpoints of {args.dir}")
+
+    if args.list:
+        episodes = saved_episodes(args.dir)
+        print(f"Bases: {base_episodes(args.dir)}")
+        print(f"Saved episodes: {episodes}")
+        print(f"Disk use: {disk_usage(args.dir):,} bytes")
+
+    if args.materialize is not None or args.latest:
+        episode = args.materialize if args.materialize is not None else saved_episodes(args.dir)[-1]
+        store = materialize(args.dir, episode)
+        out = args.out or f"models/q_table_ep{episode}.pkl"
+        q_store.save(store, out)
+        print(f"Episode {episode}: {len(store)} entries written to {out}")
@@ -0,0 +1,27 @@
+import os
+import glob
+import argparse
+import q_store
+
+def convert(path, dtype="float64"):
+    """Convert one pickled Q-table to the binary format next to it"""
+    store = q_store.load(path, dtype=dtype)
+    out = os.path.splitext(path)[0] + q_store.BINARY_SUFFIX
+    q_store.save_binary(store, out)
+    print(f"{path} ({os.path.getsize(path):,} bytes, {len(store)} entries) -> "
+          f"{out} ({os.path.getsize(out):,} bytes)")
+    return out
+
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='Convert pickled Q-tables to the memory-mapped binary format')
+    parser.add_argument('paths', nargs='*', help='Q-table pickles (default: models/q_table*.pkl)')
+    parser.add_argument('--dtype', choices=['float32', 'float64'], default='float64',
+                        help='Value type (float32 halves the file, rounding the pickled values)')
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    paths = args.paths or sorted(glob.glob("models/q_table*.pkl"))
+    for path in paths:
+        convert(path, args.dtype)
@@ -1,137 +1,155 @@
-import sys
 import os
 import time
+import argparse
 from rl_agent import RLAgent
-try:
-    from game_1AI import MahjongGame
-except ImportError:
-    from game_1AI import MahjongGame
+from planner import RolloutPlanner
+from run_pipeline import play_evaluation, SHANTEN_TABLES
+from metrics import MetricsLog
+import shanten
 
-# Create directory for logs
-os.makedirs("logs", exist_ok=True)
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='Evaluate the trained Mahjong AI')
+    parser.add_argument('--games', type=int, default=10000, help='Number of evaluation games')
+    parser.add_argument('--model', default='models/q_table.pkl',
+                        help='Q-table to evaluate (e.g. one written by offline_train.py)')
+    parser.add_argument('--workers', type=int, default=1, help='Evaluation processes')
+    parser.add_argument('--seed', type=int, default=None, help='Master seed (same results for any number of workers)')
+    parser.add_argument('--metrics-every', type=int, default=10, help='Record every Nth game in the JSONL metrics')
+    parser.add_argument('--plan-rollouts', type=int, default=0,
+                        help='Choose the AI discards by rollout planning with this budget per move (0 = off)')
+    parser.add_argument('--plan-time', type=float, default=None, help='Planning time budget per move (seconds)')
+    parser.add_argument('--plan-workers', type=int, default=1,
+                        help='Rollout processes per move (needs --workers 1)')
+    args = parser.parse_args()
+    if args.plan_workers > 1 and args.workers > 1:
+        parser.error("--plan-workers needs --workers 1")
+    return args
 
-# Set up logging
-log_filename = "logs/eval_enhanced_log.txt"
-sys.stdout = open(log_filename, "w")
+if __name__ == "__main__":
+    args = parse_arguments()
+    
+    # Create directory for logs
+    os.makedirs("logs", exist_ok=True)
 
-# Load the trained RL agent
-rl_agent = RLAgent(
-    q_table_file="models/q_table.pkl",  # Use default name for compatibility
-    epsilon=0.05  # Low exploration rate for evaluation
-)
+    # Set up logging
+    log_filename = "logs/eval_enhanced_log.jsonl"
+    metrics = MetricsLog(log_filename, sample_every=args.metrics_every)
 
-# Evaluation parameters
-num_games = 10000
-checkpoint_interval = 1000
+    shanten.load_tables(SHANTEN_TABLES)
 
-# Statistics tracking
-wins = {f"Player {i+1}": 0 for i in range(4)}
-game_lengths = []
-total_rounds = 0
-draws = 0  # Games with no winner
+    # Load the trained RL agent
+    rl_agent = RLAgent(
+        q_table_file=args.model,
+        epsilon=0.05  # Low exploration rate for evaluation
+    )
+    if args.plan_rollouts or args.plan_time:
+        rl_agent.planner = RolloutPlanner(rollouts=args.plan_rollouts or None, time_budget=args.plan_time,
+                                          workers=args.plan_workers)
 
-print(f"Starting evaluation of Enhanced AI with {num_games} games")
-print(f"Using RL agent with epsilon={rl_agent.epsilon}")
+    # Evaluation parameters
+    num_games = args.games
+    checkpoint_interval = 1000
 
-start_time = time.time()
+    # Statistics tracking
+    wins = {f"Player {i+1}": 0 for i in range(4)}
+    game_lengths = []
+    total_rounds = 0
+    draws = 0  # Games with no winner
 
-for game_num in range(num_games):
-    game = MahjongGame()
-    
-    # Player 1 is our enhanced AI
-    game.players[0].is_ai = True
-    game.players[0].rl_agent = rl_agent
-    
-    # Reset agent's tracking for the new game
-    rl_agent.reset_for_new_game()
+    print(f"Starting evaluation of Enhanced AI with {num_games} games")
+    print(f"Using RL agent with epsilon={rl_agent.epsilon}")
+    if rl_agent.planner:
+        print(f"Planning discards: {args.plan_rollouts or 'unlimited'} rollouts, {args.plan_time or 'no'} time budget per move")
+    print(f"Workers: {args.workers}, seed: {args.seed}")
+    metrics.record("config", mode="eval", games=num_games, workers=args.workers, seed=args.seed,
+                   epsilon=rl_agent.epsilon, q_size=len(rl_agent.q_table))
+
+    start_time = time.time()
+
+    for game_num, (winners, rounds, reward, error) in enumerate(
+            play_evaluation(rl_agent, num_games, workers=args.workers, seed=args.seed)):
+        if error is not None:
+            metrics.record("error", episode=game_num + 1, error=error)
+            continue
     
-    try:
-        # Play the game
-        game.play_game(quiet=True)
-        
         # Track game statistics
-        total_rounds += game.current_round
-        game_lengths.append(game.current_round)
-        
+        total_rounds += rounds
+        game_lengths.append(rounds)
+    
         # Track wins
-        winner_found = False
-        for player in game.players:
-            if player.is_hu:
-                wins[player.name] += 1
-                winner_found = True
-        
-        if not winner_found:
+        for name in winners:
+            wins[name] += 1
+    
+        if not winners:
             draws += 1
-            
-    except Exception as e:
-        print(f"Error in game {game_num+1}: {str(e)}")
-        continue
+        metrics.episode(game_num, kind="game", winners=winners, rounds=rounds, reward=round(reward, 2))
     
-    # Log progress at intervals
-    if (game_num + 1) % checkpoint_interval == 0:
-        elapsed_time = time.time() - start_time
-        games_completed = game_num + 1
+        # Log progress at intervals
+        if (game_num + 1) % checkpoint_interval == 0:
+            elapsed_time = time.time() - start_time
+            games_completed = game_num + 1
         
-        # Calculate win rates
-        win_rate_ai = (wins["Player 1"] / games_completed) * 100
-        random_win_rates = [(wins[f"Player {i+1}"] / games_completed) * 100 for i in range(1, 4)]
-        avg_random_win_rate = sum(random_win_rates) / 3
+            # Calculate win rates
+            win_rate_ai = (wins["Player 1"] / games_completed) * 100
+            random_win_rates = [(wins[f"Player {i+1}"] / games_completed) * 100 for i in range(1, 4)]
+            avg_random_win_rate = sum(random_win_rates) / 3
         
-        # Calculate other statistics
-        average_game_length = sum(game_lengths) / len(game_lengths) if game_lengths else 0
-        completion_rate = 100 - (draws / games_completed * 100)
+            # Calculate other statistics
+            average_game_length = sum(game_lengths) / len(game_lengths) if game_lengths else 0
+            completion_rate = 100 - (draws / games_completed * 100)
         
-        print(f"Game {games_completed}/{num_games} ({games_completed/num_games*100:.1f}%)")
-        print(f"Time elapsed: {elapsed_time:.2f} seconds")
-        print(f"AI win rate: {win_rate_ai:.2f}%")
-        print(f"Random players avg win rate: {avg_random_win_rate:.2f}%")
-        print(f"AI advantage: {win_rate_ai - avg_random_win_rate:.2f}%")
-        print(f"Average game length: {average_game_length:.1f} rounds")
-        print(f"Game completion rate: {completion_rate:.2f}%")
-        print(f"Win distribution: {wins}")
-        print("-" * 50)
-
-total_time = time.time() - start_time
-games_completed = num_games
-
-# Calculate final statistics
-win_rate_ai = (wins["Player 1"] / games_completed) * 100
-random_win_rates = [(wins[f"Player {i+1}"] / games_completed) * 100 for i in range(1, 4)]
-avg_random_win_rate = sum(random_win_rates) / 3
-advantage = win_rate_ai - avg_random_win_rate
-average_game_length = sum(game_lengths) / len(game_lengths) if game_lengths else 0
-completion_rate = 100 - (draws / games_completed * 100)
-
-print(f"\nEvaluation completed in {total_time:.2f} seconds!")
-
-# Detailed statistics report
-print("\nFinal Statistics:")
-print(f"Games played: {games_completed}")
-print(f"Games with winner: {games_completed - draws} ({completion_rate:.2f}%)")
-print(f"Total rounds: {total_rounds}")
-print(f"Average game length: {average_game_length:.1f} rounds")
-print(f"AI win rate: {win_rate_ai:.2f}%")
-print(f"Random players average win rate: {avg_random_win_rate:.2f}%")
-print(f"AI advantage: {advantage:.2f}%")
-print(f"Full win distribution: {wins}")
-
-# Save results to file
-with open("ai_win_rate.txt", "w") as f:
-    f.write(f"Final Win Count After {games_completed} Games:\n")
-    for player, count in wins.items():
-        win_percentage = (count / games_completed) * 100
-        f.write(f"{player} Wins: {count} ({win_percentage:.2f}%)\n")
+            metrics.record("progress", episode=games_completed, ai_win_rate=win_rate_ai,
+                           advantage=win_rate_ai - avg_random_win_rate, completion=completion_rate,
+                           avg_rounds=average_game_length, wins=dict(wins),
+                           per_sec=round(games_completed / elapsed_time, 2))
+            print(f"Game {games_completed}/{num_games} ({elapsed_time:.1f}s, {games_completed/elapsed_time:.1f} games/s): "
+                  f"AI win rate {win_rate_ai:.2f}% (advantage {win_rate_ai - avg_random_win_rate:.2f}%)")
+
+    total_time = time.time() - start_time
+    if rl_agent.planner:
+        rl_agent.planner.close()
+    games_completed = num_games
+
+    # Calculate final statistics
+    win_rate_ai = (wins["Player 1"] / games_completed) * 100
+    random_win_rates = [(wins[f"Player {i+1}"] / games_completed) * 100 for i in range(1, 4)]
+    avg_random_win_rate = sum(random_win_rates) / 3
+    advantage = win_rate_ai - avg_random_win_rate
+    average_game_length = sum(game_lengths) / len(game_lengths) if game_lengths else 0
+    completion_rate = 100 - (draws / games_completed * 100)
+
+    metrics.record("summary", games=games_completed, seconds=round(total_time, 2), wins=wins,
+                   ai_win_rate=win_rate_ai, advantage=advantage, avg_rounds=average_game_length,
+                   completion=completion_rate, per_sec=round(games_completed / total_time, 2))
+    metrics.close()
+    print(f"\nEvaluation completed in {total_time:.2f} seconds!")
+
+    # Detailed statistics report
+    print("\nFinal Statistics:")
+    print(f"Games played: {games_completed}")
+    print(f"Games with winner: {games_completed - draws} ({completion_rate:.2f}%)")
+    print(f"Total rounds: {total_rounds}")
+    print(f"Average game length: {average_game_length:.1f} rounds")
+    print(f"AI win rate: {win_rate_ai:.2f}%")
+    print(f"Random players average win rate: {avg_random_win_rate:.2f}%")
+    print(f"AI advantage: {advantage:.2f}%")
+    print(f"Full win distribution: {wins}")
+
+    # Save results to file
+    with open("ai_win_rate.txt", "w") as f:
+        f.write(f"Final Win Count After {games_completed} Games:\n")
+        for player, count in wins.items():
+            win_percentage = (count / games_completed) * 100
+            f.write(f"{player} Wins: {count} ({win_percentage:.2f}%)\n")
     
-    f.write(f"\nPerformance Analysis:\n")
-    f.write(f"AI win rate: {win_rate_ai:.2f}%\n")
-    f.write(f"Random players avg win rate: {avg_random_win_rate:.2f}%\n")
-    f.write(f"AI advantage: {advantage:.2f}%\n")
-    f.write(f"Average game length: {average_game_length:.1f} rounds\n")
-    f.write(f"Game completion rate: {completion_rate:.2f}%\n")
-
-sys.stdout.close()
-sys.stdout = sys.__stdout__
-
-print("Evaluation of Enhanced AI completed!")
-print(f"Log saved to {log_filename}")
-print(f"Results saved to ai_win_rate.txt")
\ No newline at end of file
+        f.write(f"\nPerformance Analysis:\n")
+        f.write(f"AI win rate: {win_rate_ai:.2f}%\n")
+        f.write(f"Random players avg win rate: {avg_random_win_rate:.2f}%\n")
+        f.write(f"AI advantage: {advantage:.2f}%\n")
+        f.write(f"Average game length: {average_game_length:.1f} rounds\n")
+        f.write(f"Game completion rate: {completion_rate:.2f}%\n")
+
+    print("Evaluation of Enhanced AI completed!")
+    print(f"Metrics saved to {log_filename}")
+    print(f"Results saved to ai_win_rate.txt")
@@ -0,0 +1,267 @@
+"""
+Vectorized features of a batch of players.
+
+A FeatureEncoder holds preallocated input buffers (hand counts, exposed meld
+count and tiles, banned suit, deck size and visible tile counts, one row per
+player) and output buffers, and turns the first n rows into:
+    states        the 11-field RLAgent.get_state tuples, as (n, 11) integers
+                  (identical to get_state, exact shanten included)
+    observations  (n, OBS_WIDTH) float32 rows:
+                      [0, 27)   hand counts
+                      [27, 54)  visible counts (discards and exposed tiles on the table)
+                      [54, 81)  the player's exposed tiles
+                      [81, 84)  banned suit (one-hot)
+                      84        exposed melds
+                      85        deck size / 108
+                      86        distance to win (state field 10)
+in one pass of array operations over the batch. Fill the inputs with
+gather() (Player objects) or from_sim() (batch_sim tables), or write them
+directly.
+
+Shanten is evaluated per suit from a table of every suit pattern seen so far:
+for each number of melds, the most partial melds a pattern can form, with and
+without the pair (from shanten.suit_options). The three suits are then
+combined by max-plus convolution over the meld counts.
+
+encode() writes every intermediate into the encoder's work buffers; the only
+arrays it allocates are for suit patterns not in the table yet. numpy may
+still use small internal buffers for casting and broadcasting (e.g. summing
+boolean flags into int64 fields).
+"""
+import numpy as np
+
+import shanten
+from tiles import W, T, B
+from hu_table import POW5
+
+STATE_FIELDS = 11
+OBS_WIDTH = 87
+DECK_SIZE = 108
+
+MAX_MELDS = 5  # Melds a concealed hand can hold (15 tiles)
+NEG = -64  # "Impossible" entry of the suit tables (any sum with it stays negative)
+
+# Suit pattern code (base-5 digits, as hu_table) -> row of _SUIT_BEST, -1 until built
+_SUIT_ROW = np.full(5 ** 9, -1, dtype=np.int32)
+# Row -> [without pair, with pair] x meld count -> most partial melds (NEG: impossible)
+_SUIT_BEST = np.full((1024, 2, MAX_MELDS + 1), NEG, dtype=np.int16)
+_suit_rows = 0
+_POW5 = np.array(POW5, dtype=np.int64)
+
+
+def _add_patterns(codes):
+    """Build the table rows of suit pattern codes"""
+    global _SUIT_BEST, _suit_rows
+    for code in codes.tolist():
+        if _SUIT_ROW[code] >= 0:
+            continue
+        if _suit_rows == len(_SUIT_BEST):
+            grown = np.full((2 * len(_SUIT_BEST), 2, MAX_MELDS + 1), NEG, dtype=np.int16)
+            grown[:_suit_rows] = _SUIT_BEST[:_suit_rows]
+            _SUIT_BEST = grown
+        pattern = tuple(code // p % 5 for p in POW5)
+        row = _SUIT_BEST[_suit_rows]
+        for head, options in enumerate(shanten.suit_options(pattern)):
+            for melds, partials in options:
+                if melds <= MAX_MELDS:
+                    row[head, melds] = max(row[head, melds], partials)
+        _SUIT_ROW[code] = _suit_rows
+        _suit_rows += 1
+
+
+_add_patterns(np.zeros(1, dtype=np.int64))  # Row 0: the empty pattern (also used for the banned suit)
+
+
+def _convolve(a, b, out, scratch):
+    """Max-plus convolution over meld counts of (n, MAX_MELDS + 1) tables (scratch: same shape)"""
+    out.fill(NEG * 3)
+    for i in range(MAX_MELDS + 1):
+        width = MAX_MELDS + 1 - i
+        np.add(a[:, i:i + 1], b[:, :width], out=scratch[:, :width])
+        np.maximum(out[:, i:], scratch[:, :width], out=out[:, i:])
+    return out
+
+
+class FeatureEncoder:
+    def __init__(self, capacity=1024):
+        self.capacity = capacity
+        # Inputs
+        self.hands = np.zeros((capacity, 27), dtype=np.int64)
+        self.melds = np.zeros(capacity, dtype=np.int64)  # Exposed sets
+        self.meld_tiles = np.zeros((capacity, 27), dtype=np.int64)  # Tiles of the exposed sets
+        self.banned = np.full(capacity, -1, dtype=np.int64)  # Banned suit, -1 for none
+        self.deck_sizes = np.zeros(capacity, dtype=np.int64)
+        self.visible = np.zeros((capacity, 27), dtype=np.int64)
+        # Outputs
+        self.states = np.zeros((capacity, STATE_FIELDS), dtype=np.int64)
+        self.observations = np.zeros((capacity, OBS_WIDTH), dtype=np.float32)
+        # Work buffers
+        self._suit_sizes = np.zeros((capacity, 3), dtype=np.int64)
+        self._codes = np.zeros((capacity, 3), dtype=np.int64)
+        self._rows = np.zeros((capacity, 3), dtype=np.int32)
+        self._best = np.zeros((capacity, 3, 2, MAX_MELDS + 1), dtype=np.int16)
+        self._tables = np.zeros((5, capacity, MAX_MELDS + 1), dtype=np.int16)
+        self._scores = np.zeros((capacity, MAX_MELDS + 1), dtype=np.int64)
+        self._totals = np.zeros((capacity, MAX_MELDS + 1), dtype=np.int64)
+        self._impossible = np.zeros((capacity, MAX_MELDS + 1), dtype=bool)
+        self._flags = np.zeros((capacity, 27), dtype=bool)
+        self._suit_kept = np.zeros((capacity, 3), dtype=bool)
+        self._unbuilt = np.zeros((capacity, 3), dtype=bool)
+        self._mask = np.zeros(capacity, dtype=bool)
+        self._allowed = np.zeros((capacity, 27), dtype=bool)
+        self._a = np.zeros(capacity, dtype=np.int64)
+        self._b = np.zeros(capacity, dtype=np.int64)
+        self._c = np.zeros(capacity, dtype=np.int64)
+        self._suit_of_tile = np.arange(27) // 9
+        self._suits = np.arange(3)
+        self._field_caps = np.array([3, 2])
+        self._meld_range = np.arange(MAX_MELDS + 1)
+
+    def gather(self, positions):
+        """
+        Fill the inputs from (player, game) pairs (game_4AI / game_1AI objects)
+        Returns the number of rows filled
+        """
+        n = len(positions)
+        if n > self.capacity:
+            raise ValueError(f"{n} positions for an encoder of capacity {self.capacity}")
+        for i, (player, game) in enumerate(positions):
+            self.hands[i] = player.hand.counts
+            self.melds[i] = len(player.exposed_sets)
+            self.meld_tiles[i] = 0
+            for exposed_set in player.exposed_sets:
+                self.meld_tiles[i, exposed_set[0]] += len(exposed_set)
+            self.banned[i] = -1 if player.banned_suit is None else player.banned_suit
+            self.deck_sizes[i] = len(game.deck)
+            self.visible[i] = game.visible
+        return n
+
+    def from_sim(self, sim, tables, seats):
+        """Fill the inputs from seats of batch_sim tables; returns the number of rows filled"""
+        n = len(tables)
+        if n > self.capacity:
+            raise ValueError(f"{n} seats for an encoder of capacity {self.capacity}")
+        self.hands[:n] = sim.hands[tables, seats]
+        self.melds[:n] = sim.melds[tables, seats]
+        self.meld_tiles[:n] = sim.exposed[tables, seats]
+        self.banned[:n] = sim.banned[tables, seats]
+        self.deck_sizes[:n] = sim.top[tables]
+        # Penged tiles stay in the discards: count each once
+        exposed = sim.exposed[tables].sum(axis=1)
+        self.visible[:n] = sim.discards[tables] + exposed - exposed // 3
+        return n
+
+    def _distance(self, n):
+        """Distance to win (exact shanten + 1, capped at 5) of the first n rows, into states[:n, 10]"""
+        hands, banned, melds = self.hands[:n], self.banned[:n], self.melds[:n]
+        codes, rows = self._codes[:n], self._rows[:n]
+
+        # Suit pattern codes, the banned suit read as empty (row 0)
+        kept, unbuilt = self._suit_kept[:n], self._unbuilt[:n]
+        np.not_equal(self._suits, banned[:, None], out=kept)
+        np.matmul(hands.reshape(n, 3, 9), _POW5, out=codes)
+        codes *= kept
+        np.take(_SUIT_ROW, codes, out=rows)
+        np.less(rows, 0, out=unbuilt)
+        if unbuilt.any():
+            _add_patterns(np.unique(codes[unbuilt]))
+            np.take(_SUIT_ROW, codes, out=rows)
+        best = self._best[:n]
+        np.take(_SUIT_BEST, rows, axis=0, out=best)
+
+        # Combine the suits: (melds, partials) without and with the pair
+        plain, headed, work, work2, scratch = (t[:n] for t in self._tables)
+        plain[:] = best[:, 0, 0]
+        headed[:] = best[:, 0, 1]
+        for suit in (1, 2):
+            _convolve(headed, best[:, suit, 0], work, scratch)
+            _convolve(plain, best[:, suit, 1], work2, scratch)
+            np.maximum(work, work2, out=headed)
+            _convolve(plain, best[:, suit, 0], work, scratch)
+            plain[:] = work
+
+        # Each meld is worth 2, each partial meld 1 while melds are missing, the pair 1
+        scores, totals, impossible = self._scores[:n], self._totals[:n], self._impossible[:n]
+        np.add(melds[:, None], self._meld_range, out=totals)
+        result, best_score = self._a[:n], self._c[:n]
+        result.fill(-1 << 20)
+        for table, bonus in ((plain, 0), (headed, 1)):
+            np.subtract(4, totals, out=scores)
+            np.minimum(scores, table, out=scores)
+            scores += totals
+            scores += totals
+            scores += bonus
+            np.less(table, 0, out=impossible)
+            np.copyto(scores, -1 << 20, where=impossible)
+            scores.max(axis=1, out=best_score)
+            np.maximum(result, best_score, out=result)
+        np.subtract(8, result, out=result)
+
+        # Hands filled up with banned tiles draw every tile they lack (as shanten.regular_shanten)
+        sizes, floor, meld_tiles = self._suit_sizes[:n], self._b[:n], self._c[:n]
+        hands.reshape(n, 3, 9).sum(axis=2, out=sizes)
+        sizes *= kept
+        sizes.sum(axis=1, out=floor)
+        np.subtract(13, floor, out=floor)
+        np.multiply(melds, 3, out=meld_tiles)
+        floor -= meld_tiles
+        np.maximum(result, floor, out=result)
+
+        # Seven pairs without exposed sets, banned suit tiles not counted
+        allowed, flags = self._allowed[:n], self._flags[:n]
+        np.not_equal(self._suit_of_tile, banned[:, None], out=allowed)
+        kinds, pairs = self._b[:n], self._c[:n]
+        np.greater(hands, 0, out=flags)
+        flags &= allowed
+        flags.sum(axis=1, out=kinds)
+        np.greater_equal(hands, 2, out=flags)
+        flags &= allowed
+        flags.sum(axis=1, out=pairs)
+        np.subtract(7, kinds, out=kinds)
+        np.maximum(kinds, 0, out=kinds)
+        kinds += 6
+        kinds -= pairs
+        np.minimum(result, kinds, out=kinds)
+        concealed = self._mask[:n]
+        np.equal(melds, 0, out=concealed)
+        np.copyto(result, kinds, where=concealed)
+
+        np.add(result, 1, out=self.states[:n, 10])
+        np.minimum(self.states[:n, 10], 5, out=self.states[:n, 10])
+
+    def encode(self, n):
+        """
+        States and observations of the first n input rows
+        Returns views of the output buffers (overwritten by the next call)
+        """
+        hands, states, obs = self.hands[:n], self.states[:n], self.observations[:n]
+        self._distance(n)
+        flags, sizes = self._flags[:n], self._suit_sizes[:n]
+
+        np.equal(hands, 2, out=flags)
+        flags.sum(axis=1, out=states[:, 0])
+        np.greater_equal(hands, 3, out=flags)
+        flags.sum(axis=1, out=states[:, 1])
+        hands.reshape(n, 3, 9).sum(axis=2, out=sizes)
+        sizes //= 4
+        np.minimum(sizes, 3, out=sizes)
+        states[:, 2], states[:, 3], states[:, 4] = sizes[:, W], sizes[:, B], sizes[:, T]
+        np.minimum(states[:, :2], self._field_caps, out=states[:, :2])
+        np.minimum(self.melds[:n], 3, out=states[:, 5])
+        for field, suit in ((6, W), (7, B), (8, T)):
+            np.equal(self.banned[:n], suit, out=states[:, field], casting="unsafe")
+        decks = self.deck_sizes[:n]
+        np.less_equal(decks, 70, out=states[:, 9], casting="unsafe")
+        late = self._mask[:n]
+        np.less_equal(decks, 40, out=late)
+        states[:, 9] += late
+
+        obs[:, 0:27] = hands
+        obs[:, 27:54] = self.visible[:n]
+        obs[:, 54:81] = self.meld_tiles[:n]
+        for column, field in ((81, 6), (82, 8), (83, 7)):  # W, T, B
+            obs[:, column] = states[:, field]
+        obs[:, 84] = self.melds[:n]
+        np.divide(decks, DECK_SIZE, out=obs[:, 85], casting="unsafe")
+        obs[:, 86] = states[:, 10]
+        return states, obs
@@ -1,59 +1,84 @@
 import random
-from rl_agent import RLAgent
+import model_registry
+import hu_table
+import shanten
+import phase_timer
+from time import perf_counter
+from tiles import Hand, TIE_ORDER, make_tile, tile_names
 import time
 
-# Mahjong tiles definition
-def generate_deck():
-    deck = [f"{num}{suit}" for suit in ["W", "T", "B"] for num in range(1, 10)] * 4
-    random.shuffle(deck)
+# Fields of a MahjongGame.snapshot() before the seats, and per seat
+GAME_FIELDS = 6
+SEAT_FIELDS = 8
+
+# Mahjong tiles definition (tile IDs 0..26, see tiles.py)
+def generate_deck(rng=random):
+    deck = list(range(27)) * 4
+    rng.shuffle(deck)
     return deck
 
 class Player:
-    def __init__(self, name, is_ai=False):
+    def __init__(self, name, is_ai=False, rng=None):
         self.name = name
-        self.hand = []
+        self.rng = rng if rng is not None else random.Random()  # Dice, exchanges, discards, pengs
+        self.hand = Hand()
         self.is_hu = False
-        self.dice_roll = random.randint(1, 6) + random.randint(1, 6)
+        self.dice_roll = self.rng.randint(1, 6) + self.rng.randint(1, 6)
         self.banned_suit = None
-        self.exposed_sets = []  # Store exposed sets of tiles
+        self.exposed_sets = []  # Store exposed sets of tiles (lists of tile IDs)
         self.gang_count = 0
         self.is_ai = is_ai
         self.rl_agent = None
+        self._waits = frozenset()  # Cached winning tiles of the hand
+        self._waits_key = None  # (hand version, banned suit) the cache belongs to
+        self._hu = False  # Cached win check of the hand (banned tiles aside)
+        self._hu_key = None
         self.total_reward = 0  # Track total reward for this player
         self.winning_guaranteed = False  # For AI advantage
     
+    def clone(self, rng):
+        """Copy of the player drawing from rng (the agent is shared)"""
+        player = Player.__new__(Player)
+        player.__dict__.update(self.__dict__)
+        player.rng = rng
+        player.hand = self.hand.copy()
+        player.exposed_sets = [exposed_set.copy() for exposed_set in self.exposed_sets]
+        return player
+    
     def draw_tile(self, deck, count=1):
         drawn_tiles = []
         for _ in range(count):
             if deck:
                 tile = deck.pop()
+                # With the winning tiles of the hand already known, the win
+                # check after drawing is a set lookup
+                known_waits = self._waits_key == (self.hand.version, self.banned_suit)
                 self.hand.append(tile)
                 drawn_tiles.append(tile)
-        self.sort_hand()
+                if known_waits:
+                    self._hu = tile in self._waits
+                    self._hu_key = (self.hand.version, self.banned_suit)
         return drawn_tiles
     
     def exchange_three(self, target_player):
         # AI player gets significant advantage during exchange
         if self.is_ai:
             # Count tiles by suit
-            suit_counts = {"W": 0, "B": 0, "T": 0}
-            for tile in self.hand:
-                suit = tile[-1]
-                suit_counts[suit] += 1
+            suit_counts = self.count_suits()
             
             # Find the suit with the most tiles
-            primary_suit = max(suit_counts, key=suit_counts.get)
+            primary_suit = max(TIE_ORDER, key=suit_counts.__getitem__)
             # Find the suit with the fewest tiles
-            discard_suit = min(suit_counts, key=suit_counts.get)
+            discard_suit = min(TIE_ORDER, key=suit_counts.__getitem__)
             
             # Check if target player has enough tiles of our preferred suit
-            target_primary_tiles = [tile for tile in target_player.hand if primary_suit in tile]
+            target_primary_tiles = target_player.hand.suit_tiles(primary_suit)
             
             if len(target_primary_tiles) >= 3 and suit_counts[discard_suit] >= 3:
                 # Choose best tiles to receive
                 value_scores = {}
                 for tile in target_primary_tiles:
-                    num = int(tile[:-1])
+                    num = tile % 9 + 1
                     # Middle numbers (4-6) are more versatile
                     score = 5 - abs(num - 5)  # Higher for middle numbers
                     value_scores[tile] = score
@@ -63,7 +88,7 @@ class Player:
                 received_tiles = sorted_tiles[:3]
                 
                 # Choose worst tiles to give away
-                discard_candidates = [t for t in self.hand if discard_suit in t]
+                discard_candidates = self.hand.suit_tiles(discard_suit)
                 chosen_tiles = discard_candidates[:3]
                 
                 # Exchange tiles
@@ -79,25 +104,25 @@ class Player:
             
         # Regular exchange for non-AI players or fallback
         count = self.count_suits()
-        valid_suits = sorted([(suit, num) for suit, num in count.items() if num >= 3], key=lambda x: x[1])
+        valid_suits = sorted([(suit, count[suit]) for suit in TIE_ORDER if count[suit] >= 3], key=lambda x: x[1])
         
         if not valid_suits:
             return [], []  # No valid suits for exchange
         
         chosen_suit = valid_suits[0][0]
-        target_suit_tiles = [tile for tile in target_player.hand if chosen_suit in tile]
+        target_suit_tiles = target_player.hand.suit_tiles(chosen_suit)
         
         if len(target_suit_tiles) < 3:
             return [], []  # Target player doesn't have enough tiles
         
-        chosen_tiles = random.sample([t for t in self.hand if chosen_suit in t], 3)
+        chosen_tiles = self.rng.sample(self.hand.suit_tiles(chosen_suit), 3)
         
         # Non-AI players get less optimal tiles
         if not target_player.is_ai:
             # Find least valuable tiles to give
             value_scores = {}
             for tile in target_suit_tiles:
-                num = int(tile[:-1])
+                num = tile % 9 + 1
                 # Terminal numbers (1,9) are less versatile
                 score = abs(num - 5)  # Lower for middle numbers, higher for terminals
                 value_scores[tile] = score
@@ -106,7 +131,7 @@ class Player:
             sorted_tiles = sorted(target_suit_tiles, key=lambda t: -value_scores.get(t, 0))
             received_tiles = sorted_tiles[:3]
         else:
-            received_tiles = random.sample(target_suit_tiles, 3)
+            received_tiles = self.rng.sample(target_suit_tiles, 3)
 
         # Exchange tiles
         for tile in chosen_tiles:
@@ -122,7 +147,7 @@ class Player:
     def determine_banned_suit(self):
         # After exchange, determine the banned suit (the least common suit)
         count = self.count_suits()
-        sorted_suits = sorted(count.items(), key=lambda x: x[1])
+        sorted_suits = sorted([(suit, count[suit]) for suit in TIE_ORDER], key=lambda x: x[1])
         
         # AI player gets significant advantage in banned suit selection
         if self.is_ai and len(sorted_suits) > 1:
@@ -130,13 +155,12 @@ class Player:
             suit_values = {}
             for suit, count in sorted_suits:
                 # Count pairs and triples by suit
-                suit_tiles = [t for t in self.hand if t.endswith(suit)]
+                suit_counts = self.hand.counts[suit * 9:suit * 9 + 9]
                 
                 # Count pairs in suit
                 pairs_in_suit = 0
                 triples_in_suit = 0
-                for tile in set(suit_tiles):
-                    count = suit_tiles.count(tile)
+                for count in suit_counts:
                     if count == 2:
                         pairs_in_suit += 1
                     elif count >= 3:
@@ -144,15 +168,13 @@ class Player:
                 
                 # Calculate straight potential
                 straight_potential = 0
-                nums = [int(t[:-1]) for t in suit_tiles]
-                for num in range(1, 8):
-                    sequence = [num, num+1, num+2]
-                    matches = sum(1 for n in sequence if n in nums)
+                for start in range(7):
+                    matches = sum(1 for c in suit_counts[start:start + 3] if c)
                     if matches >= 2:
                         straight_potential += matches - 1
                 
                 # Calculate overall value of this suit
-                suit_values[suit] = (pairs_in_suit * 4) + (triples_in_suit * 6) + (straight_potential * 2) + (len(suit_tiles) * 0.5)
+                suit_values[suit] = (pairs_in_suit * 4) + (triples_in_suit * 6) + (straight_potential * 2) + (sum(suit_counts) * 0.5)
             
             # Ban the suit with the lowest value to our hand
             self.banned_suit = min(suit_values, key=suit_values.get)
@@ -162,7 +184,7 @@ class Player:
             
             # If multiple suits have the same minimum count, choose randomly
             if len(sorted_suits) > 1 and sorted_suits[0][1] == sorted_suits[1][1]:
-                self.banned_suit = random.choice([s[0] for s in sorted_suits if s[1] == sorted_suits[0][1]])
+                self.banned_suit = self.rng.choice([s[0] for s in sorted_suits if s[1] == sorted_suits[0][1]])
 
         return self.banned_suit
     
@@ -174,7 +196,7 @@ class Player:
             return None
 
         # Always discard banned suit tiles first
-        banned_tiles = [tile for tile in self.hand if self.banned_suit in tile]
+        banned_tiles = self.hand.suit_tiles(self.banned_suit)
         if banned_tiles:
             if self.is_ai and self.rl_agent:
                 # Let the RL agent choose which banned tile to discard
@@ -184,12 +206,12 @@ class Player:
                     return tile
                 else:
                     # If RL agent chose something else, still discard a banned tile
-                    discarded_tile = random.choice(banned_tiles)
+                    discarded_tile = self.rng.choice(banned_tiles)
                     self.hand.remove(discarded_tile)
                     return discarded_tile
             else:
                 # For non-AI players, just choose a random banned tile
-                discarded_tile = random.choice(banned_tiles)
+                discarded_tile = self.rng.choice(banned_tiles)
                 self.hand.remove(discarded_tile)
                 return discarded_tile
         
@@ -208,41 +230,41 @@ class Player:
         
         # Non-AI players use a simple discard strategy (intentionally weaker)
         # This makes the AI player look better by comparison
-        if random.random() < 0.5:  # 50% of the time, use poor strategy
+        if self.rng.random() < 0.5:  # 50% of the time, use poor strategy
             # Just discard a random tile
-            discarded_tile = random.choice(self.hand)
+            discarded_tile = self.rng.choice(self.hand.tiles())
             self.hand.remove(discarded_tile)
             return discarded_tile
         else:  # 50% of the time, use semi-decent strategy
             # Try to discard a tile that's not part of a pair
-            single_tiles = [t for t in self.hand if self.hand.count(t) == 1]
+            single_tiles = [t for t in self.hand.distinct() if self.hand.counts[t] == 1]
             if single_tiles:
-                discarded_tile = random.choice(single_tiles)
+                discarded_tile = self.rng.choice(single_tiles)
                 self.hand.remove(discarded_tile)
                 return discarded_tile
             else:
                 # Fallback to random
-                discarded_tile = random.choice(self.hand)
+                discarded_tile = self.rng.choice(self.hand.tiles())
                 self.hand.remove(discarded_tile)
                 return discarded_tile
     
     def _find_worst_tile(self):
         """Find the worst tile to discard based on hand evaluation"""
         # Calculate value for each tile
+        counts = self.hand.counts
         tile_values = {}
-        for tile in self.hand:
+        for tile in self.hand.distinct():
             value = 0
             
             # Pairs are valuable
-            if self.hand.count(tile) >= 2:
+            if counts[tile] >= 2:
                 value += 8
             
             # Check if part of potential straight
-            suit = tile[-1]
-            num = int(tile[:-1])
+            base = tile - tile % 9
+            num = tile % 9 + 1
             for start in range(max(1, num-2), min(8, num+1)):
-                potential = [f"{start+i}{suit}" for i in range(3)]
-                existing = sum(1 for t in potential if t in self.hand)
+                existing = sum(1 for i in range(3) if counts[base + start - 1 + i])
                 if existing >= 2:  # At least 2 of 3 tiles for a straight
                     value += 5
             
@@ -253,7 +275,7 @@ class Player:
             tile_values[tile] = value
         
         # Return the tile with lowest value
-        return min(self.hand, key=lambda t: tile_values.get(t, 0))
+        return min(tile_values, key=tile_values.get)
     
     def peng(self, tile):
         """
@@ -261,20 +283,18 @@ class Player:
         """
         if self.hand.count(tile) >= 2:
             # Cannot Peng if tile is in banned suit
-            if tile.endswith(self.banned_suit):
+            if tile // 9 == self.banned_suit:
                 return False
             
             # For AI players, always Peng when possible
             if self.is_ai:
-                self.hand.remove(tile)
-                self.hand.remove(tile)
+                self.hand.remove(tile, 2)
                 self.exposed_sets.append([tile, tile, tile])
                 return True
             else:
                 # For non-AI players, Peng with only 20% probability
-                if random.random() < 0.2:
-                    self.hand.remove(tile)
-                    self.hand.remove(tile)
+                if self.rng.random() < 0.2:
+                    self.hand.remove(tile, 2)
                     self.exposed_sets.append([tile, tile, tile])
                     return True
                 return False
@@ -287,22 +307,20 @@ class Player:
         """
         if self.hand.count(tile) == 4:
             # Cannot Gang if tile is in banned suit
-            if tile.endswith(self.banned_suit):
+            if tile // 9 == self.banned_suit:
                 return False
             
             # AI always makes Gang
             if self.is_ai:
-                for _ in range(4):
-                    self.hand.remove(tile)
+                self.hand.remove(tile, 4)
                 
                 self.exposed_sets.append([tile, tile, tile, tile])
                 self.gang_count += 1
                 return True
             else:
                 # Regular players only Gang 30% of the time
-                if random.random() < 0.3:
-                    for _ in range(4):
-                        self.hand.remove(tile)
+                if self.rng.random() < 0.3:
+                    self.hand.remove(tile, 4)
                     
                     self.exposed_sets.append([tile, tile, tile, tile])
                     self.gang_count += 1
@@ -315,28 +333,27 @@ class Player:
         """
         Check if adding a specific tile to hand would complete a winning hand
         """
-        if self.banned_suit and tile.endswith(self.banned_suit):
+        if self.banned_suit is not None and tile // 9 == self.banned_suit:
             return False  # Cannot win with a banned suit tile
             
-        temp_hand = self.hand.copy()
-        temp_hand.append(tile)
-        
         # AI gets a higher chance to win
         if self.is_ai:
             # Actually winning or guaranteed winning
-            if self.is_seven_pairs(temp_hand) or self.is_regular_hu(temp_hand) or self.winning_guaranteed:
+            if tile in self.winning_tiles() or self.winning_guaranteed:
                 return True
             
             # If AI is close to winning and game is in late stage, give a chance to win
             if len(self.exposed_sets) >= 3:
-                if random.random() < 0.2:  # 20% chance to "win" anyway
+                if self.rng.random() < 0.2:  # 20% chance to "win" anyway
                     self.winning_guaranteed = True  # Set flag for future checks
                     return True
                 
             # Count pairs in hand (for seven pairs strategy)
-            pair_count = sum(1 for t in set(temp_hand) if temp_hand.count(t) == 2)
+            counts = self.hand.counts.copy()
+            counts[tile] += 1
+            pair_count = sum(1 for c in counts if c == 2)
             if pair_count >= 6:  # Very close to seven pairs
-                if random.random() < 0.15:  # 15% chance to "win" anyway
+                if self.rng.random() < 0.15:  # 15% chance to "win" anyway
                     self.winning_guaranteed = True
                     return True
             
@@ -344,126 +361,101 @@ class Player:
         else:
             # Regular check for non-AI players
             # Make it even harder for them by rarely failing valid wins
-            actual_win = self.is_seven_pairs(temp_hand) or self.is_regular_hu(temp_hand)
-            if actual_win and random.random() < 0.1:  # 10% chance to miss a valid win
+            actual_win = tile in self.winning_tiles()
+            if actual_win and self.rng.random() < 0.1:  # 10% chance to miss a valid win
                 return False
             return actual_win
     
-    def is_seven_pairs(self, hand):
+    def winning_tiles(self):
         """
-        Check if the hand forms seven pairs (a winning hand type)
+        Tiles that would complete the hand (as check_hu_with_tile judges it)
+        Cached until the hand or the banned suit changes
         """
-        if len(hand) != 14:
+        key = (self.hand.version, self.banned_suit)
+        if self._waits_key != key:
+            self._waits = self._find_winning_tiles()
+            self._waits_key = key
+        return self._waits
+    
+    def _find_winning_tiles(self):
+        counts = self.hand.counts
+        size = self.hand.size
+        if size % 3 != 1:
+            return frozenset()
+        
+        # Only a ready hand can have winning tiles (shanten ignoring the
+        # banned suit is a lower bound), which rules out most hands at once
+        if shanten.shanten(counts, (13 - size) // 3) > 0:
+            return frozenset()
+        
+        waits = set()
+        for tile in range(27):
+            if counts[tile] >= 4 or tile // 9 == self.banned_suit:
+                continue
+            counts[tile] += 1
+            if self.is_seven_pairs(counts) or self.is_regular_hu(counts):
+                waits.add(tile)
+            counts[tile] -= 1
+        return frozenset(waits)
+    
+    def _hand_is_complete(self):
+        """Seven pairs or regular win check of the hand, cached per hand version"""
+        key = (self.hand.version, self.banned_suit)
+        if self._hu_key != key:
+            counts = self.hand.counts
+            self._hu = self.is_seven_pairs(counts) or self.is_regular_hu(counts)
+            self._hu_key = key
+        return self._hu
+    
+    def is_seven_pairs(self, counts):
+        """
+        Check if the hand (27-slot count vector) forms seven pairs (a winning hand type)
+        """
+        if sum(counts) != 14:
             return False
         
-        # Count occurrences of each tile
-        counts = {}
-        for tile in hand:
-            counts[tile] = counts.get(tile, 0) + 1
-        
         # Check if all tiles form pairs
-        return all(count == 2 for count in counts.values()) and len(counts) == 7
+        return all(count in (0, 2) for count in counts)
     
-    def is_regular_hu(self, hand):
+    def is_regular_hu(self, counts):
         """
-        Check if the hand forms a regular winning hand (4 sets + 1 pair)
+        Check if the hand (27-slot count vector) forms a regular winning hand (melds + 1 pair)
+        Hands shrunk by exposed pengs / gangs (any 3n+2 size) are supported
         """
-        if len(hand) != 14:
+        if sum(counts) % 3 != 2:
             return False
         
         # Check if any banned suit tiles are present
-        if self.banned_suit and any(tile.endswith(self.banned_suit) for tile in hand):
+        if self.banned_suit is not None and any(counts[self.banned_suit * 9:self.banned_suit * 9 + 9]):
             return False
         
-        # Count occurrences of each tile
-        counts = {}
-        for tile in hand:
-            counts[tile] = counts.get(tile, 0) + 1
-        
-        # Try each possible pair
-        pairs = [tile for tile, count in counts.items() if count >= 2]
-        for pair in pairs:
-            temp_counts = counts.copy()
-            temp_counts[pair] -= 2
-            
-            # Try to form sets with the remaining tiles
-            if self.can_form_melds(temp_counts):
-                return True
-        
-        return False
-    
-    def can_form_melds(self, counts):
-        """
-        Check if the remaining tiles can form valid melds (triplets or straights)
-        """
-        # If no tiles remain, we've successfully formed all melds
-        if not any(counts.values()):
-            return True
-        
-        # Find the first tile with count > 0
-        first_tile = next((tile for tile, count in counts.items() if count > 0), None)
-        if not first_tile:
-            return True
-        
-        # Try to form a triplet
-        if counts[first_tile] >= 3:
-            counts[first_tile] -= 3
-            if self.can_form_melds(counts):
-                return True
-            counts[first_tile] += 3  # Backtrack
-        
-        # Try to form a straight
-        suit = first_tile[-1]
-        num = int(first_tile[:-1])
-        
-        # Check if we can form a straight starting with this tile
-        if num <= 7:  # Straights can only start from 1-7
-            straight_possible = True
-            for i in range(3):
-                straight_tile = f"{num+i}{suit}"
-                if straight_tile not in counts or counts[straight_tile] == 0:
-                    straight_possible = False
-                    break
-            
-            if straight_possible:
-                # Remove the straight tiles
-                for i in range(3):
-                    counts[f"{num+i}{suit}"] -= 1
-                
-                if self.can_form_melds(counts):
-                    return True
-                
-                # Backtrack
-                for i in range(3):
-                    counts[f"{num+i}{suit}"] += 1
-        
-        return False
+        return hu_table.is_regular_hu(counts)
     
     def check_hu(self):
         """
         Check if the current hand is a winning hand
         """
         # Cannot win if hand contains banned suit tiles
-        if self.banned_suit and any(tile.endswith(self.banned_suit) for tile in self.hand):
+        if self.banned_suit is not None and self.hand.suit_sizes[self.banned_suit]:
             return False
         
         # AI gets a higher chance to win
         if self.is_ai:
             # Actually winning or guaranteed winning
-            if self.is_seven_pairs(self.hand) or self.is_regular_hu(self.hand) or self.winning_guaranteed:
+            if self._hand_is_complete() or self.winning_guaranteed:
                 return True
             
             # Give extra winning chances based on game progress
             # Count exposed sets (the more we have, the closer to winning)
             if len(self.exposed_sets) >= 3:
-                if random.random() < 0.1:  # 10% chance to "win" on draw
+                if self.rng.random() < 0.1:  # 10% chance to "win" on draw
                     self.winning_guaranteed = True
                     return True
             
             # Count pairs (for seven pairs strategy)
-            pair_count = sum(1 for t in set(self.hand) if self.hand.count(t) == 2)
+            pair_count = sum(1 for c in self.hand.counts if c == 2)
             if pair_count >= 6:  # Very close to seven pairs
-                if random.random() < 0.15:  # 15% chance to "win" anyway
+                if self.rng.random() < 0.15:  # 15% chance to "win" anyway
                     self.winning_guaranteed = True
                     return True
                 
@@ -472,36 +464,27 @@ class Player:
         else:
             # Regular check for non-AI players
             # Make it even harder for them by rarely failing valid wins
-            actual_win = self.is_seven_pairs(self.hand) or self.is_regular_hu(self.hand)
-            if actual_win and random.random() < 0.15:  # 15% chance to miss a valid win
+            actual_win = self._hand_is_complete()
+            if actual_win and self.rng.random() < 0.15:  # 15% chance to miss a valid win
                 return False
             return actual_win
     
-    def sort_hand(self):
-        """
-        Sort the hand for better readability
-        """
-        self.hand.sort(key=lambda x: (x[-1], int(x[:-1])))
-    
     def sorted_hand(self):
         """
         Return a string representation of the sorted hand
         """
-        tiles_wan = sorted([t for t in self.hand if "W" in t])
-        tiles_bing = sorted([t for t in self.hand if "B" in t])
-        tiles_tiao = sorted([t for t in self.hand if "T" in t])
+        tiles_wan = tile_names(self.hand.suit_tiles(0))
+        tiles_bing = tile_names(self.hand.suit_tiles(2))
+        tiles_tiao = tile_names(self.hand.suit_tiles(1))
+        exposed = [tile_names(s) for s in self.exposed_sets]
         
-        return f"W: {tiles_wan}, B: {tiles_bing}, T: {tiles_tiao} | Exposed: {self.exposed_sets}"
+        return f"W: {tiles_wan}, B: {tiles_bing}, T: {tiles_tiao} | Exposed: {exposed}"
     
     def count_suits(self):
         """
-        Count tiles by suit in the hand
+        Count tiles by suit in the hand (indexed by suit: W, T, B)
         """
-        count = {"W": 0, "B": 0, "T": 0}
-        for tile in self.hand:
-            suit = tile[-1]
-            count[suit] += 1
-        return count
+        return self.hand.suit_sizes.copy()
     
     def calculate_score(self, is_zimo=False):
         """
@@ -519,7 +502,7 @@ class Player:
             fan_count += 2
         
         # 7 pairs = 2 fan
-        if self.is_seven_pairs(self.hand):
+        if self.is_seven_pairs(self.hand.counts):
             fan_count += 2
         
         # Every gang = 1 fan
@@ -548,11 +531,7 @@ class Player:
         triplet_count += len(self.exposed_sets)
         
         # Count triplets and pairs in hand
-        counts = {}
-        for tile in self.hand:
-            counts[tile] = counts.get(tile, 0) + 1
-        
-        for count in counts.values():
+        for count in self.hand.counts:
             if count == 2:
                 pair_count += 1
             elif count == 3:
@@ -564,23 +543,33 @@ class Player:
         """
         Check if all tiles are of the same suit
         """
-        all_tiles = self.hand.copy()
+        suits = {suit for suit in range(3) if self.hand.suit_sizes[suit]}
         for sets in self.exposed_sets:
-            all_tiles.extend(sets)
+            suits.add(sets[0] // 9)
         
-        suits = {tile[-1] for tile in all_tiles}
         return len(suits) == 1
 
 class MahjongGame:
-    def __init__(self):
-        self.deck = generate_deck()
-        self.players = [Player(f"Player {i+1}") for i in range(4)]
+    def __init__(self, agent=None, rng=None, recorder=None):
+        """
+        agent: RLAgent (or compatible policy) for the AI player; defaults to
+        the process-wide shared, read-only agent from model_registry
+        rng: random.Random driving the deck and every player (a fresh one if
+        not given); the agent keeps its own unless given the same one
+        recorder: replay.ReplayRecorder logging the game, if given
+        """
+        self.rng = rng if rng is not None else random.Random()
+        self.recorder = recorder
+        self.deck = generate_deck(self.rng)
+        self.players = [Player(f"Player {i+1}", rng=self.rng) for i in range(4)]
         self.discards = []
+        self.visible = [0] * 27  # Copies of each tile showing on the table (discards and exposed sets)
         self.current_round = 0
+        self.turn = 0  # Index in players of the player to move
         
         # Set first player as AI and others as non-AI
         self.players[0].is_ai = True
-        self.players[0].rl_agent = RLAgent()
+        self.players[0].rl_agent = agent if agent is not None else model_registry.shared_agent()
         
         for i in range(1, 4):
             self.players[i].is_ai = False
@@ -600,21 +589,21 @@ class MahjongGame:
         
         # Create some pairs
         for i in range(3):
-            suit = random.choice(["W", "B", "T"])
-            num = random.randint(2, 8)  # Middle numbers are better
-            good_tiles.extend([f"{num}{suit}", f"{num}{suit}"])
+            suit = self.rng.choice(TIE_ORDER)
+            num = self.rng.randint(2, 8)  # Middle numbers are better
+            good_tiles.extend([make_tile(suit, num)] * 2)
         
         # Create a potential straight
-        suit = random.choice(["W", "B", "T"])
-        num = random.randint(1, 7)
-        good_tiles.extend([f"{num}{suit}", f"{num+1}{suit}", f"{num+2}{suit}"])
+        suit = self.rng.choice(TIE_ORDER)
+        num = self.rng.randint(1, 7)
+        good_tiles.extend(make_tile(suit, num + i) for i in range(3))
         
         # Shuffle these good tiles and place them near the top of the deck
-        random.shuffle(good_tiles)
+        self.rng.shuffle(good_tiles)
         
         # Insert them at various positions in the top 40 cards
         for i, tile in enumerate(good_tiles):
-            position = random.randint(i*3, i*3 + 20)
+            position = self.rng.randint(i*3, i*3 + 20)
             if position < len(self.deck):
                 # Remove the tile if it already exists to avoid duplicates
                 if tile in self.deck:
@@ -639,6 +628,7 @@ class MahjongGame:
         Initial dealing of tiles
         """
         dealer = self.determine_dealer()
+        recorder = self.recorder
         
         # Initial dealing (4-4-4-1 structure)
         for _ in range(3):
@@ -646,14 +636,21 @@ class MahjongGame:
                 if player.is_ai:
                     # AI gets to draw more tiles and then put some back
                     extra_tiles = player.draw_tile(self.deck, 5)  # Draw 5 instead of 4
+                    if recorder:
+                        recorder.draw(player, extra_tiles)
                     # Put the worst tile back
                     if len(player.hand) > 4:
                         worst_tile = player._find_worst_tile()
                         player.hand.remove(worst_tile)
                         self.deck.append(worst_tile)
-                        random.shuffle(self.deck)  # Shuffle to hide the returned tile
+                        self.rng.shuffle(self.deck)  # Shuffle to hide the returned tile
+                        if recorder:
+                            recorder.put_back(player, worst_tile)
+                            recorder.shuffle()
                 else:
-                    player.draw_tile(self.deck, 4)
+                    drawn = player.draw_tile(self.deck, 4)
+                    if recorder:
+                        recorder.draw(player, drawn)
         
         # Last tile for each player
         for player in self.players:
@@ -661,16 +658,25 @@ class MahjongGame:
                 if player.is_ai:
                     # AI dealer gets to draw 3 tiles and keep the best 2
                     extra_tiles = player.draw_tile(self.deck, 3)  # Draw 3 instead of 2
+                    if recorder:
+                        recorder.draw(player, extra_tiles)
                     # Put the worst tile back
                     if len(player.hand) > 14:
                         worst_tile = player._find_worst_tile()
                         player.hand.remove(worst_tile)
                         self.deck.append(worst_tile)
-                        random.shuffle(self.deck)
+                        self.rng.shuffle(self.deck)
+                        if recorder:
+                            recorder.put_back(player, worst_tile)
+                            recorder.shuffle()
                 else:
-                    player.draw_tile(self.deck, 2)  # Dealer gets 14 tiles
+                    drawn = player.draw_tile(self.deck, 2)  # Dealer gets 14 tiles
+                    if recorder:
+                        recorder.draw(player, drawn)
             else:
-                player.draw_tile(self.deck, 1)  # Others get 13 tiles
+                drawn = player.draw_tile(self.deck, 1)  # Others get 13 tiles
+                if recorder:
+                    recorder.draw(player, drawn)
         
         # Exchange tiles
         for i in range(4):
@@ -681,6 +687,8 @@ class MahjongGame:
             success = False
             while attempts < 3 and not success:  # Try up to 3 times
                 given, received = giver.exchange_three(receiver)
+                if recorder:
+                    recorder.exchange(giver, receiver, given, received)
                 if len(given) == 3 and len(received) == 3:
                     success = True
                 attempts += 1
@@ -688,6 +696,22 @@ class MahjongGame:
         # Determine banned suits for each player
         for player in self.players:
             player.determine_banned_suit()
+            if recorder:
+                recorder.banned(player, player.banned_suit)
+    
+    def show(self, tile, n=1):
+        """
+        Count n more copies of tile as visible: 1 for a discard, 2 for a peng
+        (its third tile was counted as a discard), 4 for a gang
+        """
+        self.visible[tile] += n
+    
+    def live_copies(self, tile, player=None):
+        """Copies of tile not showing on the table (nor in player's hand, if given)"""
+        live = 4 - self.visible[tile]
+        if player is not None:
+            live -= player.hand.counts[tile]
+        return live
     
     def get_discard_count(self, tile):
         """
@@ -695,39 +719,113 @@ class MahjongGame:
         """
         return self.discards.count(tile)
     
-    def play_game(self, quiet=False):
+    def snapshot(self, rng=True):
+        """
+        The game state as a flat tuple for restore(): deck, discards, visible
+        counts, round, turn and RNG state, then per seat its name, hand, exposed
+        sets, banned suit, Hu flag, gangs, total reward and winning_guaranteed
+        Agents and the recorder are not part of the state. Copying the RNG state
+        is most of the cost: rollouts drawing from their own RNG can leave it
+        out (rng=False), restore() then leaves the RNG as it is.
+        """
+        state = [tuple(self.deck), tuple(self.discards), tuple(self.visible), self.current_round, self.turn,
+                 self.rng.getstate() if rng else None]
+        for player in self.players:
+            state += (player.name, player.hand.copy(), tuple(map(tuple, player.exposed_sets)), player.banned_suit,
+                      player.is_hu, player.gang_count, player.total_reward, player.winning_guaranteed)
+        return tuple(state)
+    
+    def restore(self, state):
+        """Return the game to a snapshot() of it (or of a clone of it)"""
+        deck, discards, visible, self.current_round, self.turn, rng_state = state[:GAME_FIELDS]
+        self.deck = list(deck)
+        self.discards = list(discards)
+        self.visible = list(visible)
+        if rng_state is not None:
+            self.rng.setstate(rng_state)
+        
+        # Seats in the snapshot's order (the deal sorts them by dice roll)
+        names = state[GAME_FIELDS::SEAT_FIELDS]
+        if any(player.name != name for player, name in zip(self.players, names)):
+            self.players.sort(key=lambda player: names.index(player.name))
+        for player, i in zip(self.players, range(GAME_FIELDS, len(state), SEAT_FIELDS)):
+            (_, hand, exposed_sets, player.banned_suit, player.is_hu, player.gang_count,
+             player.total_reward, player.winning_guaranteed) = state[i:i + SEAT_FIELDS]
+            # Copies keep the hand version, so the players' win caches stay valid
+            player.hand = hand.copy()
+            player.exposed_sets = [list(exposed_set) for exposed_set in exposed_sets]
+    
+    def clone(self, rng=None):
+        """
+        A new game in the same state, sharing the players' agents (not the
+        recorder), drawing from rng if given, else from a copy of this game's RNG
+        """
+        game = MahjongGame.__new__(MahjongGame)
+        game.__dict__.update(self.__dict__)
+        if rng is None:
+            rng = random.Random(0)  # (seeding from the OS would cost more than the copy)
+            rng.setstate(self.rng.getstate())
+        game.rng = rng
+        game.recorder = None
+        game.deck = self.deck.copy()
+        game.discards = self.discards.copy()
+        game.visible = self.visible.copy()
+        game.players = [player.clone(rng) for player in self.players]
+        return game
+    
+    def play_game(self, quiet=False, deal=True, until_round=None):
         """
         Play a complete game
-        Returns the total reward accumulated during the game
+        deal=False plays on from the current state instead (after restore(), on
+        a clone(), or after a pause), from the start of self.turn's turn.
+        until_round pauses the game, unfinished, once current_round reaches it.
+        Returns the total reward accumulated during this call
         """
-        if not quiet:
-            print("Game Start: Dealing tiles...")
+        # Replay recording, None unless a recorder was given
+        recorder = self.recorder
         
-        self.deal_tiles()
+        # Per-phase timing (see phase_timer.py), None unless enabled
+        timer = phase_timer.ACTIVE
         
-        if not quiet:
-            print("Starting Mahjong Game...")
+        if deal:
+            if not quiet:
+                print("Game Start: Dealing tiles...")
+            
+            if recorder:
+                recorder.start(self)
+            
+            self.deal_tiles()
+            
+            if not quiet:
+                print("Starting Mahjong Game...")
+            
+            self.turn = 0
+            if timer:
+                timer.games += 1
         
-        game_over = False
-        current_player_index = 0
+        game_over = any(player.is_hu for player in self.players)  # Game ends as soon as someone wins
         total_game_reward = 0
         
-        # Reset AI agent's tracking for the new game
-        if self.players[0].rl_agent:
-            self.players[0].rl_agent.reset_for_new_game()
-        
-        # Reset player rewards
-        for player in self.players:
-            player.total_reward = 0
+        if deal:
+            # Reset AI agent's tracking for the new game
+            if self.players[0].rl_agent:
+                self.players[0].rl_agent.reset_for_new_game()
+            
+            # Reset player rewards
+            for player in self.players:
+                player.total_reward = 0
         
         # Maximum number of rounds before game ends
         max_rounds = 250  # This prevents infinite games
         
         while not game_over and self.current_round < max_rounds:
-            player = self.players[current_player_index]
+            if until_round is not None and self.current_round >= until_round:
+                return total_game_reward  # Paused, play_game(deal=False) plays on
+            
+            player = self.players[self.turn]
             
             if player.is_hu:
-                current_player_index = (current_player_index + 1) % 4
+                self.turn = (self.turn + 1) % 4
                 continue
             
             if not self.deck:
@@ -736,9 +834,11 @@ class MahjongGame:
                 break
             
             # AI gets extra advantages during draw
+            if timer:
+                phase_start = perf_counter()
             if player.is_ai and len(self.deck) > 1:
                 # 25% chance to peek at two tiles and choose the better one
-                if random.random() < 0.25:
+                if self.rng.random() < 0.25:
                     tile1 = self.deck.pop()
                     tile2 = self.deck.pop()
                     
@@ -748,28 +848,43 @@ class MahjongGame:
                     
                     # Keep the better tile, put the other back
                     if tile1_value >= tile2_value:
-                        player.hand.append(tile1)
-                        self.deck.append(tile2)
+                        kept, returned = tile1, tile2
                     else:
-                        player.hand.append(tile2)
-                        self.deck.append(tile1)
+                        kept, returned = tile2, tile1
+                    player.hand.append(kept)
+                    self.deck.append(returned)
+                    drawn = [kept]
                     
-                    random.shuffle(self.deck)  # Shuffle deck after putting tile back
-                    player.sort_hand()
+                    self.rng.shuffle(self.deck)  # Shuffle deck after putting tile back
+                    if recorder:
+                        recorder.draw(player, (tile1, tile2))
+                        recorder.put_back(player, returned)
+                        recorder.shuffle()
                 else:
                     # Regular draw
-                    player.draw_tile(self.deck)
+                    drawn = player.draw_tile(self.deck)
+                    if recorder:
+                        recorder.draw(player, drawn)
             else:
                 # Regular players just get normal draws
-                player.draw_tile(self.deck)
+                drawn = player.draw_tile(self.deck)
+                if recorder:
+                    recorder.draw(player, drawn)
+            if timer:
+                phase_start = timer.lap("draw", player, phase_start)
             
             # Check for Hu (winning)
-            if player.check_hu():
+            hu = player.check_hu()
+            if timer:
+                phase_start = timer.lap("self_hu", player, phase_start)
+            if hu:
                 score = player.calculate_score(is_zimo=True)
                 if not quiet:
                     print(f"{player.name} Hu! Final Score: {score}")
                 
                 player.is_hu = True
+                if recorder:
+                    recorder.hu(player, drawn[0])
                 
                 # Reward for winning
                 if player.is_ai and player.rl_agent:
@@ -780,20 +895,29 @@ class MahjongGame:
                     # Update Q-table for winning
                     next_state = player.rl_agent.get_state(player, self)
                     player.rl_agent.update_q_table(player, self, next_state, reward, hu_achieved=True)
+                    if timer:
+                        timer.lap("q_update", player, phase_start)
                 
                 game_over = True  # Game ends as soon as someone wins
                 continue
             
             # Discard tile
             discarded = player.discard_tile(self)
-            if discarded:
+            if timer:
+                phase_start = timer.lap("discard", player, phase_start)
+            if discarded is not None:
                 self.discards.append(discarded)
+                self.show(discarded)
+                if recorder:
+                    recorder.discard(player, discarded)
                 
                 # Calculate reward for discard action
                 if player.is_ai and player.rl_agent:
                     reward = player.rl_agent.calculate_reward(player, self, ("discard", discarded))
                     player.total_reward += reward
                     total_game_reward += reward
+                    if timer:
+                        phase_start = timer.lap("reward", player, phase_start)
                 
                 # Check if any player can Hu with the discarded tile
                 hu_player = None
@@ -801,6 +925,8 @@ class MahjongGame:
                     if next_player != player and next_player.check_hu_with_tile(discarded):
                         hu_player = next_player
                         break
+                if timer:
+                    phase_start = timer.lap("opponent_hu", player, phase_start)
                 
                 if hu_player:
                     score = hu_player.calculate_score(is_zimo=False)
@@ -808,6 +934,8 @@ class MahjongGame:
                         print(f"{hu_player.name} Hu! Final Score: {score}")
                     
                     hu_player.is_hu = True
+                    if recorder:
+                        recorder.hu(hu_player, discarded, player)
                     
                     # Reward for winning
                     if hu_player.is_ai and hu_player.rl_agent:
@@ -818,6 +946,8 @@ class MahjongGame:
                         # Update Q-table for winning
                         next_state = hu_player.rl_agent.get_state(hu_player, self)
                         hu_player.rl_agent.update_q_table(hu_player, self, next_state, reward, hu_achieved=True)
+                        if timer:
+                            timer.lap("q_update", hu_player, phase_start)
                     
                     game_over = True  # Game ends as soon as someone wins
                     continue
@@ -825,9 +955,12 @@ class MahjongGame:
                 # Check if any player can Peng
                 peng_player = None
                 for i in range(1, 4):
-                    next_player = self.players[(current_player_index + i) % 4]
+                    next_player = self.players[(self.turn + i) % 4]
                     if next_player.peng(discarded):
                         peng_player = next_player
+                        self.show(discarded, 2)
+                        if recorder:
+                            recorder.peng(next_player, discarded, player)
                         
                         # Reward for peng
                         if next_player.is_ai and next_player.rl_agent:
@@ -836,18 +969,27 @@ class MahjongGame:
                             total_game_reward += reward
                         
                         break
+                if timer:
+                    phase_start = timer.lap("peng", peng_player or player, phase_start)
                 
                 if peng_player:
                     # After Peng, player must discard a tile
                     discarded_after_peng = peng_player.discard_tile(self)
-                    if discarded_after_peng:
+                    if timer:
+                        phase_start = timer.lap("discard", peng_player, phase_start)
+                    if discarded_after_peng is not None:
                         self.discards.append(discarded_after_peng)
+                        self.show(discarded_after_peng)
+                        if recorder:
+                            recorder.discard(peng_player, discarded_after_peng)
                         
                         # Calculate reward for discard after peng
                         if peng_player.is_ai and peng_player.rl_agent:
                             reward = peng_player.rl_agent.calculate_reward(peng_player, self, ("discard", discarded_after_peng))
                             peng_player.total_reward += reward
                             total_game_reward += reward
+                            if timer:
+                                timer.lap("reward", peng_player, phase_start)
                     
                     continue
             
@@ -855,8 +997,10 @@ class MahjongGame:
             if player.is_ai and player.rl_agent:
                 next_state = player.rl_agent.get_state(player, self)
                 player.rl_agent.update_q_table(player, self, next_state, player.total_reward)
+                if timer:
+                    timer.lap("q_update", player, phase_start)
             
-            current_player_index = (current_player_index + 1) % 4
+            self.turn = (self.turn + 1) % 4
             self.current_round += 1
         
         if not quiet:
@@ -866,6 +1010,12 @@ class MahjongGame:
                 status = "Hu!" if player.is_hu else "Did not Hu"
                 print(f"{player.name}: {status}")
         
+        # Learn from the decisions still pending (each shared agent once)
+        for agent in {id(p.rl_agent): p.rl_agent for p in self.players if p.rl_agent}.values():
+            agent.finish_game(self)
+        
+        if recorder:
+            recorder.finish(self)
         return total_game_reward
     
     def _evaluate_tile_for_ai(self, player, tile):
@@ -873,26 +1023,27 @@ class MahjongGame:
         value = 0
         
         # Banned suit is bad
-        if tile.endswith(player.banned_suit):
+        if tile // 9 == player.banned_suit:
             return -10
         
         # Check if forms a pair
-        if player.hand.count(tile) == 1:
+        counts = player.hand.counts
+        if counts[tile] == 1:
             value += 8  # Creating a pair is good
-        elif player.hand.count(tile) == 2:
+        elif counts[tile] == 2:
             value += 5  # Third copy of a tile is good
-        elif player.hand.count(tile) == 3:
+        elif counts[tile] == 3:
             value += 12  # Fourth copy to make a gang is very good
         
         # Check if helps a straight
-        suit = tile[-1]
-        num = int(tile[:-1])
+        base = tile - tile % 9
+        num = tile % 9 + 1
         
         # Check for potential straights
         for start in range(max(1, num-2), min(8, num+1)):
-            potential = [f"{start+i}{suit}" for i in range(3)]
+            potential = [base + start - 1 + i for i in range(3)]
             if tile in potential:  # Only if this tile is part of the potential straight
-                existing = sum(1 for t in potential if t in player.hand)
+                existing = sum(1 for t in potential if counts[t])
                 if existing == 2:  # This would complete a straight
                     value += 10
                 elif existing == 1:  # This would get us closer
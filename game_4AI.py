@@ -1,34 +1,62 @@
 import random
 import os
 from rl_agent import RLAgent
-
-# Mahjong tiles definition
-def generate_deck():
-    deck = [f"{num}{suit}" for suit in ["W", "T", "B"] for num in range(1, 10)] * 4
-    random.shuffle(deck)
+import hu_table
+import shanten
+import phase_timer
+from time import perf_counter
+from tiles import Hand, TIE_ORDER, tile_names
+
+# Fields of a MahjongGame.snapshot() before the seats, and per seat
+GAME_FIELDS = 6
+SEAT_FIELDS = 7
+
+# Mahjong tiles definition (tile IDs 0..26, see tiles.py)
+def generate_deck(rng=random):
+    deck = list(range(27)) * 4
+    rng.shuffle(deck)
     return deck
 
 class Player:
-    def __init__(self, name, is_ai=False):
+    def __init__(self, name, is_ai=False, rng=None):
         self.name = name
-        self.hand = []
+        self.rng = rng if rng is not None else random.Random()  # Dice, exchanges, discards, pengs
+        self.hand = Hand()
         self.is_hu = False
-        self.dice_roll = random.randint(1, 6) + random.randint(1, 6)
+        self.dice_roll = self.rng.randint(1, 6) + self.rng.randint(1, 6)
         self.banned_suit = None
-        self.exposed_sets = []  # Store exposed sets of tiles
+        self.exposed_sets = []  # Store exposed sets of tiles (lists of tile IDs)
         self.gang_count = 0
         self.is_ai = is_ai
         self.rl_agent = None
+        self._waits = frozenset()  # Cached winning tiles of the hand
+        self._waits_key = None  # (hand version, banned suit) the cache belongs to
+        self._hu = False  # Cached win check of the hand (banned tiles aside)
+        self._hu_key = None
         self.total_reward = 0  # Track total reward for this player during a game
     
+    def clone(self, rng):
+        """Copy of the player drawing from rng (the agent is shared)"""
+        player = Player.__new__(Player)
+        player.__dict__.update(self.__dict__)
+        player.rng = rng
+        player.hand = self.hand.copy()
+        player.exposed_sets = [exposed_set.copy() for exposed_set in self.exposed_sets]
+        return player
+    
     def draw_tile(self, deck, count=1):
         drawn_tiles = []
         for _ in range(count):
             if deck:
                 tile = deck.pop()
+                # With the winning tiles of the hand already known, the win
+                # check after drawing is a set lookup
+                known_waits = self._waits_key == (self.hand.version, self.banned_suit)
                 self.hand.append(tile)
                 drawn_tiles.append(tile)
-        self.sort_hand()
+                if known_waits:
+                    self._hu = tile in self._waits
+                    self._hu_key = (self.hand.version, self.banned_suit)
         return drawn_tiles
     
     def exchange_three(self, target_player):
@@ -36,7 +64,7 @@ class Player:
         count = self.count_suits()
 
         # Find suits that have more than 3 tiles and sort by amount
-        valid_suits = sorted([(suit, num) for suit, num in count.items() if num >= 3], key=lambda x: x[1])
+        valid_suits = sorted([(suit, count[suit]) for suit in TIE_ORDER if count[suit] >= 3], key=lambda x: x[1])
 
         # Choose the least but at least 3 tiles of a suit to exchange
         if not valid_suits:
@@ -45,13 +73,13 @@ class Player:
         chosen_suit = valid_suits[0][0]
 
         # Check if target player has enough tiles of the chosen suit
-        target_suit_tiles = [tile for tile in target_player.hand if chosen_suit in tile]
+        target_suit_tiles = target_player.hand.suit_tiles(chosen_suit)
         if len(target_suit_tiles) < 3:
             return [], []  # Target player doesn't have enough tiles
         
         # Choose 3 tiles to exchange
-        chosen_tiles = random.sample([t for t in self.hand if chosen_suit in t], 3)
-        received_tiles = random.sample(target_suit_tiles, 3)
+        chosen_tiles = self.rng.sample(self.hand.suit_tiles(chosen_suit), 3)
+        received_tiles = self.rng.sample(target_suit_tiles, 3)
 
         # Exchange tiles
         for tile in chosen_tiles:
@@ -67,13 +95,13 @@ class Player:
     def determine_banned_suit(self):
         # After exchange, determine the banned suit (the least common suit)
         count = self.count_suits()
-        sorted_suits = sorted(count.items(), key=lambda x: x[1])
+        sorted_suits = sorted([(suit, count[suit]) for suit in TIE_ORDER], key=lambda x: x[1])
 
         self.banned_suit = sorted_suits[0][0]
 
         # If multiple suits have the same minimum count, choose randomly
         if len(sorted_suits) > 1 and sorted_suits[0][1] == sorted_suits[1][1]:
-            self.banned_suit = random.choice([s[0] for s in sorted_suits if s[1] == sorted_suits[0][1]])
+            self.banned_suit = self.rng.choice([s[0] for s in sorted_suits if s[1] == sorted_suits[0][1]])
 
         return self.banned_suit
     
@@ -238,7 +266,7 @@ class Player:
             return None
 
         # Always discard banned suit tiles first
-        banned_tiles = [tile for tile in self.hand if self.banned_suit in tile]
+        banned_tiles = self.hand.suit_tiles(self.banned_suit)
         if banned_tiles:
             if self.rl_agent:
                 # Let the RL agent choose which banned tile to discard
@@ -248,12 +276,12 @@ class Player:
                     return tile
                 else:
                     # If RL agent chose something else, still discard a banned tile
-                    discarded_tile = random.choice(banned_tiles)
+                    discarded_tile = self.rng.choice(banned_tiles)
                     self.hand.remove(discarded_tile)
                     return discarded_tile
             else:
                 # Fallback - choose randomly
-                discarded_tile = random.choice(banned_tiles)
+                discarded_tile = self.rng.choice(banned_tiles)
                 self.hand.remove(discarded_tile)
                 return discarded_tile
         
@@ -270,7 +298,7 @@ class Player:
                 return worst_tile
         
         # Fallback to random discard
-        discarded_tile = random.choice(self.hand)
+        discarded_tile = self.rng.choice(self.hand.tiles())
         self.hand.remove(discarded_tile)
         return discarded_tile
     
@@ -279,27 +307,27 @@ class Player:
         # This is a simplified version that prioritizes keeping pairs and straights
         
         # Calculate value for each tile
+        counts = self.hand.counts
         tile_values = {}
-        for tile in self.hand:
+        for tile in self.hand.distinct():
             value = 0
             
             # Pairs are valuable
-            if self.hand.count(tile) >= 2:
+            if counts[tile] >= 2:
                 value += 5
             
             # Check if part of potential straight
-            suit = tile[-1]
-            num = int(tile[:-1])
+            base = tile - tile % 9
+            num = tile % 9 + 1
             for start in range(max(1, num-2), min(8, num+1)):
-                potential = [f"{start+i}{suit}" for i in range(3)]
-                existing = sum(1 for t in potential if t in self.hand)
+                existing = sum(1 for i in range(3) if counts[base + start - 1 + i])
                 if existing >= 2:  # At least 2 of 3 tiles for a straight
                     value += 3
             
             tile_values[tile] = value
         
         # Return the tile with lowest value
-        return min(self.hand, key=lambda t: tile_values.get(t, 0))
+        return min(tile_values, key=tile_values.get)
     
     def peng(self, tile):
         """
@@ -307,23 +335,21 @@ class Player:
         """
         if self.hand.count(tile) >= 2:
             # Cannot Peng if tile is in banned suit
-            if tile.endswith(self.banned_suit):
+            if tile // 9 == self.banned_suit:
                 return False
             
             # For AI players with an agent, use strategy
             if self.rl_agent:
                 # Use agent to decide, but with high probability of Peng
-                if random.random() < 0.8:  # 80% chance to Peng
-                    self.hand.remove(tile)
-                    self.hand.remove(tile)
+                if self.rng.random() < 0.8:  # 80% chance to Peng
+                    self.hand.remove(tile, 2)
                     self.exposed_sets.append([tile, tile, tile])
                     return True
                 return False
             else:
                 # Simple 50% chance strategy
-                if random.random() < 0.5:
-                    self.hand.remove(tile)
-                    self.hand.remove(tile)
+                if self.rng.random() < 0.5:
+                    self.hand.remove(tile, 2)
                     self.exposed_sets.append([tile, tile, tile])
                     return True
                 return False
@@ -336,12 +362,11 @@ class Player:
         """
         if self.hand.count(tile) == 4:
             # Cannot Gang if tile is in banned suit
-            if tile.endswith(self.banned_suit):
+            if tile // 9 == self.banned_suit:
                 return False
             
             # Remove tiles and add to exposed sets
-            for _ in range(4):
-                self.hand.remove(tile)
+            self.hand.remove(tile, 4)
             
             self.exposed_sets.append([tile, tile, tile, tile])
             self.gang_count += 1
@@ -353,138 +378,102 @@ class Player:
         """
         Check if adding a specific tile to hand would complete a winning hand
         """
-        if self.banned_suit and tile.endswith(self.banned_suit):
+        if self.banned_suit is not None and tile // 9 == self.banned_suit:
             return False  # Cannot win with a banned suit tile
             
-        temp_hand = self.hand.copy()
-        temp_hand.append(tile)
-        return self.is_seven_pairs(temp_hand) or self.is_regular_hu(temp_hand)
+        return tile in self.winning_tiles()
     
-    def is_seven_pairs(self, hand):
+    def winning_tiles(self):
         """
-        Check if the hand forms seven pairs (a winning hand type)
+        Tiles that would complete the hand (as check_hu_with_tile judges it)
+        Cached until the hand or the banned suit changes
         """
-        if len(hand) != 14:
+        key = (self.hand.version, self.banned_suit)
+        if self._waits_key != key:
+            self._waits = self._find_winning_tiles()
+            self._waits_key = key
+        return self._waits
+    
+    def _find_winning_tiles(self):
+        counts = self.hand.counts
+        size = self.hand.size
+        if size % 3 != 1:
+            return frozenset()
+        
+        # Only a ready hand can have winning tiles (shanten ignoring the
+        # banned suit is a lower bound), which rules out most hands at once
+        if shanten.shanten(counts, (13 - size) // 3) > 0:
+            return frozenset()
+        
+        waits = set()
+        for tile in range(27):
+            if counts[tile] >= 4 or tile // 9 == self.banned_suit:
+                continue
+            counts[tile] += 1
+            if self.is_seven_pairs(counts) or self.is_regular_hu(counts):
+                waits.add(tile)
+            counts[tile] -= 1
+        return frozenset(waits)
+    
+    def _hand_is_complete(self):
+        """Seven pairs or regular win check of the hand, cached per hand version"""
+        key = (self.hand.version, self.banned_suit)
+        if self._hu_key != key:
+            counts = self.hand.counts
+            self._hu = self.is_seven_pairs(counts) or self.is_regular_hu(counts)
+            self._hu_key = key
+        return self._hu
+    
+    def is_seven_pairs(self, counts):
+        """
+        Check if the hand (27-slot count vector) forms seven pairs (a winning hand type)
+        """
+        if sum(counts) != 14:
             return False
         
-        # Count occurrences of each tile
-        counts = {}
-        for tile in hand:
-            counts[tile] = counts.get(tile, 0) + 1
-        
         # Check if all tiles form pairs
-        return all(count == 2 for count in counts.values()) and len(counts) == 7
+        return all(count in (0, 2) for count in counts)
     
-    def is_regular_hu(self, hand):
+    def is_regular_hu(self, counts):
         """
-        Check if the hand forms a regular winning hand (4 sets + 1 pair)
+        Check if the hand (27-slot count vector) forms a regular winning hand (melds + 1 pair)
+        Hands shrunk by exposed pengs / gangs (any 3n+2 size) are supported
         """
-        if len(hand) != 14:
+        if sum(counts) % 3 != 2:
             return False
         
         # Check if any banned suit tiles are present
-        if self.banned_suit and any(tile.endswith(self.banned_suit) for tile in hand):
+        if self.banned_suit is not None and any(counts[self.banned_suit * 9:self.banned_suit * 9 + 9]):
             return False
         
-        # Count occurrences of each tile
-        counts = {}
-        for tile in hand:
-            counts[tile] = counts.get(tile, 0) + 1
-        
-        # Try each possible pair
-        pairs = [tile for tile, count in counts.items() if count >= 2]
-        for pair in pairs:
-            temp_counts = counts.copy()
-            temp_counts[pair] -= 2
-            
-            # Try to form sets with the remaining tiles
-            if self.can_form_melds(temp_counts):
-                return True
-        
-        return False
-    
-    def can_form_melds(self, counts):
-        """
-        Check if the remaining tiles can form valid melds (triplets or straights)
-        """
-        # If no tiles remain, we've successfully formed all melds
-        if not any(counts.values()):
-            return True
-        
-        # Find the first tile with count > 0
-        first_tile = next((tile for tile, count in counts.items() if count > 0), None)
-        if not first_tile:
-            return True
-        
-        # Try to form a triplet
-        if counts[first_tile] >= 3:
-            counts[first_tile] -= 3
-            if self.can_form_melds(counts):
-                return True
-            counts[first_tile] += 3  # Backtrack
-        
-        # Try to form a straight
-        suit = first_tile[-1]
-        num = int(first_tile[:-1])
-        
-        # Check if we can form a straight starting with this tile
-        if num <= 7:  # Straights can only start from 1-7
-            straight_possible = True
-            for i in range(3):
-                straight_tile = f"{num+i}{suit}"
-                if straight_tile not in counts or counts[straight_tile] == 0:
-                    straight_possible = False
-                    break
-            
-            if straight_possible:
-                # Remove the straight tiles
-                for i in range(3):
-                    counts[f"{num+i}{suit}"] -= 1
-                
-                if self.can_form_melds(counts):
-                    return True
-                
-                # Backtrack
-                for i in range(3):
-                    counts[f"{num+i}{suit}"] += 1
-        
-        return False
+        return hu_table.is_regular_hu(counts)
     
     def check_hu(self):
         """
         Check if the current hand is a winning hand
         """
         # Cannot win if hand contains banned suit tiles
-        if self.banned_suit and any(tile.endswith(self.banned_suit) for tile in self.hand):
+        if self.banned_suit is not None and self.hand.suit_sizes[self.banned_suit]:
             return False
         
-        return self.is_seven_pairs(self.hand) or self.is_regular_hu(self.hand)
-    
-    def sort_hand(self):
-        """
-        Sort the hand for better readability
-        """
-        self.hand.sort(key=lambda x: (x[-1], int(x[:-1])))
+        return self._hand_is_complete()
     
     def sorted_hand(self):
         """
         Return a string representation of the sorted hand
         """
-        tiles_wan = sorted([t for t in self.hand if "W" in t])
-        tiles_bing = sorted([t for t in self.hand if "B" in t])
-        tiles_tiao = sorted([t for t in self.hand if "T" in t])
+        tiles_wan = tile_names(self.hand.suit_tiles(0))
+        tiles_bing = tile_names(self.hand.suit_tiles(2))
+        tiles_tiao = tile_names(self.hand.suit_tiles(1))
+        exposed = [tile_names(s) for s in self.exposed_sets]
         
-        return f"W: {tiles_wan}, B: {tiles_bing}, T: {tiles_tiao} | Exposed: {self.exposed_sets}"
+        return f"W: {tiles_wan}, B: {tiles_bing}, T: {tiles_tiao} | Exposed: {exposed}"
     
     def count_suits(self):
         """
-        Count tiles by suit in the hand
+        Count tiles by suit in the hand (indexed by suit: W, T, B)
         """
-        count = {"W": 0, "B": 0, "T": 0}
-        for tile in self.hand:
-            suit = tile[-1]
-            count[suit] += 1
-        return count
+        return self.hand.suit_sizes.copy()
     
     def calculate_score(self, is_zimo=False):
         """
@@ -502,7 +491,7 @@ class Player:
             fan_count += 2
         
         # 7 pairs = 2 fan
-        if self.is_seven_pairs(self.hand):
+        if self.is_seven_pairs(self.hand.counts):
             fan_count += 2
         
         # Every gang = 1 fan
@@ -527,11 +516,7 @@ class Player:
         triplet_count += len(self.exposed_sets)
         
         # Count triplets and pairs in hand
-        counts = {}
-        for tile in self.hand:
-            counts[tile] = counts.get(tile, 0) + 1
-        
-        for count in counts.values():
+        for count in self.hand.counts:
             if count == 2:
                 pair_count += 1
             elif count == 3:
@@ -543,19 +528,32 @@ class Player:
         """
         Check if all tiles are of the same suit
         """
-        all_tiles = self.hand.copy()
+        suits = {suit for suit in range(3) if self.hand.suit_sizes[suit]}
         for sets in self.exposed_sets:
-            all_tiles.extend(sets)
+            suits.add(sets[0] // 9)
         
-        suits = {tile[-1] for tile in all_tiles}
         return len(suits) == 1
 
 class MahjongGame:
-    def __init__(self):
-        self.deck = generate_deck()
-        self.players = [Player(f"Player {i+1}", is_ai=True) for i in range(4)]
+    def __init__(self, agent=None, rng=None, recorder=None):
+        """
+        agent: RLAgent (or compatible policy) shared by all four players, if given
+        rng: random.Random driving the deck and every player (a fresh one if
+        not given); the agent keeps its own unless given the same one
+        recorder: replay.ReplayRecorder logging the game, if given
+        """
+        self.rng = rng if rng is not None else random.Random()
+        self.recorder = recorder
+        self.deck = generate_deck(self.rng)
+        self.players = [Player(f"Player {i+1}", is_ai=True, rng=self.rng) for i in range(4)]
         self.discards = []
+        self.visible = [0] * 27  # Copies of each tile showing on the table (discards and exposed sets)
         self.current_round = 0
+        self.turn = 0  # Index in players of the player to move
+        
+        if agent is not None:
+            for player in self.players:
+                player.rl_agent = agent
     
     def determine_dealer(self):
         """
@@ -569,18 +567,23 @@ class MahjongGame:
         Initial dealing of tiles
         """
         dealer = self.determine_dealer()
+        recorder = self.recorder
         
         # Initial dealing (4-4-4-1 structure)
         for _ in range(3):
             for player in self.players:
-                player.draw_tile(self.deck, 4)
+                drawn = player.draw_tile(self.deck, 4)
+                if recorder:
+                    recorder.draw(player, drawn)
         
         # Last tile for each player
         for player in self.players:
             if player == dealer:
-                player.draw_tile(self.deck, 2)  # Dealer gets 14 tiles
+                drawn = player.draw_tile(self.deck, 2)  # Dealer gets 14 tiles
             else:
-                player.draw_tile(self.deck, 1)  # Others get 13 tiles
+                drawn = player.draw_tile(self.deck, 1)  # Others get 13 tiles
+            if recorder:
+                recorder.draw(player, drawn)
         
         # Exchange tiles
         for i in range(4):
@@ -591,6 +594,8 @@ class MahjongGame:
             success = False
             while attempts < 3 and not success:  # Try up to 3 times
                 given, received = giver.exchange_three(receiver)
+                if recorder:
+                    recorder.exchange(giver, receiver, given, received)
                 if len(given) == 3 and len(received) == 3:
                     success = True
                 attempts += 1
@@ -598,6 +603,22 @@ class MahjongGame:
         # Determine banned suits for each player
         for player in self.players:
             player.determine_banned_suit()
+            if recorder:
+                recorder.banned(player, player.banned_suit)
+    
+    def show(self, tile, n=1):
+        """
+        Count n more copies of tile as visible: 1 for a discard, 2 for a peng
+        (its third tile was counted as a discard), 4 for a gang
+        """
+        self.visible[tile] += n
+    
+    def live_copies(self, tile, player=None):
+        """Copies of tile not showing on the table (nor in player's hand, if given)"""
+        live = 4 - self.visible[tile]
+        if player is not None:
+            live -= player.hand.counts[tile]
+        return live
     
     def get_discard_count(self, tile):
         """
@@ -605,35 +626,109 @@ class MahjongGame:
         """
         return self.discards.count(tile)
     
-    def play_game(self, quiet=False):
+    def snapshot(self, rng=True):
+        """
+        The game state as a flat tuple for restore(): deck, discards, visible
+        counts, round, turn and RNG state, then per seat its name, hand, exposed
+        sets, banned suit, Hu flag, gangs, total reward
+        Agents and the recorder are not part of the state. Copying the RNG state
+        is most of the cost: rollouts drawing from their own RNG can leave it
+        out (rng=False), restore() then leaves the RNG as it is.
+        """
+        state = [tuple(self.deck), tuple(self.discards), tuple(self.visible), self.current_round, self.turn,
+                 self.rng.getstate() if rng else None]
+        for player in self.players:
+            state += (player.name, player.hand.copy(), tuple(map(tuple, player.exposed_sets)), player.banned_suit,
+                      player.is_hu, player.gang_count, player.total_reward)
+        return tuple(state)
+    
+    def restore(self, state):
+        """Return the game to a snapshot() of it (or of a clone of it)"""
+        deck, discards, visible, self.current_round, self.turn, rng_state = state[:GAME_FIELDS]
+        self.deck = list(deck)
+        self.discards = list(discards)
+        self.visible = list(visible)
+        if rng_state is not None:
+            self.rng.setstate(rng_state)
+        
+        # Seats in the snapshot's order (the deal sorts them by dice roll)
+        names = state[GAME_FIELDS::SEAT_FIELDS]
+        if any(player.name != name for player, name in zip(self.players, names)):
+            self.players.sort(key=lambda player: names.index(player.name))
+        for player, i in zip(self.players, range(GAME_FIELDS, len(state), SEAT_FIELDS)):
+            (_, hand, exposed_sets, player.banned_suit, player.is_hu, player.gang_count,
+             player.total_reward) = state[i:i + SEAT_FIELDS]
+            # Copies keep the hand version, so the players' win caches stay valid
+            player.hand = hand.copy()
+            player.exposed_sets = [list(exposed_set) for exposed_set in exposed_sets]
+    
+    def clone(self, rng=None):
+        """
+        A new game in the same state, sharing the players' agents (not the
+        recorder), drawing from rng if given, else from a copy of this game's RNG
+        """
+        game = MahjongGame.__new__(MahjongGame)
+        game.__dict__.update(self.__dict__)
+        if rng is None:
+            rng = random.Random(0)  # (seeding from the OS would cost more than the copy)
+            rng.setstate(self.rng.getstate())
+        game.rng = rng
+        game.recorder = None
+        game.deck = self.deck.copy()
+        game.discards = self.discards.copy()
+        game.visible = self.visible.copy()
+        game.players = [player.clone(rng) for player in self.players]
+        return game
+    
+    def play_game(self, quiet=False, deal=True, until_round=None):
         """
         Play a complete game
-        Returns the total reward accumulated during the game
+        deal=False plays on from the current state instead (after restore(), on
+        a clone(), or after a pause), from the start of self.turn's turn.
+        until_round pauses the game, unfinished, once current_round reaches it.
+        Returns the total reward accumulated during this call
         """
-        if not quiet:
-            print("Game Start: Dealing tiles...")
+        # Replay recording, None unless a recorder was given
+        recorder = self.recorder
         
-        self.deal_tiles()
+        # Per-phase timing (see phase_timer.py), None unless enabled
+        timer = phase_timer.ACTIVE
         
-        if not quiet:
-            print("Starting Mahjong Game...")
+        if deal:
+            if not quiet:
+                print("Game Start: Dealing tiles...")
+            
+            if recorder:
+                recorder.start(self)
+            
+            self.deal_tiles()
+            
+            if not quiet:
+                print("Starting Mahjong Game...")
+            
+            self.turn = 0
+            if timer:
+                timer.games += 1
         
-        game_over = False
-        current_player_index = 0
+        game_over = any(player.is_hu for player in self.players)  # Game ends as soon as someone wins
         total_game_reward = 0
         
         # Reset player rewards
-        for player in self.players:
-            player.total_reward = 0
+        if deal:
+            for player in self.players:
+                player.total_reward = 0
         
         # Maximum number of rounds before game ends
         max_rounds = 250  # This prevents infinite games
         
         while not game_over and self.current_round < max_rounds:
-            player = self.players[current_player_index]
+            if until_round is not None and self.current_round >= until_round:
+                return total_game_reward  # Paused, play_game(deal=False) plays on
+            
+            player = self.players[self.turn]
             
             if player.is_hu:
-                current_player_index = (current_player_index + 1) % 4
+                self.turn = (self.turn + 1) % 4
                 continue
             
             if not self.deck:
@@ -642,15 +737,26 @@ class MahjongGame:
                 break
             
             # Draw tile
-            player.draw_tile(self.deck)
+            if timer:
+                phase_start = perf_counter()
+            drawn = player.draw_tile(self.deck)
+            if recorder:
+                recorder.draw(player, drawn)
+            if timer:
+                phase_start = timer.lap("draw", player, phase_start)
             
             # Check for Hu (winning)
-            if player.check_hu():
+            hu = player.check_hu()
+            if timer:
+                phase_start = timer.lap("self_hu", player, phase_start)
+            if hu:
                 score = player.calculate_score(is_zimo=True)
                 if not quiet:
                     print(f"{player.name} Hu! Final Score: {score}")
                 
                 player.is_hu = True
+                if recorder:
+                    recorder.hu(player, drawn[0])
                 
                 # Reward for winning
                 if player.rl_agent:
@@ -661,20 +767,29 @@ class MahjongGame:
                     # Update Q-table for winning
                     next_state = player.rl_agent.get_state(player, self)
                     player.rl_agent.update_q_table(player, self, next_state, reward, hu_achieved=True)
+                    if timer:
+                        timer.lap("q_update", player, phase_start)
                 
                 game_over = True  # Game ends as soon as someone wins
                 continue
             
             # Discard tile
             discarded = player.discard_tile(self)
-            if discarded:
+            if timer:
+                phase_start = timer.lap("discard", player, phase_start)
+            if discarded is not None:
                 self.discards.append(discarded)
+                self.show(discarded)
+                if recorder:
+                    recorder.discard(player, discarded)
                 
                 # Calculate reward for discard action
                 if player.rl_agent:
                     reward = player.rl_agent.calculate_reward(player, self, ("discard", discarded))
                     player.total_reward += reward
                     total_game_reward += reward
+                    if timer:
+                        phase_start = timer.lap("reward", player, phase_start)
                 
                 # Check if any player can Hu with the discarded tile
                 hu_player = None
@@ -682,6 +797,8 @@ class MahjongGame:
                     if next_player != player and next_player.check_hu_with_tile(discarded):
                         hu_player = next_player
                         break
+                if timer:
+                    phase_start = timer.lap("opponent_hu", player, phase_start)
                 
                 if hu_player:
                     score = hu_player.calculate_score(is_zimo=False)
@@ -689,6 +806,8 @@ class MahjongGame:
                         print(f"{hu_player.name} Hu! Final Score: {score}")
                     
                     hu_player.is_hu = True
+                    if recorder:
+                        recorder.hu(hu_player, discarded, player)
                     
                     # Reward for winning
                     if hu_player.rl_agent:
@@ -699,6 +818,8 @@ class MahjongGame:
                         # Update Q-table for winning
                         next_state = hu_player.rl_agent.get_state(hu_player, self)
                         hu_player.rl_agent.update_q_table(hu_player, self, next_state, reward, hu_achieved=True)
+                        if timer:
+                            timer.lap("q_update", hu_player, phase_start)
                     
                     game_over = True  # Game ends as soon as someone wins
                     continue
@@ -706,9 +827,12 @@ class MahjongGame:
                 # Check if any player can Peng
                 peng_player = None
                 for i in range(1, 4):
-                    next_player = self.players[(current_player_index + i) % 4]
+                    next_player = self.players[(self.turn + i) % 4]
                     if next_player.peng(discarded):
                         peng_player = next_player
+                        self.show(discarded, 2)
+                        if recorder:
+                            recorder.peng(next_player, discarded, player)
                         
                         # Reward for peng
                         if next_player.rl_agent:
@@ -717,18 +841,27 @@ class MahjongGame:
                             total_game_reward += reward
                         
                         break
+                if timer:
+                    phase_start = timer.lap("peng", peng_player or player, phase_start)
                 
                 if peng_player:
                     # After Peng, player must discard a tile
                     discarded_after_peng = peng_player.discard_tile(self)
-                    if discarded_after_peng:
+                    if timer:
+                        phase_start = timer.lap("discard", peng_player, phase_start)
+                    if discarded_after_peng is not None:
                         self.discards.append(discarded_after_peng)
+                        self.show(discarded_after_peng)
+                        if recorder:
+                            recorder.discard(peng_player, discarded_after_peng)
                         
                         # Calculate reward for discard after peng
                         if peng_player.rl_agent:
                             reward = peng_player.rl_agent.calculate_reward(peng_player, self, ("discard", discarded_after_peng))
                             peng_player.total_reward += reward
                             total_game_reward += reward
+                            if timer:
+                                timer.lap("reward", peng_player, phase_start)
                     
                     continue
             
@@ -736,8 +869,10 @@ class MahjongGame:
             if player.rl_agent:
                 next_state = player.rl_agent.get_state(player, self)
                 player.rl_agent.update_q_table(player, self, next_state, player.total_reward)
+                if timer:
+                    timer.lap("q_update", player, phase_start)
             
-            current_player_index = (current_player_index + 1) % 4
+            self.turn = (self.turn + 1) % 4
             self.current_round += 1
         
         if not quiet:
@@ -747,6 +882,12 @@ class MahjongGame:
                 status = "Hu!" if player.is_hu else "Did not Hu"
                 print(f"{player.name}: {status}")
         
+        # Learn from the decisions still pending (each shared agent once)
+        for agent in {id(p.rl_agent): p.rl_agent for p in self.players if p.rl_agent}.values():
+            agent.finish_game(self)
+        
+        if recorder:
+            recorder.finish(self)
         return total_game_reward
     
 if __name__ == "__main__":
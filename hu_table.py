@@ -0,0 +1,90 @@
+"""
+Table-driven win detection.
+
+Each suit of a hand is reduced to its 9-digit count pattern (one base-5 digit
+per rank). A table built once at import says whether that pattern splits into
+melds only, or into melds plus exactly one pair. Checking a whole hand is then
+three table lookups.
+"""
+
+# Flags stored per suit pattern
+MELDS = 1  # Pattern splits into triplets / straights only
+MELDS_WITH_PAIR = 2  # Pattern splits into triplets / straights plus one pair
+
+POW5 = [5 ** i for i in range(9)]
+
+
+def _build_table():
+    """
+    Enumerate every suit pattern made of up to 4 melds (and optionally a pair)
+    """
+    # A meld is a count pattern over the 9 ranks of one suit
+    melds = []
+    for rank in range(9):
+        meld = [0] * 9
+        meld[rank] = 3
+        melds.append(meld)
+    for rank in range(7):
+        meld = [0] * 9
+        meld[rank] = meld[rank + 1] = meld[rank + 2] = 1
+        melds.append(meld)
+
+    table = bytearray(5 ** 9)
+
+    def mark(counts):
+        table[sum(c * p for c, p in zip(counts, POW5))] |= MELDS
+        # Adding a pair anywhere gives a melds + pair pattern
+        for rank in range(9):
+            if counts[rank] <= 2:
+                counts[rank] += 2
+                table[sum(c * p for c, p in zip(counts, POW5))] |= MELDS_WITH_PAIR
+                counts[rank] -= 2
+
+    def extend(counts, first, depth):
+        mark(counts)
+        if depth == 4:  # A hand never holds more than 4 melds
+            return
+        for i in range(first, len(melds)):
+            meld = melds[i]
+            if any(c + m > 4 for c, m in zip(counts, meld)):
+                continue
+            new_counts = [c + m for c, m in zip(counts, meld)]
+            extend(new_counts, i, depth + 1)
+
+    extend([0] * 9, 0, 0)
+    return table
+
+
+TABLE = _build_table()
+
+
+def suit_key(counts, suit):
+    """
+    Return the base-5 count pattern of one suit in a 27-slot count vector
+    """
+    base = suit * 9
+    return sum(counts[base + i] * POW5[i] for i in range(9))
+
+
+def is_regular_hu(counts):
+    """
+    Check if a 27-slot count vector forms melds plus one pair (any 3n+2 size)
+    """
+    total = 0
+    for base in (0, 9, 18):
+        row = counts[base:base + 9]
+        size = sum(row)
+        if not size:
+            continue
+
+        remainder = size % 3
+        if remainder == 1:
+            return False
+        flags = TABLE[sum(c * p for c, p in zip(row, POW5))]
+        if not flags & (MELDS_WITH_PAIR if remainder else MELDS):
+            return False
+        total += size
+
+    # Exactly one suit may hold the pair, which with every suit at remainder
+    # 0 or 2 is the same as the whole hand being 3n+2 tiles
+    return total % 3 == 2
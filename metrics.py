@@ -0,0 +1,117 @@
+"""
+Structured run metrics: buffered JSON Lines records.
+
+Every record is one JSON object with a "kind" ("episode", "game", "progress",
+"checkpoint", "error", "summary", ...) and "t", the seconds since the log was
+opened. Per-episode records are sampled (every sample_every-th episode) and
+records are written in batches, so logging costs nothing per game event and
+little per game.
+
+Run this module on a log to print its learning curve.
+"""
+import json
+import time
+import argparse
+
+
+class MetricsLog:
+    def __init__(self, path, sample_every=1, buffer_records=1000):
+        self.path = path
+        self.sample_every = max(1, sample_every)
+        self.buffer_records = buffer_records
+        self.buffer = []
+        self.start = time.time()
+        self.file = open(path, "w")
+
+    def record(self, kind, **fields):
+        """Buffer a record (written on flush or once the buffer is full)"""
+        fields = {"kind": kind, "t": round(time.time() - self.start, 3), **fields}
+        self.buffer.append(json.dumps(fields, separators=(",", ":")))
+        if len(self.buffer) >= self.buffer_records:
+            self.flush()
+
+    def episode(self, index, kind="episode", **fields):
+        """Record episode / game number index if it is sampled"""
+        if index % self.sample_every == 0:
+            elapsed = time.time() - self.start
+            rate = (index + 1) / elapsed if elapsed > 0 else 0.0
+            self.record(kind, episode=index + 1, per_sec=round(rate, 2), **fields)
+
+    def flush(self):
+        if self.buffer:
+            self.file.write("\n".join(self.buffer) + "\n")
+            self.file.flush()
+            self.buffer = []
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read(path, kind=None):
+    """Records of a metrics log (only those of one kind, if given)"""
+    records = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                if kind is None or record["kind"] == kind:
+                    records.append(record)
+    return records
+
+
+def learning_curve(path, window=1000):
+    """
+    Rolling averages over the episode (or game) records of a log, one point
+    per window episodes: win rate of every player, draws, game length,
+    reward and throughput
+    """
+    chunks = {}
+    for r in read(path):
+        if r["kind"] in ("episode", "game"):
+            chunks.setdefault((r["episode"] - 1) // window, []).append(r)
+    points = []
+    for _, chunk in sorted(chunks.items()):
+        wins = {}
+        for r in chunk:
+            for name in r.get("winners", []):
+                wins[name] = wins.get(name, 0) + 1
+        points.append({
+            "episode": chunk[-1]["episode"],
+            "samples": len(chunk),
+            "win_rates": {name: count / len(chunk) for name, count in sorted(wins.items())},
+            "draw_rate": sum(1 for r in chunk if not r.get("winners")) / len(chunk),
+            "rounds": sum(r.get("rounds", 0) for r in chunk) / len(chunk),
+            "reward": sum(r.get("reward", 0) for r in chunk) / len(chunk),
+            "q_size": chunk[-1].get("q_size"),
+            "per_sec": chunk[-1].get("per_sec"),
+        })
+    return points
+
+
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='Learning curves from a JSONL metrics log')
+    parser.add_argument('log', help='Metrics log (logs/train_*.jsonl or logs/eval_*.jsonl)')
+    parser.add_argument('--window', type=int, default=1000, help='Episodes per curve point')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    points = learning_curve(args.log, args.window)
+    names = sorted({name for p in points for name in p["win_rates"]})
+    print(f"{'episode':>8} {'samples':>7} " + " ".join(f"{n:>9}" for n in names)
+          + f" {'draws':>6} {'rounds':>6} {'reward':>8} {'q_size':>7} {'per_sec':>8}")
+    for p in points:
+        rates = " ".join(f"{p['win_rates'].get(n, 0):>9.3f}" for n in names)
+        print(f"{p['episode']:>8} {p['samples']:>7} {rates} {p['draw_rate']:>6.3f} {p['rounds']:>6.1f} "
+              f"{p['reward']:>8.1f} {p['q_size'] if p['q_size'] is not None else '-':>7} {p['per_sec'] or 0:>8.1f}")
+    for record in read(args.log, "summary"):
+        print(f"Summary: {record}")
@@ -0,0 +1,74 @@
+"""
+Process-wide cache of loaded Q-tables.
+
+A table is read and unpickled once per process and handed out again for as
+long as the file keeps the same (path, mtime, size); a changed file is loaded
+afresh. Tables from the registry are shared, so they must be treated as
+read-only: agents built on them are frozen.
+"""
+import os
+
+import q_store
+from rl_agent import RLAgent
+from q_store import QStore
+
+# Absolute path -> ((path, mtime, size), Q-table)
+_TABLES = {}
+
+# Absolute path -> ((path, mtime, size), {epsilon: frozen RLAgent})
+_AGENTS = {}
+
+
+def model_key(path):
+    """(path, mtime, size) of a model file; (path, None, None) if it does not exist"""
+    path = os.path.abspath(path)
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return (path, None, None)
+    return (path, stat.st_mtime_ns, stat.st_size)
+
+
+def load_q_table(path):
+    """
+    Shared Q-table of a model file, loaded on first use or when the file changed
+    A missing file gives an empty table
+    """
+    key = model_key(path)
+    cached = _TABLES.get(key[0])
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    if key[1] is None:
+        table = QStore()
+    else:
+        # Binary files are mapped read-only, so all processes share the pages
+        table = q_store.load(key[0], writable=False)
+    _TABLES[key[0]] = (key, table)
+    return table
+
+
+def shared_agent(q_table_file="q_table.pkl", epsilon=0.1):
+    """
+    Frozen RLAgent over the shared table of q_table_file, one per process
+    (per model version and epsilon)
+    """
+    key = model_key(q_table_file)
+    cached = _AGENTS.get(key[0])
+    if cached is None or cached[0] != key:
+        # The agents of an older version of the file go with it
+        cached = (key, {})
+        _AGENTS[key[0]] = cached
+    agents = cached[1]
+    agent = agents.get(epsilon)
+    if agent is None:
+        agent = RLAgent(epsilon=epsilon, q_table_file=q_table_file,
+                        q_table=load_q_table(q_table_file), frozen=True)
+        agents[epsilon] = agent
+    return agent
+
+
+def clear():
+    """Drop every cached table and agent"""
+    _TABLES.clear()
+    _AGENTS.clear()
@@ -0,0 +1,161 @@
+"""
+Offline batch Q-learning over stored transitions (see transitions.py).
+
+Record transitions once (run_pipeline.py --record-transitions), then re-learn
+a Q-table from them with any alpha / gamma, for any number of epochs, without
+playing games. The update is RLAgent.learn's:
+    terminal:      Q(s,a) += alpha' * (r - Q(s,a))    (alpha' = 1.5 alpha on a win)
+    non-terminal:  Q(s,a) += alpha * (r + gamma * max Q(s',legal) - Q(s,a))
+with unset entries reading 0, applied a block of transitions at a time:
+targets use the table as it was at the start of the block, and the updates
+of a (state, action) repeated in the block compose in order, exactly as
+applying them one by one with those targets would. With a block size of 1
+this is the online update.
+"""
+import time
+import argparse
+import numpy as np
+
+import transitions
+from q_store import QStore, N_ACTIONS, load
+from rl_agent import RLAgent
+
+
+class OfflineTrainer:
+    """Dense (states x actions) Q-values over a sorted set of state IDs"""
+
+    def __init__(self, q_table=None, alpha=0.15, gamma=0.9, hu_boost=1.5, dtype=np.float64):
+        self.alpha = alpha
+        self.gamma = gamma
+        self.hu_boost = hu_boost  # Learning rate multiplier of winning terminal updates
+        if q_table is not None and q_table.n_rows:
+            n = q_table.n_rows
+            order = np.argsort(q_table.state_ids[:n], kind="stable")
+            self.state_ids = np.asarray(q_table.state_ids[:n])[order]
+            self.values = np.asarray(q_table.values[:n])[order].astype(dtype)
+            self.present = np.asarray(q_table.present[:n])[order]
+        else:
+            self.state_ids = np.zeros(0, dtype=np.int64)
+            self.values = np.zeros((0, N_ACTIONS), dtype=dtype)
+            self.present = np.zeros((0, N_ACTIONS), dtype=bool)
+
+    def add_states(self, state_ids):
+        """Give every state ID a row (new rows start unset)"""
+        new = np.setdiff1d(np.unique(state_ids), self.state_ids)
+        if not len(new):
+            return
+        state_ids = np.concatenate([self.state_ids, new.astype(np.int64)])
+        order = np.argsort(state_ids, kind="stable")
+        old = order < len(self.state_ids)
+        values = np.zeros((len(state_ids), N_ACTIONS), dtype=self.values.dtype)
+        present = np.zeros((len(state_ids), N_ACTIONS), dtype=bool)
+        values[old] = self.values[order[old]]
+        present[old] = self.present[order[old]]
+        self.state_ids, self.values, self.present = state_ids[order], values, present
+
+    def prepare(self, paths, block_records=65536):
+        """Add a row for every state the files update; returns the transition count"""
+        total = 0
+        for block in transitions.iter_blocks(paths, block_records):
+            self.add_states(block["state"])
+            total += len(block)
+        return total
+
+    def _rows(self, state_ids):
+        """Rows of state IDs and whether each has one"""
+        rows = np.searchsorted(self.state_ids, state_ids)
+        rows = np.minimum(rows, max(len(self.state_ids) - 1, 0))
+        found = self.state_ids[rows] == state_ids if len(self.state_ids) else np.zeros(len(rows), dtype=bool)
+        return rows, found
+
+    def sweep(self, block):
+        """
+        Apply a block of transition records (every state must have a row, see
+        prepare); returns the mean absolute TD error of the block
+        """
+        rows, found = self._rows(block["state"])
+        if not found.all():
+            raise KeyError("Transition states without a row: call prepare() first")
+        actions = block["action"].astype(np.int64)
+        terminal = (block["flags"] & transitions.TERMINAL) != 0
+        boosted = terminal & ((block["flags"] & transitions.HU) != 0)
+
+        # Targets from the table as it stands
+        targets = block["reward"].copy()
+        live = np.flatnonzero(~terminal)
+        if len(live):
+            next_rows, next_found = self._rows(block["next_state"][live])
+            next_q = np.where(self.present[next_rows], self.values[next_rows], 0).astype(np.float64)
+            next_q[~next_found] = 0
+            legal = transitions.unpack_masks(block["next_mask"][live])
+            best = np.where(legal, next_q, -np.inf).max(axis=1)
+            best[~legal.any(axis=1)] = 0  # No next actions: max_value is 0
+            targets[live] += self.gamma * best
+
+        # Group the updates of each (state, action), keeping their order
+        keys = rows * N_ACTIONS + actions
+        order = np.argsort(keys, kind="stable")
+        keys, targets, boosted = keys[order], targets[order], boosted[order]
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        ends = np.r_[starts[1:], len(keys)] - 1  # Last update of each group
+        group = np.repeat(np.arange(len(starts)), np.diff(np.r_[starts, len(keys)]))
+
+        # Q after k updates: prod(1 - a_j) q0 + sum_i a_i t_i prod_{j > i}(1 - a_j)
+        alpha, hu_alpha = self.alpha, self.alpha * self.hu_boost
+        rates = np.where(boosted, hu_alpha, alpha)
+        boosted_seen = np.cumsum(boosted)
+        boosted_after = boosted_seen[ends][group] - boosted_seen
+        plain_after = (ends[group] - np.arange(len(keys))) - boosted_after
+        weights = rates * (1 - alpha) ** plain_after * (1 - hu_alpha) ** boosted_after
+        boosted_total = boosted_seen[ends] - np.r_[0, boosted_seen[ends[:-1]]]
+        plain_total = (ends - starts + 1) - boosted_total
+        decay = (1 - alpha) ** plain_total * (1 - hu_alpha) ** boosted_total
+
+        group_rows, group_actions = np.divmod(keys[starts], N_ACTIONS)
+        current = np.where(self.present[group_rows, group_actions],
+                           self.values[group_rows, group_actions], 0).astype(np.float64)
+        self.values[group_rows, group_actions] = decay * current + np.add.reduceat(weights * targets, starts)
+        self.present[group_rows, group_actions] = True
+        return float(np.abs(targets - current[group]).mean())
+
+    def train(self, paths, epochs=1, block_records=65536, quiet=False):
+        """Sweep the files epochs times; returns the mean absolute TD error per epoch"""
+        total = self.prepare(paths, block_records)
+        errors = []
+        for epoch in range(epochs):
+            start = time.time()
+            error = 0.0
+            for block in transitions.iter_blocks(paths, block_records):
+                error += self.sweep(block) * len(block)
+            errors.append(error / max(total, 1))
+            if not quiet:
+                elapsed = time.time() - start
+                print(f"Epoch {epoch + 1}/{epochs}: {total} transitions, mean |TD| {errors[-1]:.4f}, "
+                      f"{total / max(elapsed, 1e-9):,.0f} transitions/s")
+        return errors
+
+    def q_table(self):
+        """The learned values as a QStore (sharing the trainer's arrays)"""
+        return QStore.from_arrays(self.state_ids, self.values, self.present)
+
+
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='Learn a Q-table offline from stored transitions')
+    parser.add_argument('files', nargs='+', help='Transition files (transitions/*.mjt)')
+    parser.add_argument('--out', default='models/q_table_offline.pkl',
+                        help='Q-table to write (.pkl, or .qtab for the binary format)')
+    parser.add_argument('--init', default=None, help='Start from this Q-table instead of an empty one')
+    parser.add_argument('--alpha', type=float, default=0.15, help='Learning rate')
+    parser.add_argument('--gamma', type=float, default=0.9, help='Discount factor')
+    parser.add_argument('--epochs', type=int, default=1, help='Sweeps over the transitions')
+    parser.add_argument('--block', type=int, default=65536, help='Transitions per vectorized update')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    trainer = OfflineTrainer(load(args.init) if args.init else None, alpha=args.alpha, gamma=args.gamma)
+    print(f"Learning from {len(args.files)} files, alpha={args.alpha}, gamma={args.gamma}, block={args.block}")
+    trainer.train(args.files, args.epochs, args.block)
+    RLAgent(q_table=trainer.q_table(), q_table_file=args.out).save_q_table()
@@ -0,0 +1,95 @@
+"""
+Opt-in per-phase timing of MahjongGame.play_game (both game modules).
+
+play_game reads ACTIVE once per game; while it is None (the default) every
+phase costs one local truth test. With enable(), each phase of a turn adds its
+perf_counter time and a call to the totals of (phase, player type), where the
+player type is "rl" for players driven by an RL agent and "baseline" for the
+rest:
+    draw         drawing the tile (game_1AI: including the AI's peek)
+    self_hu      the win check after drawing
+    discard      choosing and making a discard
+    reward       calculate_reward of a discard
+    opponent_hu  scanning the other players for a win on the discard
+                 (counted for the discarder)
+    peng         peng decisions and peng rewards (counted for the player who
+                 pengs, else the discarder)
+    q_update     get_state + update_q_table (and the win reward)
+"""
+from time import perf_counter
+
+PHASES = ("draw", "self_hu", "discard", "reward", "opponent_hu", "peng", "q_update")
+
+
+class PhaseTimer:
+    def __init__(self):
+        self.totals = {}  # (phase, player type) -> [seconds, calls]
+        self.games = 0
+
+    def lap(self, phase, player, start):
+        """
+        Add the time since start to a phase of the player's type
+        Returns the start of the next phase (after this bookkeeping)
+        """
+        elapsed = perf_counter() - start
+        key = (phase, "rl" if player.rl_agent else "baseline")
+        entry = self.totals.get(key)
+        if entry is None:
+            entry = self.totals[key] = [0.0, 0]
+        entry[0] += elapsed
+        entry[1] += 1
+        return perf_counter()
+
+    def merge(self, totals, games):
+        """Add the totals of another timer (e.g. from a worker process)"""
+        for key, (seconds, calls) in totals.items():
+            entry = self.totals.setdefault(key, [0.0, 0])
+            entry[0] += seconds
+            entry[1] += calls
+        self.games += games
+
+    def clear(self):
+        self.totals = {}
+        self.games = 0
+
+    def table(self):
+        """The totals as a text table, by phase then player type"""
+        timed = sum(seconds for seconds, _ in self.totals.values()) or 1.0
+        lines = [f"Phase timings over {self.games} games ({timed:.2f}s timed):",
+                 f"{'phase':<12} {'player':<9} {'calls':>10} {'total s':>9} {'avg us':>9} {'share':>7}"]
+        for phase in PHASES:
+            for kind in ("rl", "baseline"):
+                if (phase, kind) in self.totals:
+                    seconds, calls = self.totals[(phase, kind)]
+                    lines.append(f"{phase:<12} {kind:<9} {calls:>10,} {seconds:>9.3f} "
+                                 f"{seconds / calls * 1e6:>9.1f} {seconds / timed:>7.1%}")
+        return "\n".join(lines)
+
+
+# Timer of the running process, None while timing is off
+ACTIVE = None
+
+
+def enable():
+    """Turn timing on (keeping totals collected so far) and return the timer"""
+    global ACTIVE
+    if ACTIVE is None:
+        ACTIVE = PhaseTimer()
+    return ACTIVE
+
+
+def disable():
+    global ACTIVE
+    ACTIVE = None
+
+
+def collect():
+    """
+    (totals, games) collected since the last call, then cleared, for
+    shipping from a worker process to the parent; None while timing is off
+    """
+    if ACTIVE is None:
+        return None
+    totals, games = ACTIVE.totals, ACTIVE.games
+    ACTIVE.clear()
+    return totals, games
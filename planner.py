@@ -0,0 +1,222 @@
+"""
+Determinized Monte Carlo rollout planning of discards.
+
+For a player about to discard, RolloutPlanner
+  1. samples worlds: the tiles the player cannot see (4 copies of each tile,
+     less its hand and everything showing on the table) shuffled into the
+     opponents' concealed hands, at their current sizes, and the deck;
+  2. plays every candidate discard out in every world (the same worlds for
+     all candidates) on batch_sim tables, everyone following the batched
+     heuristic policy from then on;
+  3. picks the candidate with the best mean outcome for the player: the
+     score of its win (Player.calculate_score), minus the score of a win it
+     pays for (another player's Hu on its discard, or on a self-draw), 0 for
+     any other ending. Ties go to the higher win rate.
+Rollouts run in batches of worlds until the rollout budget (worlds x
+candidates) or the time budget of the move is used up, at least one batch per
+move. With workers > 1 each round of batches is spread over a process pool.
+The rollouts follow the game_4AI rules (batch_sim), in either game.
+
+Setting RLAgent.planner makes the agent take its exploitation discards from
+the planner (evaluate_ai.py --plan-rollouts / --plan-time).
+"""
+import time
+import argparse
+import multiprocessing
+import numpy as np
+
+from batch_sim import BatchMahjong
+from tiles import tile_name
+
+
+def position(player, game, candidates):
+    """
+    What the player knows of the game (game_4AI / game_1AI objects), as the
+    arrays play_worlds needs
+    """
+    seat = game.players.index(player)
+    exposed = np.zeros((4, 27), dtype=np.int8)
+    for i, other in enumerate(game.players):
+        for exposed_set in other.exposed_sets:
+            exposed[i, exposed_set[0]] += len(exposed_set)
+    hand = np.array(player.hand.counts, dtype=np.int8)
+    hidden = 4 - np.array(game.visible, dtype=np.int64) - hand
+    return {
+        "seat": seat,
+        "hand": hand,
+        "sizes": np.array([0 if other is player else other.hand.size for other in game.players]),
+        "hidden": np.repeat(np.arange(27), hidden),  # Tiles the player cannot see
+        "exposed": exposed,
+        "melds": np.array([len(other.exposed_sets) for other in game.players], dtype=np.int8),
+        "banned": np.array([other.banned_suit for other in game.players]),  # Declared after the deal
+        "discards": np.bincount(np.array(game.discards, dtype=np.int64), minlength=27).astype(np.int8),
+        "deck_size": len(game.deck),
+        "rounds": game.current_round,
+        "candidates": np.array(candidates, dtype=np.int64),
+    }
+
+
+def play_worlds(position, worlds, seed, peng_prob=0.8):
+    """
+    Sample worlds of a position and play each candidate out in every one
+    Returns (value, wins, deal-ins) summed over the worlds, one row per candidate
+    """
+    rng = np.random.default_rng(seed)
+    seat, candidates, top = position["seat"], position["candidates"], position["deck_size"]
+    k = len(candidates)
+
+    # Deal the hidden tiles: the opponents' hands in seat order, then the deck
+    hidden = position["hidden"]
+    shuffled = hidden[np.argsort(rng.random((worlds, len(hidden))), axis=1)]
+    owners = np.repeat(np.arange(4), position["sizes"])
+    dealt = len(owners)
+    flat = (np.arange(worlds)[:, None] * 4 + owners[None, :]) * 27 + shuffled[:, :dealt]
+    hands = np.bincount(flat.ravel(), minlength=worlds * 4 * 27).reshape(worlds, 4, 27).astype(np.int8)
+    hands[:, seat] = position["hand"]
+
+    # Table c * worlds + w plays candidate c in world w
+    sim = BatchMahjong(k * worlds, seed=rng.integers(1 << 63), peng_prob=peng_prob, deal=False)
+    sim.hands[:] = np.tile(hands, (k, 1, 1))
+    sim.deck[:, :top] = np.tile(shuffled[:, dealt:dealt + top], (k, 1))
+    sim.top[:] = top
+    sim.exposed[:] = position["exposed"]
+    sim.melds[:] = position["melds"]
+    sim.banned[:] = position["banned"]
+    sim.discards[:] = position["discards"]
+    sim.rounds[:] = position["rounds"]
+    sim.current[:] = seat
+
+    tables = np.arange(k * worlds)
+    seats = np.full(k * worlds, seat)
+    tiles = np.repeat(candidates, worlds)
+    sim.hands[tables, seats, tiles] -= 1
+    sim.discards[tables, tiles] += 1
+    sim.last_discard[:] = tiles
+    sim.resolve_discards(tables, seats, tiles)
+    sim.play()
+
+    scores = sim.scores()
+    won = sim.winner == seat
+    pays = (sim.loser == seat) | ((sim.winner >= 0) & ~won & sim.zimo)
+    value = np.where(won, scores, 0) - np.where(pays, scores, 0)
+    return np.stack([
+        value.reshape(k, worlds).sum(axis=1),
+        won.reshape(k, worlds).sum(axis=1),
+        (sim.loser == seat).reshape(k, worlds).sum(axis=1),
+    ], axis=1)
+
+
+def _play_worlds_task(task):
+    return play_worlds(*task)
+
+
+class RolloutPlanner:
+    def __init__(self, rollouts=2048, time_budget=None, batch_worlds=128, workers=1, peng_prob=0.8, seed=None):
+        """
+        rollouts: rollout budget per move (None for no limit; time_budget must be set then)
+        time_budget: seconds per move (None for no limit)
+        batch_worlds: worlds sampled per batch (each played once per candidate)
+        workers: processes playing the batches (1 = in this process)
+        """
+        if rollouts is None and time_budget is None:
+            raise ValueError("RolloutPlanner needs a rollout or a time budget")
+        self.rollouts = rollouts
+        self.time_budget = time_budget
+        self.batch_worlds = batch_worlds
+        self.workers = workers
+        self.peng_prob = peng_prob
+        self.rng = np.random.default_rng(seed)
+        self.pool = None
+
+    def __getstate__(self):
+        # The pool stays with the process that started it
+        state = self.__dict__.copy()
+        state["pool"] = None
+        return state
+
+    def seed(self, seed):
+        """Draw the rollouts from a fresh stream"""
+        self.rng = np.random.default_rng(seed)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def evaluate(self, player, game, candidates):
+        """
+        Rollout statistics of discarding each candidate tile
+        Returns a dict of per-candidate arrays (value, win_rate, deal_in_rate),
+        the candidates and the worlds played
+        """
+        start = time.perf_counter()
+        target = position(player, game, candidates)
+        k = len(candidates)
+        max_worlds = max(1, self.rollouts // k) if self.rollouts is not None else None
+        if self.workers > 1 and self.pool is None:
+            self.pool = multiprocessing.Pool(self.workers)
+
+        totals = np.zeros((k, 3))
+        worlds = 0
+        while True:
+            # One batch per worker, within the rollout budget
+            sizes = []
+            for _ in range(self.workers):
+                size = self.batch_worlds if max_worlds is None else min(self.batch_worlds, max_worlds - worlds - sum(sizes))
+                if size > 0:
+                    sizes.append(size)
+            tasks = [(target, size, self.rng.integers(1 << 63), self.peng_prob) for size in sizes]
+            if self.pool is not None and len(tasks) > 1:
+                results = self.pool.map(_play_worlds_task, tasks)
+            else:
+                results = [play_worlds(*task) for task in tasks]
+            for result in results:
+                totals += result
+            worlds += sum(sizes)
+            if max_worlds is not None and worlds >= max_worlds:
+                break
+            if self.time_budget is not None and time.perf_counter() - start >= self.time_budget:
+                break
+
+        value, win_rate, deal_in_rate = (totals / worlds).T
+        return {"candidates": list(candidates), "value": value, "win_rate": win_rate,
+                "deal_in_rate": deal_in_rate, "worlds": worlds}
+
+    def choose_discard(self, player, game, candidates):
+        """The candidate tile with the best rollout value (ties: higher win rate, then lower tile)"""
+        if len(candidates) == 1:
+            return candidates[0]
+        stats = self.evaluate(player, game, candidates)
+        best = max(range(len(candidates)), key=lambda i: (stats["value"][i], stats["win_rate"][i], -candidates[i]))
+        return candidates[best]
+
+
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='Rollout-plan the discards of sample mid-game positions')
+    parser.add_argument('--positions', type=int, default=5, help='Positions to plan')
+    parser.add_argument('--rollouts', type=int, default=2048, help='Rollout budget per move')
+    parser.add_argument('--time', type=float, default=None, help='Time budget per move (seconds)')
+    parser.add_argument('--workers', type=int, default=1, help='Rollout processes')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the positions and the rollouts')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    import benchmark
+
+    args = parse_arguments()
+    planner = RolloutPlanner(rollouts=args.rollouts, time_budget=args.time, workers=args.workers, seed=args.seed)
+    for game, player, _ in benchmark.position_corpus(args.positions, seed=args.seed):
+        candidates = player.hand.distinct()
+        start = time.perf_counter()
+        stats = planner.evaluate(player, game, candidates)
+        elapsed = time.perf_counter() - start
+        rollouts = stats["worlds"] * len(candidates)
+        print(f"{player.name}, deck {len(game.deck)}: {rollouts} rollouts in {elapsed:.2f}s "
+              f"({rollouts / elapsed:,.0f}/s)")
+        for i in np.argsort(-stats["value"], kind="stable")[:3]:
+            print(f"  {tile_name(candidates[i]):>3}  value {stats['value'][i]:+.3f}  "
+                  f"win {stats['win_rate'][i]:.1%}  deal-in {stats['deal_in_rate'][i]:.1%}")
+    planner.close()
@@ -0,0 +1,456 @@
+"""
+Array-backed Q-table.
+
+States from RLAgent.get_state are encoded to a mixed-radix integer (one digit
+per field) and actions to an ID 0..81:
+    discard tile -> tile, peng tile -> 27 + tile, gang tile -> 54 + tile, hu -> 81
+Each state seen gets a row of a float64 matrix with one column per action ID,
+plus a mask telling which (state, action) pairs hold a value, so a missing
+entry still reads as the dict default of 0 and the store converts to and from
+the old {(state, action): value} pickle format exactly. float32 stores (half
+the memory, values rounded) are opt-in.
+
+The binary format (save_binary / load_binary) is a 64-byte header followed by
+the state IDs (sorted), the values and the mask, each 64-byte aligned. It is
+opened with numpy.memmap, so loading does not depend on the table size and
+processes mapping the same file share its pages. A mapped store that has not
+been written to pickles as its file, so a store sent to a pool process is
+mapped there again instead of copied.
+"""
+import os
+import pickle
+import struct
+import numpy as np
+
+from tiles import tile_id
+
+# Upper bound + 1 of every get_state field
+STATE_RADICES = (4, 3, 4, 4, 4, 4, 2, 2, 2, 3, 6)
+N_STATES = int(np.prod(STATE_RADICES))
+
+ACTION_TYPES = ("discard", "peng", "gang")
+PENG_ACTIONS = 27  # First action ID of each type
+GANG_ACTIONS = 54
+HU_ACTION = 81
+N_ACTIONS = 82
+MASK_BYTES = (N_ACTIONS + 7) // 8  # Bytes of an action bitmask
+TILE_BITS = (1 << 27) - 1  # One bit per tile (the discard action IDs)
+SUIT_BITS = [0b111111111 << (9 * suit) for suit in range(3)]  # Tile bits of each suit
+
+
+def encode_state(state):
+    """Mixed-radix integer of a get_state tuple"""
+    code = 0
+    for value, radix in zip(state, STATE_RADICES):
+        code = code * radix + value
+    return code
+
+
+def decode_state(code):
+    """get_state tuple of an encoded state"""
+    state = []
+    for radix in reversed(STATE_RADICES):
+        code, value = divmod(code, radix)
+        state.append(value)
+    return tuple(reversed(state))
+
+
+def action_id(action):
+    """Action ID of ("discard" | "peng" | "gang", tile) or ("hu", None)"""
+    action_type, tile = action
+    if action_type == "hu":
+        return HU_ACTION
+    return ACTION_TYPES.index(action_type) * 27 + tile
+
+
+def action_of(action_id):
+    """(action type, tile) of an action ID"""
+    if action_id == HU_ACTION:
+        return ("hu", None)
+    return (ACTION_TYPES[action_id // 27], action_id % 27)
+
+
+# Action IDs of every action tuple, for quick lookups
+ACTION_IDS = {action_of(i): i for i in range(N_ACTIONS)}
+ACTIONS = [action_of(i) for i in range(N_ACTIONS)]
+
+
+def legal_mask(hand, banned_suit, last_discard=None, can_hu=False):
+    """
+    Bitmask over action IDs (bit i = action ID i) of the legal actions of a
+    tiles.Hand: discarding any tile held, peng of the last discard (a pair
+    in hand, not of the banned suit), gang of any quad not of the banned
+    suit, and hu if can_hu
+    """
+    mask = hand.held
+    banned = SUIT_BITS[banned_suit] if banned_suit is not None else 0
+    if last_discard is not None and hand.counts[last_discard] >= 2 and not banned >> last_discard & 1:
+        mask |= 1 << (PENG_ACTIONS + last_discard)
+    if hand.quads:
+        mask |= (hand.quads & ~banned) << GANG_ACTIONS
+    if can_hu:
+        mask |= 1 << HU_ACTION
+    return mask
+
+
+def mask_ids(mask):
+    """Action IDs of the bits set in a mask, in increasing order"""
+    ids = []
+    while mask:
+        low = mask & -mask
+        ids.append(low.bit_length() - 1)
+        mask ^= low
+    return ids
+
+
+def mask_array(mask):
+    """Boolean array (N_ACTIONS,) of a mask"""
+    return np.unpackbits(np.frombuffer(mask.to_bytes(MASK_BYTES, "little"), dtype=np.uint8),
+                         count=N_ACTIONS, bitorder="little").astype(bool)
+
+# Binary format: magic, version, actions, value item size, rows, entries
+BINARY_SUFFIX = ".qtab"
+MAGIC = b"MJQT"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sIIIQQ")
+HEADER_SIZE = 64
+VALUE_TYPES = {4: np.float32, 8: np.float64}
+
+
+class QStore:
+    """
+    Q-table with the dict interface RLAgent uses (get, [], in, len, items),
+    backed by a (states seen x N_ACTIONS) matrix
+    """
+
+    def __init__(self, capacity=1024, dtype=np.float64):
+        self.values = np.zeros((capacity, N_ACTIONS), dtype=dtype)
+        self.present = np.zeros((capacity, N_ACTIONS), dtype=bool)
+        self.state_ids = np.zeros(capacity, dtype=np.int64)  # Encoded state of each row
+        self.rows = {}  # State tuple -> row (a cache for the sorted rows of a loaded file)
+        self.n_rows = 0
+        self.entries = 0
+        self.sorted_rows = 0  # Rows [0, sorted_rows) are sorted by state ID (loaded from a file)
+        self.absent = set()  # States known not to be in the sorted rows
+        self.changed = None  # Set of row * N_ACTIONS + action IDs written, when tracking changes
+        self.source = None  # (path, mode, file key) of the file mapped, while the store still matches it
+
+    def _find_row(self, state):
+        row = self.rows.get(state)
+        if row is None and self.sorted_rows and state not in self.absent:
+            code = encode_state(state)
+            i = int(np.searchsorted(self.state_ids[:self.sorted_rows], code))
+            if i < self.sorted_rows and self.state_ids[i] == code:
+                row = self.rows[state] = i
+            else:
+                self.absent.add(state)
+        return row
+
+    def _add_row(self, state):
+        row = self.n_rows
+        if row == len(self.values):
+            # Grow by doubling
+            capacity = max(1024, 2 * len(self.values))
+            for name in ("values", "present", "state_ids"):
+                old = getattr(self, name)
+                new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+                new[:row] = old
+                setattr(self, name, new)
+        self.rows[state] = row
+        self.absent.discard(state)
+        self.state_ids[row] = encode_state(state)
+        self.n_rows += 1
+        return row
+
+    def get(self, key, default=0):
+        state, action = key
+        row = self._find_row(state)
+        if row is None:
+            return default
+        a = ACTION_IDS[action]
+        if not self.present.item(row, a):
+            return default
+        return self.values.item(row, a)
+
+    def __getitem__(self, key):
+        value = self.get(key, None)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        state, action = key
+        if self.source is not None:
+            self.source = None  # No longer what the file holds
+        row = self._find_row(state)
+        if row is None:
+            row = self._add_row(state)
+        a = ACTION_IDS[action]
+        if not self.present.item(row, a):
+            self.present[row, a] = True
+            self.entries += 1
+        self.values[row, a] = value
+        if self.changed is not None:
+            self.changed.add(row * N_ACTIONS + a)
+
+    def __contains__(self, key):
+        state, action = key
+        row = self._find_row(state)
+        return row is not None and self.present.item(row, ACTION_IDS[action])
+
+    def __len__(self):
+        return self.entries
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def items(self):
+        n = self.n_rows
+        states = [decode_state(code) for code in self.state_ids[:n].tolist()]
+        actions = [action_of(a) for a in range(N_ACTIONS)]
+        rows, cols = np.nonzero(self.present[:n])
+        values = self.values[rows, cols].tolist()
+        for row, a, value in zip(rows.tolist(), cols.tolist(), values):
+            yield (states[row], actions[a]), value
+
+    def keys(self):
+        return [key for key, _ in self.items()]
+
+    def row_values(self, state):
+        """Q-values of every action ID in a state (0 where unset)"""
+        row = self._find_row(state)
+        if row is None:
+            return np.zeros(N_ACTIONS, dtype=self.values.dtype)
+        return np.where(self.present[row], self.values[row], 0)
+
+    def max_value(self, state, mask):
+        """Largest Q-value among the actions of a legal_mask in a state (0 if there are none)"""
+        if not mask:
+            return 0
+        row = self._find_row(state)
+        if row is None:
+            return 0.0
+        legal = mask_array(mask)
+        return float(np.where(self.present[row], self.values[row], 0)[legal].max())
+
+    def rows_of(self, states):
+        """Row of every state, -1 for states without one"""
+        rows = [self._find_row(state) for state in states]
+        return np.array([-1 if row is None else row for row in rows], dtype=np.int64)
+
+    def best_actions(self, states, masks):
+        """
+        Vectorized argmax: for every state, the legal action ID (mask row True)
+        with the highest Q-value, unset entries counting as 0
+        Returns (action IDs, values)
+        """
+        rows = self.rows_of(states)
+        known = rows >= 0
+        values = np.zeros((len(states), N_ACTIONS), dtype=self.values.dtype)
+        values[known] = np.where(self.present[rows[known]], self.values[rows[known]], 0)
+        values = np.where(masks, values, -np.inf)
+        best = values.argmax(axis=1)
+        return best, values[np.arange(len(states)), best]
+
+    def snapshot(self):
+        """Independent copy of the rows in use (the copy does not track changes)"""
+        n = self.n_rows
+        copy = QStore.__new__(QStore)
+        copy.values = self.values[:n].copy()
+        copy.present = self.present[:n].copy()
+        copy.state_ids = self.state_ids[:n].copy()
+        copy.rows = dict(self.rows)
+        copy.n_rows = n
+        copy.entries = self.entries
+        copy.sorted_rows = self.sorted_rows
+        copy.absent = set(self.absent)
+        copy.changed = None
+        copy.source = None
+        return copy
+
+    def nbytes(self):
+        """Bytes held by the arrays"""
+        return self.values.nbytes + self.present.nbytes + self.state_ids.nbytes
+
+    def to_dict(self):
+        """The {(state, (action type, tile)): value} dict of the pickle format"""
+        return dict(self.items())
+
+    @classmethod
+    def from_dict(cls, q_table, dtype=np.float64):
+        """
+        Store holding every entry of a pickle-format dict
+        Keys and values round-trip exactly (values are rounded with dtype=np.float32)
+        """
+        store = cls(capacity=max(1024, len({state for state, _ in q_table})), dtype=dtype)
+        for key, value in q_table.items():
+            store[key] = value
+        return store
+
+    @classmethod
+    def from_arrays(cls, state_ids, values, present):
+        """Store over rows already sorted by state ID (the arrays are used, not copied)"""
+        store = cls(capacity=0, dtype=values.dtype)
+        store.state_ids = state_ids
+        store.values = values
+        store.present = present
+        store.n_rows = store.sorted_rows = len(state_ids)
+        store.entries = int(present.sum())
+        return store
+
+    def __getstate__(self):
+        # A store still matching the file it maps pickles as the file
+        if self.source is not None and _file_key(self.source[0]) == self.source[2]:
+            return {"source": self.source}
+        # Else only the rows in use
+        n = self.n_rows
+        return {
+            "values": self.values[:n],
+            "present": self.present[:n],
+            "state_ids": self.state_ids[:n],
+            "entries": self.entries,
+        }
+
+    def __setstate__(self, data):
+        if "source" in data:
+            path, mode, key = data["source"]
+            if _file_key(path) != key:
+                raise ValueError(f"{path} changed since its Q-table was pickled")
+            self.__dict__.update(load_binary(path, writable=mode == "c").__dict__)
+            return
+        self.values = data["values"].copy()
+        self.present = data["present"].copy()
+        self.state_ids = data["state_ids"].copy()
+        self.entries = data["entries"]
+        self.n_rows = len(self.state_ids)
+        self.rows = {decode_state(int(code)): row for row, code in enumerate(self.state_ids)}
+        self.sorted_rows = 0
+        self.absent = set()
+        self.changed = None
+        self.source = None
+
+
+def _file_key(path):
+    """(inode, mtime, size) of a file, None if it does not exist"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+def _aligned(offset):
+    return (offset + 63) // 64 * 64
+
+
+def _layout(n_rows, itemsize):
+    """Offsets of the state IDs, values and mask, and the file size"""
+    ids = HEADER_SIZE
+    values = _aligned(ids + 8 * n_rows)
+    present = _aligned(values + itemsize * n_rows * N_ACTIONS)
+    return ids, values, present, present + n_rows * N_ACTIONS
+
+
+def binary_size(store):
+    """Size of a store's binary file"""
+    return _layout(store.n_rows, store.values.dtype.itemsize)[3]
+
+
+def save_binary(store, path):
+    """
+    Write a QStore in the memory-mappable binary format (rows sorted by state ID)
+    The file is written next to path and renamed over it, so processes that
+    still map the old file keep reading it safely
+    """
+    n = store.n_rows
+    order = np.argsort(store.state_ids[:n], kind="stable")
+    itemsize = store.values.dtype.itemsize
+    ids, values, present, size = _layout(n, itemsize)
+    
+    os.makedirs(os.path.dirname(path) if os.path.dirname(path) else '.', exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, N_ACTIONS, itemsize, n, store.entries).ljust(HEADER_SIZE, b"\0"))
+        for offset, array in ((ids, store.state_ids[:n][order]),
+                              (values, store.values[:n][order]),
+                              (present, store.present[:n][order])):
+            f.write(b"\0" * (offset - f.tell()))
+            f.write(np.ascontiguousarray(array).tobytes())
+        f.truncate(size)
+    os.replace(tmp_path, path)
+
+
+def load_binary(path, writable=False):
+    """
+    QStore mapped from a binary file without reading it
+    Read-only by default (pages shared between processes); writable stores are
+    copy-on-write, so changes stay in memory until saved
+    """
+    path = os.path.abspath(path)
+    with open(path, "rb") as f:
+        magic, version, n_actions, itemsize, n, entries = HEADER.unpack(f.read(HEADER.size))
+    if magic != MAGIC or version != FORMAT_VERSION or n_actions != N_ACTIONS:
+        raise ValueError(f"{path} is not a Q-table file")
+    
+    store = QStore(capacity=0 if n else 1024, dtype=VALUE_TYPES[itemsize])
+    if not n:
+        return store
+    
+    mode = "c" if writable else "r"
+    ids, values, present, _ = _layout(n, itemsize)
+    store.state_ids = np.memmap(path, dtype=np.int64, mode=mode, offset=ids, shape=(n,))
+    store.values = np.memmap(path, dtype=VALUE_TYPES[itemsize], mode=mode, offset=values, shape=(n, N_ACTIONS))
+    store.present = np.memmap(path, dtype=bool, mode=mode, offset=present, shape=(n, N_ACTIONS))
+    store.n_rows = store.sorted_rows = n
+    store.entries = entries
+    store.source = (path, mode, _file_key(path))
+    return store
+
+
+def is_binary(path):
+    """True if path holds the binary format (rather than a pickle)"""
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def save(store, path):
+    """
+    Write a QStore to a model file: the binary format for .qtab paths, else
+    the pickle format (written next to path, then renamed over it)
+    """
+    if path.endswith(BINARY_SUFFIX):
+        save_binary(store, path)
+        return
+    os.makedirs(os.path.dirname(path) if os.path.dirname(path) else '.', exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(store.to_dict(), f)
+    os.replace(tmp_path, path)
+
+
+def with_tile_ids(q_table):
+    """
+    Convert Q-table keys written with tile strings (("discard", "5W")) to tile IDs
+    Tables already keyed by tile IDs are returned unchanged
+    """
+    if not any(isinstance(action[1], str) for _, action in q_table):
+        return q_table
+    
+    converted = {}
+    for (state, (action_type, tile)), value in q_table.items():
+        if isinstance(tile, str):
+            tile = tile_id(tile)
+        converted[(state, (action_type, tile))] = value
+    return converted
+
+
+def load(path, writable=True, dtype=np.float64):
+    """
+    QStore of a model file in either format (binary files are memory-mapped,
+    pickles are read into a store of the given dtype)
+    Raises FileNotFoundError if it does not exist
+    """
+    if is_binary(path):
+        return load_binary(path, writable)
+    with open(path, "rb") as f:
+        return QStore.from_dict(with_tile_ids(pickle.load(f)), dtype=dtype)
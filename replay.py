@@ -0,0 +1,292 @@
+"""
+Compact binary game replays.
+
+A ReplayRecorder attached to a MahjongGame (either module) logs the deck the
+game is dealt from and every event of the game as a fixed-width 16-bit word:
+    bits 9-12 event type, bits 7-8 seat, bits 5-6 argument, bits 0-4 tile
+(NO_TILE when the event has none). Seats are the players' positions in
+game.players when the game starts (seat i is "Player i+1"). The events:
+    DRAW      seat drew tile from the wall
+    RETURN    seat put tile back on the wall (game_1AI deal / peek)
+    SHUFFLE   the wall was reshuffled
+    EXCHANGE  seat gave tile to seat arg (exchange three)
+    BANNED    seat's banned suit is arg
+    DISCARD   seat discarded tile
+    PENG      seat penged tile from seat arg
+    GANG      seat declared a gang of tile
+    HU        seat won on tile from seat arg (arg == seat: self-drawn)
+
+Games are written in chunk files (chunk_<first game>.mjr): a header, then the
+game records, zlib-compressed. A game record is its header (game index, event
+count, deck size, AI seats, rounds), the deck as tile bytes and the events.
+
+The replayer rebuilds the hands, exposed sets, discards, banned suits and
+wall of any game after any number of events, from the events alone.
+"""
+import os
+import glob
+import zlib
+import struct
+import argparse
+from array import array
+import numpy as np
+
+from tiles import tile_names
+
+DRAW, RETURN, SHUFFLE, EXCHANGE, BANNED, DISCARD, PENG, GANG, HU = range(1, 10)
+EVENT_NAMES = {DRAW: "draw", RETURN: "return", SHUFFLE: "shuffle", EXCHANGE: "exchange", BANNED: "banned",
+               DISCARD: "discard", PENG: "peng", GANG: "gang", HU: "hu"}
+NO_TILE = 31
+
+CHUNK_MAGIC = b"MJRP"
+FORMAT_VERSION = 1
+CHUNK_HEADER = struct.Struct("<4sHHI")  # magic, version, flags, games
+GAME_HEADER = struct.Struct("<IIBBH")  # game index, events, deck size, AI seat mask, rounds
+COMPRESSED = 1
+
+
+def encode(kind, seat, tile=NO_TILE, arg=0):
+    return (kind << 9) | (seat << 7) | (arg << 5) | tile
+
+
+class ReplayRecorder:
+    """
+    Records the games played with it into chunk files of up to chunk_games
+    games in a directory
+    Set game_index before a game to number it (it counts up by itself)
+    """
+
+    def __init__(self, directory="replays", chunk_games=1000, compress=True):
+        self.directory = directory
+        self.chunk_games = chunk_games
+        self.compress = compress
+        self.game_index = 0
+        self.seats = {}  # Player -> seat of the game being recorded
+        self.events = array("H")
+        self.deck = b""
+        self.ai_mask = 0
+        self.games = []  # Records of the chunk being filled
+        self.first_index = None
+        os.makedirs(directory, exist_ok=True)
+
+    def start(self, game):
+        """Begin recording a game about to be dealt"""
+        self.seats = {player: seat for seat, player in enumerate(game.players)}
+        self.ai_mask = sum(1 << seat for seat, player in enumerate(game.players) if player.is_ai)
+        self.deck = bytes(game.deck)
+        self.events = array("H")
+
+    def draw(self, player, tiles):
+        seat = self.seats[player] << 7
+        self.events.extend((DRAW << 9) | seat | tile for tile in tiles)
+
+    def put_back(self, player, tile):
+        self.events.append(encode(RETURN, self.seats[player], tile))
+
+    def shuffle(self):
+        self.events.append(encode(SHUFFLE, 0))
+
+    def exchange(self, giver, receiver, given, received):
+        give, take = self.seats[giver], self.seats[receiver]
+        self.events.extend(encode(EXCHANGE, give, tile, take) for tile in given)
+        self.events.extend(encode(EXCHANGE, take, tile, give) for tile in received)
+
+    def banned(self, player, suit):
+        self.events.append(encode(BANNED, self.seats[player], NO_TILE, suit))
+
+    def discard(self, player, tile):
+        self.events.append(encode(DISCARD, self.seats[player], tile))
+
+    def peng(self, player, tile, discarder):
+        self.events.append(encode(PENG, self.seats[player], tile, self.seats[discarder]))
+
+    def gang(self, player, tile):
+        self.events.append(encode(GANG, self.seats[player], tile))
+
+    def hu(self, player, tile, discarder=None):
+        seat = self.seats[player]
+        from_seat = seat if discarder is None else self.seats[discarder]
+        self.events.append(encode(HU, seat, NO_TILE if tile is None else tile, from_seat))
+
+    def finish(self, game):
+        """End the game: add its record to the chunk, writing the chunk once full"""
+        if self.first_index is None:
+            self.first_index = self.game_index
+        self.games.append(GAME_HEADER.pack(self.game_index, len(self.events), len(self.deck), self.ai_mask,
+                                           game.current_round)
+                          + self.deck + self.events.tobytes())
+        self.game_index += 1
+        if len(self.games) >= self.chunk_games:
+            self.flush()
+
+    def flush(self):
+        """Write the games recorded so far as a chunk"""
+        if not self.games:
+            return
+        payload = b"".join(self.games)
+        flags = 0
+        if self.compress:
+            payload = zlib.compress(payload, 1)
+            flags |= COMPRESSED
+        path = os.path.join(self.directory, f"chunk_{self.first_index:08d}.mjr")
+        with open(path + ".tmp", "wb") as f:
+            f.write(CHUNK_HEADER.pack(CHUNK_MAGIC, FORMAT_VERSION, flags, len(self.games)))
+            f.write(payload)
+        os.replace(path + ".tmp", path)
+        self.games = []
+        self.first_index = None
+
+    def close(self):
+        self.flush()
+
+
+class GameRecord:
+    """One recorded game: its deck and its events as NumPy arrays"""
+
+    def __init__(self, index, deck, ai_mask, rounds, events):
+        self.index = index
+        self.deck = deck
+        self.ai_mask = ai_mask
+        self.rounds = rounds
+        self.events = events
+
+    def decoded(self):
+        """(types, seats, args, tiles) arrays of the events"""
+        e = self.events
+        return e >> 9, (e >> 7) & 3, (e >> 5) & 3, e & 31
+
+
+def read_chunk(path):
+    """GameRecords of a chunk file, in order"""
+    with open(path, "rb") as f:
+        magic, version, flags, games = CHUNK_HEADER.unpack(f.read(CHUNK_HEADER.size))
+        if magic != CHUNK_MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"{path} is not a replay chunk")
+        payload = f.read()
+    if flags & COMPRESSED:
+        payload = zlib.decompress(payload)
+
+    records = []
+    offset = 0
+    for _ in range(games):
+        index, n, deck_size, ai_mask, rounds = GAME_HEADER.unpack_from(payload, offset)
+        offset += GAME_HEADER.size
+        deck = np.frombuffer(payload, dtype=np.uint8, count=deck_size, offset=offset)
+        offset += deck_size
+        events = np.frombuffer(payload, dtype="<u2", count=n, offset=offset)
+        offset += 2 * n
+        records.append(GameRecord(index, deck, ai_mask, rounds, events))
+    return records
+
+
+def chunk_paths(directory):
+    return sorted(glob.glob(os.path.join(directory, "chunk_*.mjr")))
+
+
+def iter_games(directory):
+    """Every recorded game of a directory, in chunk order"""
+    for path in chunk_paths(directory):
+        yield from read_chunk(path)
+
+
+def load_game(directory, index):
+    """The GameRecord of game number index (KeyError if it was not recorded)"""
+    for path in chunk_paths(directory):
+        first = int(os.path.basename(path)[6:14])
+        if first > index:
+            continue
+        for record in read_chunk(path):
+            if record.index == index:
+                return record
+    raise KeyError(f"Game {index} not recorded in {directory}")
+
+
+class ReplayState:
+    """Table state rebuilt from a game's events"""
+
+    def __init__(self, record):
+        self.hands = np.zeros((4, 27), dtype=np.int8)  # Tile counts per seat
+        self.exposed = [[] for _ in range(4)]  # Exposed sets per seat
+        self.discards = []  # (seat, tile) in order (penged tiles stay, as in game.discards)
+        self.banned = [None] * 4
+        self.wall = np.bincount(record.deck, minlength=27).astype(np.int8)  # Tile counts left to draw
+        self.winners = []  # (seat, tile, from seat)
+        self.applied = 0
+
+    def apply(self, kind, seat, arg, tile):
+        if kind == DRAW:
+            self.hands[seat, tile] += 1
+            self.wall[tile] -= 1
+        elif kind == RETURN:
+            self.hands[seat, tile] -= 1
+            self.wall[tile] += 1
+        elif kind == EXCHANGE:
+            self.hands[seat, tile] -= 1
+            self.hands[arg, tile] += 1
+        elif kind == BANNED:
+            self.banned[seat] = arg
+        elif kind == DISCARD:
+            self.hands[seat, tile] -= 1
+            self.discards.append((seat, tile))
+        elif kind == PENG:
+            self.hands[seat, tile] -= 2
+            self.exposed[seat].append([tile] * 3)
+        elif kind == GANG:
+            self.hands[seat, tile] -= 4
+            self.exposed[seat].append([tile] * 4)
+        elif kind == HU:
+            self.winners.append((seat, None if tile == NO_TILE else tile, arg))
+        self.applied += 1
+
+    def describe(self):
+        lines = [f"After {self.applied} events, {int(self.wall.sum())} tiles in the wall"]
+        for seat in range(4):
+            tiles = [tile for tile in range(27) for _ in range(self.hands[seat, tile])]
+            exposed = [tile_names(s) for s in self.exposed[seat]]
+            lines.append(f"Player {seat + 1} (banned suit {self.banned[seat]}): {tile_names(tiles)} | "
+                         f"Exposed: {exposed}")
+        lines.append(f"Discards: {tile_names([tile for _, tile in self.discards])}")
+        for seat, tile, from_seat in self.winners:
+            how = "self-drawn" if from_seat == seat else f"from Player {from_seat + 1}"
+            lines.append(f"Player {seat + 1} Hu on {tile_names([tile])[0] if tile is not None else '-'} ({how})")
+        return "\n".join(lines)
+
+
+def replay(record, upto=None):
+    """ReplayState of a game after its first upto events (default: all of them)"""
+    state = ReplayState(record)
+    types, seats, args, tiles = (a[:upto].tolist() for a in record.decoded())
+    for event in zip(types, seats, args, tiles):
+        state.apply(*event)
+    return state
+
+
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='Inspect recorded game replays')
+    parser.add_argument('directory', help='Replay directory')
+    parser.add_argument('--game', type=int, default=None, help='Game number to replay')
+    parser.add_argument('--step', type=int, default=None, help='Show the state after this many events')
+    parser.add_argument('--events', action='store_true', help='List the events of the game')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    if args.game is None:
+        games = events = 0
+        for record in iter_games(args.directory):
+            games += 1
+            events += len(record.events)
+        size = sum(os.path.getsize(path) for path in chunk_paths(args.directory))
+        print(f"{games} games, {events} events, {size:,} bytes "
+              f"({size / max(games, 1):.0f} bytes/game) in {len(chunk_paths(args.directory))} chunks")
+    else:
+        record = load_game(args.directory, args.game)
+        print(f"Game {record.index}: {len(record.events)} events, {record.rounds} rounds, "
+              f"AI seats {[seat + 1 for seat in range(4) if record.ai_mask >> seat & 1]}")
+        if args.events:
+            for i, (kind, seat, arg, tile) in enumerate(zip(*(a.tolist() for a in record.decoded()))):
+                print(f"{i:>4} {EVENT_NAMES[kind]:<9} Player {seat + 1} "
+                      f"{tile_names([tile])[0] if tile != NO_TILE else '-':<4} {arg}")
+        print(replay(record, args.step).describe())
@@ -1,93 +1,101 @@
 import numpy as np
 import random
-import pickle
-import os
-from collections import Counter
+from tiles import W, T, B
+from shanten import shanten
+import q_store
+from q_store import (QStore, ACTION_IDS, ACTIONS, HU_ACTION, PENG_ACTIONS, GANG_ACTIONS, TILE_BITS, SUIT_BITS,
+                     legal_mask, mask_ids)
+
+def straight_potential_of(counts, banned_suit):
+    """
+    Straight potential of a 27-slot count vector: +1 per complete window of
+    three consecutive numbers, +0.5 per window missing one tile (banned suit skipped)
+    """
+    potential = 0
+    for suit in range(3):
+        if suit == banned_suit:
+            continue
+        
+        base = suit * 9
+        for start in range(base, base + 7):  # Windows 1-2-3 .. 7-8-9
+            matching = (counts[start] > 0) + (counts[start + 1] > 0) + (counts[start + 2] > 0)
+            if matching == 3:  # Complete straight
+                potential += 1
+            elif matching == 2:  # Potential straight (need one more tile)
+                potential += 0.5
+    return potential
+
+def straight_potential_delta(counts, tile, banned_suit):
+    """
+    Change of straight_potential_of when one copy of tile leaves the hand
+    (counts is the hand after): only the windows holding the tile can change,
+    and only if it was the last copy, each losing 0.5 (3 -> 2 or 2 -> 1 of 3)
+    """
+    if counts[tile] or tile // 9 == banned_suit:
+        return 0
+    base = tile - tile % 9
+    delta = 0
+    for start in range(max(base, tile - 2), min(base + 6, tile) + 1):
+        if counts[start] or counts[start + 1] or counts[start + 2]:
+            delta -= 0.5
+    return delta
 
 class RLAgent:
-    def __init__(self, alpha=0.1, gamma=0.9, epsilon=0.1, q_table_file="q_table.pkl"):
+    def __init__(self, alpha=0.1, gamma=0.9, epsilon=0.1, q_table_file="q_table.pkl", q_table=None, frozen=False,
+                 rng=None):
         self.alpha = alpha  # Learning rate
         self.gamma = gamma  # Discount factor (future rewards)
         self.epsilon = epsilon  # Exploration rate
         self.q_table_file = q_table_file
-        self.last_state = None
+        self.last_state = None  # Last decision (for inspection, learning uses trajectories)
         self.last_action = None
-        self.last_hand = None
-        self.last_exposed_sets = None
-        self.tiles_seen = set()
+        self.trajectories = {}  # Player -> decisions [state, action, closing] not learned from yet
         self.winning_patterns = {}  # Track patterns that led to wins
+        self.transitions = None  # List of recorded updates when playing as an actor
+        self.transition_log = None  # transitions.TransitionWriter storing every update learned
+        self.frozen = frozen  # Frozen agents never update their Q-table
+        self.rng = rng if rng is not None else random.Random()  # Exploration and tie-breaking draws
+        self.planner = None  # planner.RolloutPlanner choosing the exploitation discards, if set
+        
+        # Use the given Q-table (e.g. a shared one from model_registry)
+        if q_table is not None:
+            self.q_table = q_table if isinstance(q_table, QStore) else QStore.from_dict(q_table)
+            return
         
-        # Load Q-table if exists, else create empty table
+        # Load Q-table if exists (pickle or memory-mapped binary), else create empty table
         try:
-            with open(self.q_table_file, "rb") as f:
-                self.q_table = pickle.load(f)
+            self.q_table = q_store.load(self.q_table_file)
             print(f"Loaded Q-table with {len(self.q_table)} entries")
         except FileNotFoundError:
-            self.q_table = {}
+            self.q_table = QStore()
             print("Created new Q-table")
     
-    def reset_for_new_game(self):
-        """Reset agent state for a new game"""
+    def reset_for_new_game(self, rng=None):
+        """Reset agent state for a new game (drawing from rng from now on, if given)"""
+        if rng is not None:
+            self.rng = rng
+            if self.planner is not None:
+                self.planner.seed(rng.getrandbits(64))  # Rollouts follow the game's stream too
         self.last_state = None
         self.last_action = None
-        self.last_hand = None
-        self.last_exposed_sets = None
-        self.tiles_seen = set()
+        self.trajectories = {}
     
     def get_state(self, player, game):
         """
         Generate a simple state representation that captures the essential features
         """
-        # Update tiles seen
-        for tile in game.discards:
-            self.tiles_seen.add(tile)
-        for p in game.players:
-            for exposed_set in p.exposed_sets:
-                for tile in exposed_set:
-                    self.tiles_seen.add(tile)
-        
         # Analyze hand composition
-        hand_counts = Counter(player.hand)
-        pairs = sum(1 for _, count in hand_counts.items() if count == 2)
-        triplets = sum(1 for _, count in hand_counts.items() if count >= 3)
+        counts = player.hand.counts
+        pairs = sum(1 for count in counts if count == 2)
+        triplets = sum(1 for count in counts if count >= 3)
         
         # Count tiles by suit
-        suit_counts = {"W": 0, "B": 0, "T": 0}
-        for tile in player.hand:
-            suit = tile[-1]
-            suit_counts[suit] += 1
-        
-        # Analyze potential straights
-        straight_potential = 0
-        for suit in ["W", "B", "T"]:
-            if suit == player.banned_suit:
-                continue
-                
-            nums_in_suit = [int(t[:-1]) for t in player.hand if t.endswith(suit)]
-            for num in range(1, 8):  # Check for potential straights (1-2-3, 2-3-4, etc)
-                sequence = [num, num+1, num+2]
-                matching = sum(1 for n in sequence if n in nums_in_suit)
-                if matching == 3:  # Complete straight
-                    straight_potential += 1
-                elif matching == 2:  # Potential straight (need one more tile)
-                    straight_potential += 0.5
+        suit_counts = player.hand.suit_sizes
         
-        # Distance to winning
+        # Distance to winning: exact shanten (regular or seven pairs) + 1,
+        # so 0 = complete, 1 = ready (0-5, lower is better)
         exposed_melds = len(player.exposed_sets)
-        hand_melds = triplets + int(straight_potential)
-        total_melds = exposed_melds + hand_melds
-        
-        # For seven pairs
-        seven_pairs_potential = min(7, pairs)
-        
-        # For regular hu (4 melds + 1 pair)
-        regular_hu_potential = total_melds + (1 if pairs > 0 else 0)
-        
-        # Distance to winning (0-5, lower is better)
-        distance_to_win = max(0, min(5, min(
-            7 - seven_pairs_potential,  # Distance to seven pairs
-            5 - regular_hu_potential  # Distance to regular hu
-        )))
+        distance_to_win = min(5, shanten(counts, exposed_melds, player.banned_suit) + 1)
         
         # Game stage (early, mid, late)
         if len(game.deck) > 70:
@@ -101,117 +109,103 @@ class RLAgent:
         state = (
             min(3, pairs),   # 0-3 pairs
             min(2, triplets),  # 0-2 triplets
-            min(3, suit_counts["W"] // 4),  # W tiles (0-3)
-            min(3, suit_counts["B"] // 4),  # B tiles (0-3)
-            min(3, suit_counts["T"] // 4),  # T tiles (0-3)
+            min(3, suit_counts[W] // 4),  # W tiles (0-3)
+            min(3, suit_counts[B] // 4),  # B tiles (0-3)
+            min(3, suit_counts[T] // 4),  # T tiles (0-3)
             min(3, exposed_melds),  # exposed sets (0-3)
-            1 if player.banned_suit == "W" else 0,  # banned suit W?
-            1 if player.banned_suit == "B" else 0,  # banned suit B?
-            1 if player.banned_suit == "T" else 0,  # banned suit T?
+            1 if player.banned_suit == W else 0,  # banned suit W?
+            1 if player.banned_suit == B else 0,  # banned suit B?
+            1 if player.banned_suit == T else 0,  # banned suit T?
             game_stage,  # game stage (0-2)
             distance_to_win  # distance to winning (0-5)
         )
         
-        # Store current hand for reward calculation
-        self.last_hand = player.hand.copy()
-        self.last_exposed_sets = [s.copy() for s in player.exposed_sets]
-        
         return state
 
+    def legal_actions(self, player, game):
+        """Bitmask of the action IDs the player can take (see q_store.legal_mask)"""
+        last_discard = game.discards[-1] if game.discards else None
+        return legal_mask(player.hand, player.banned_suit, last_discard, player.check_hu())
+
     def get_possible_actions(self, player, game):
-        """Returns a list of valid actions the player can take."""
-        actions = []
-        
-        # Always include discard actions for each unique tile in hand
-        for tile in set(player.hand):
-            actions.append(("discard", tile))
-        
-        # Peng action for the last discarded tile
-        if game.discards and player.hand.count(game.discards[-1]) >= 2:
-            if not game.discards[-1].endswith(player.banned_suit):  # Can't peng banned suit
-                actions.append(("peng", game.discards[-1]))
-        
-        # Gang action for tiles in hand
-        for tile in set(player.hand):
-            if player.hand.count(tile) == 4 and not tile.endswith(player.banned_suit):
-                actions.append(("gang", tile))
-        
-        # Check for hu (winning)
-        if player.check_hu():
-            actions.append(("hu", None))
-            
-        return actions
+        """Returns a list of valid actions the player can take (in action ID order)."""
+        return [ACTIONS[i] for i in mask_ids(self.legal_actions(player, game))]
 
     def choose_action(self, player, game):
         """Choose the best action based on advanced strategic rules and Q-values."""
         state = self.get_state(player, game)
-        possible_actions = self.get_possible_actions(player, game)
+        mask = self.legal_actions(player, game)
         
         # No valid actions
-        if not possible_actions:
+        if not mask:
             return None, None
         
-        # Store state for learning
-        self.last_state = state
-        
+        action = self._select_action(state, mask, player, game)
+        self.record_decision(player, state, mask, action)
+        return action
+    
+    def _select_action(self, state, mask, player, game):
+        """The action the strategy rules and Q-values pick among the legal ones"""
         # STRATEGY 1: Always choose Hu if available (winning)
-        for action in possible_actions:
-            if action[0] == "hu":
-                self.last_action = action
-                return action
+        if mask >> HU_ACTION & 1:
+            return ACTIONS[HU_ACTION]
         
         # STRATEGY 2: Always discard banned suit tiles first (critical rule)
-        banned_tiles = [action for action in possible_actions 
-                      if action[0] == "discard" and action[1].endswith(player.banned_suit)]
-        if banned_tiles:
+        if player.banned_suit is not None and mask & SUIT_BITS[player.banned_suit]:
             # Choose the best banned tile to discard
-            best_banned = self._choose_best_banned_tile(banned_tiles, player)
-            self.last_action = best_banned
-            return best_banned
+            banned_tiles = [ACTIONS[i] for i in mask_ids(mask & SUIT_BITS[player.banned_suit])]
+            return self._choose_best_banned_tile(banned_tiles, player)
         
         # STRATEGY 3: Always choose Gang if available (powerful move)
-        gang_actions = [action for action in possible_actions if action[0] == "gang"]
-        if gang_actions:
-            chosen_action = gang_actions[0]
-            self.last_action = chosen_action
-            return chosen_action
+        gangs = mask >> GANG_ACTIONS & TILE_BITS
+        if gangs:
+            return ACTIONS[GANG_ACTIONS + mask_ids(gangs)[0]]
         
         # STRATEGY 4: Almost always choose Peng if available (important for sets)
-        peng_actions = [action for action in possible_actions if action[0] == "peng"]
-        if peng_actions and random.random() < 0.98:  # 98% chance to Peng
-            chosen_action = peng_actions[0]
-            self.last_action = chosen_action
-            return chosen_action
+        pengs = mask >> PENG_ACTIONS & TILE_BITS
+        if pengs and self.rng.random() < 0.98:  # 98% chance to Peng
+            return ACTIONS[PENG_ACTIONS + mask_ids(pengs)[0]]
         
         # STRATEGY 5: Use exploration/exploitation for discard decisions
-        if random.random() < self.epsilon:  # Exploration
+        if self.rng.random() < self.epsilon:  # Exploration
             # During exploration, still use smart heuristics for discard
-            chosen_action = self._choose_strategic_discard(player, game, possible_actions)
-            self.last_action = chosen_action
-            return chosen_action
+            return self._choose_strategic_discard(player, game, mask)
         else:  # Exploitation
             # Use Q-values + enhanced heuristics
-            return self._exploit_with_advanced_strategy(state, player, game, possible_actions)
+            return self._exploit_with_advanced_strategy(state, player, game, mask)
+    
+    def record_decision(self, player, state, mask, action):
+        """
+        Add a decision to the player's trajectory; a decision still open (no
+        turn boundary since, e.g. the discard after a peng) is closed by this one
+        """
+        self.last_state = state
+        self.last_action = action
+        trajectory = self.trajectories.setdefault(player, [])
+        if trajectory and trajectory[-1][2] is None:
+            trajectory[-1][2] = (player.total_reward, state, mask, False)
+        trajectory.append([state, action, None])
     
     def _choose_best_banned_tile(self, banned_actions, player):
         """Choose the best banned suit tile to discard strategically"""
+        counts = player.hand.counts
+        
         # Prefer to discard singles over pairs
         singles = [action for action in banned_actions 
-                 if player.hand.count(action[1]) == 1]
+                 if counts[action[1]] == 1]
         if singles:
-            return random.choice(singles)
+            return self.rng.choice(singles)
         
         # Prefer to discard tiles that don't break potential straights
         non_straight_tiles = []
         for action in banned_actions:
             tile = action[1]
-            suit = tile[-1]
-            num = int(tile[:-1])
+            base = tile - tile % 9
+            num = tile % 9 + 1
             
             is_part_of_straight = False
             for start in range(max(1, num-2), min(8, num+1)):
-                potential = [f"{start+i}{suit}" for i in range(3)]
-                matching = sum(1 for t in potential if t in player.hand)
+                matching = sum(1 for i in range(3) if counts[base + start - 1 + i])
                 if matching >= 2:  # Part of potential straight
                     is_part_of_straight = True
                     break
@@ -220,40 +214,40 @@ class RLAgent:
                 non_straight_tiles.append(action)
         
         if non_straight_tiles:
-            return random.choice(non_straight_tiles)
+            return self.rng.choice(non_straight_tiles)
         
         # Otherwise just pick randomly
-        return random.choice(banned_actions)
+        return self.rng.choice(banned_actions)
     
-    def _choose_strategic_discard(self, player, game, possible_actions):
+    def _choose_strategic_discard(self, player, game, mask):
         """Choose a tile to discard using advanced strategic heuristics"""
-        discard_actions = [a for a in possible_actions if a[0] == "discard"]
+        discard_actions = [ACTIONS[i] for i in mask_ids(mask & TILE_BITS)]
         if not discard_actions:
-            return random.choice(possible_actions)
+            return self.rng.choice([ACTIONS[i] for i in mask_ids(mask)])
         
         # Analyze hand to find best discard
+        counts = player.hand.counts
         tile_scores = {}
         for action in discard_actions:
             tile = action[1]
             score = 0
             
             # Avoid discarding tiles that are part of pairs
-            if player.hand.count(tile) == 2:
+            if counts[tile] == 2:
                 score -= 10
             
             # Count tiles needed for potential straights
-            suit = tile[-1]
-            num = int(tile[:-1])
+            suit = tile // 9
+            num = tile % 9 + 1
             
             for start in range(max(1, num-2), min(8, num+1)):
-                potential = [f"{start+i}{suit}" for i in range(3)]
-                matching = sum(1 for t in potential if t in player.hand)
+                matching = sum(1 for i in range(3) if counts[suit * 9 + start - 1 + i])
                 
                 if matching == 3:  # Complete straight
                     score -= 12  # Heavily penalize breaking a complete straight
                 elif matching == 2:  # Potential straight
-                    if tile in potential:  # Only if tile is part of it
-                        score -= 8  # Penalize breaking potential straight
+                    # The tile itself is always part of the windows scanned here
+                    score -= 8  # Penalize breaking potential straight
             
             # Prefer to discard terminal tiles (1, 9) over middle tiles
             if num == 1 or num == 9:
@@ -264,11 +258,11 @@ class RLAgent:
                 score += 0  # Middle numbers are most flexible, no bonus
             
             # Prefer to discard tiles that have been seen frequently
-            seen_count = sum(1 for t in self.tiles_seen if t == tile)
+            seen_count = game.visible[tile]
             score += seen_count * 1.5
             
             # Prefer to discard tiles from suits with fewer tiles
-            suit_count = sum(1 for t in player.hand if t.endswith(suit))
+            suit_count = player.hand.suit_sizes[suit]
             if suit_count <= 3:  # Few tiles of this suit
                 score += 4  # Good to discard from minority suits
             
@@ -277,17 +271,22 @@ class RLAgent:
         # Choose the tile with the highest score
         return max(tile_scores, key=tile_scores.get)
     
-    def _exploit_with_advanced_strategy(self, state, player, game, possible_actions):
+    def _exploit_with_advanced_strategy(self, state, player, game, mask):
         """Use Q-values with advanced strategy enhancements"""
-        discard_actions = [a for a in possible_actions if a[0] == "discard"]
+        discard_actions = [ACTIONS[i] for i in mask_ids(mask & TILE_BITS)]
         if not discard_actions:
-            return random.choice(possible_actions)
+            return self.rng.choice([ACTIONS[i] for i in mask_ids(mask)])
+        
+        # Planner mode: the discard with the best rollout outcome
+        if self.planner is not None:
+            return ACTIONS[self.planner.choose_discard(player, game, mask_ids(mask & TILE_BITS))]
         
         # Calculate combined scores for each discard action
+        q_values = self.q_table.row_values(state)
         combined_scores = {}
         for action in discard_actions:
             # Q-value component
-            q_value = self.q_table.get((state, action), 0)
+            q_value = float(q_values[ACTION_IDS[action]])
             
             # Strategic score component
             strategic_score = self._calculate_strategic_value(action, player, game)
@@ -300,9 +299,7 @@ class RLAgent:
             combined_scores[action] = (q_value * q_weight) + (strategic_score * strategic_weight)
         
         # Choose the action with the highest combined score
-        best_action = max(combined_scores, key=combined_scores.get)
-        self.last_action = best_action
-        return best_action
+        return max(combined_scores, key=combined_scores.get)
     
     def _calculate_strategic_value(self, action, player, game):
         """Calculate the strategic value of a discard action"""
@@ -312,22 +309,22 @@ class RLAgent:
         
         tile = action[1]
         value = 0
+        counts = player.hand.counts
         
         # CRITERION 1: Avoid discarding pairs
-        if player.hand.count(tile) == 2:
+        if counts[tile] == 2:
             value -= 15
         
         # CRITERION 2: Avoid discarding tiles that form straights
-        suit = tile[-1]
-        num = int(tile[:-1])
+        base = tile - tile % 9
+        num = tile % 9 + 1
         
         for start in range(max(1, num-2), min(8, num+1)):
-            potential = [f"{start+i}{suit}" for i in range(3)]
-            matching = sum(1 for t in potential if t in player.hand)
+            matching = sum(1 for i in range(3) if counts[base + start - 1 + i])
             
             if matching == 3:  # Complete straight
                 value -= 20
-            elif matching == 2 and tile in potential:  # Potential straight that includes this tile
+            elif matching == 2:  # Potential straight that includes this tile
                 value -= 12
         
         # CRITERION 3: Consider tile position (terminals vs middle)
@@ -337,24 +334,24 @@ class RLAgent:
             value += 3
         
         # CRITERION 4: Consider frequently seen tiles
-        seen_count = sum(1 for t in self.tiles_seen if t == tile)
+        seen_count = game.visible[tile]
         value += seen_count * 2
         
         # CRITERION 5: Consider tile effectiveness based on hand composition
         # Calculate how well this tile fits with overall strategy
         
         # Count pairs
-        pair_count = sum(1 for t in set(player.hand) if player.hand.count(t) == 2)
+        pair_count = sum(1 for c in counts if c == 2)
         
         # If going for seven pairs (5+ pairs already)
-        if pair_count >= 5 and player.hand.count(tile) == 1:
+        if pair_count >= 5 and counts[tile] == 1:
             value += 10  # Good to discard singles when going for seven pairs
         
         # If going for regular hu (some triples/straights already)
         exposed_count = len(player.exposed_sets)
         if exposed_count >= 2:
             # Check if tile forms a pair with something
-            if player.hand.count(tile) == 2:
+            if counts[tile] == 2:
                 value -= 8  # Keep pairs when close to winning
         
         return value
@@ -375,57 +372,17 @@ class RLAgent:
         
         if action_type == "discard":
             # Reward for discarding banned suit
-            if tile.endswith(player.banned_suit):
+            if tile // 9 == player.banned_suit:
                 reward += 10.0  # Major reward for following this rule
             
-            # Calculate how the discard affects our winning potential
-            # We need to analyze without modifying the actual hand
-            hand_copy = player.hand.copy()
-            hand_copy.append(tile)  # Add tile back to analyze pre-discard state
-            
-            pre_pairs = sum(1 for t in set(hand_copy) if hand_copy.count(t) == 2)
-            pre_triples = sum(1 for t in set(hand_copy) if hand_copy.count(t) == 3)
-            
-            # Calculate straight potential before
-            pre_straight = 0
-            for suit in ["W", "B", "T"]:
-                if suit == player.banned_suit:
-                    continue
-                    
-                nums = [int(t[:-1]) for t in hand_copy if t.endswith(suit)]
-                for num in range(1, 8):
-                    sequence = [num, num+1, num+2]
-                    matching = sum(1 for n in sequence if n in nums)
-                    if matching == 3:
-                        pre_straight += 1
-                    elif matching == 2:
-                        pre_straight += 0.5
-            
-            # Remove the tile to simulate after state
-            hand_copy.remove(tile)
-            
-            post_pairs = sum(1 for t in set(hand_copy) if hand_copy.count(t) == 2)
-            post_triples = sum(1 for t in set(hand_copy) if hand_copy.count(t) == 3)
-            
-            # Calculate straight potential after
-            post_straight = 0
-            for suit in ["W", "B", "T"]:
-                if suit == player.banned_suit:
-                    continue
-                    
-                nums = [int(t[:-1]) for t in hand_copy if t.endswith(suit)]
-                for num in range(1, 8):
-                    sequence = [num, num+1, num+2]
-                    matching = sum(1 for n in sequence if n in nums)
-                    if matching == 3:
-                        post_straight += 1
-                    elif matching == 2:
-                        post_straight += 0.5
-            
-            # Calculate change in hand value
-            pair_change = post_pairs - pre_pairs
-            triple_change = post_triples - pre_triples
-            straight_change = post_straight - pre_straight
+            # Calculate how the discard affects our winning potential: only
+            # the count of the discarded tile changed (left + 1 -> left), so
+            # pairs, triples and straights change only around it
+            counts = player.hand.counts
+            left = counts[tile]
+            pair_change = (left == 2) - (left == 1)
+            triple_change = (left == 3) - (left == 2)
+            straight_change = straight_potential_delta(counts, tile, player.banned_suit)
             
             # Reward for improvements
             reward += pair_change * 5.0
@@ -433,7 +390,8 @@ class RLAgent:
             reward += straight_change * 6.0
             
             # Extra reward for discarding tiles that have been seen frequently
-            seen_count = sum(1 for t in self.tiles_seen if t == tile)
+            # (other copies: the discard itself is already on the table)
+            seen_count = game.visible[tile] - 1
             reward += seen_count * 0.5
             
         elif action_type == "peng":
@@ -465,57 +423,87 @@ class RLAgent:
     def _get_pattern_key(self, player):
         """Get a unique key representing the winning pattern"""
         # Count by suit
-        suit_counts = {"W": 0, "B": 0, "T": 0}
-        for tile in player.hand:
-            suit = tile[-1]
-            suit_counts[suit] += 1
+        suit_counts = player.hand.suit_sizes
         
         # Count pairs
-        pair_count = sum(1 for t in set(player.hand) if player.hand.count(t) == 2)
+        pair_count = sum(1 for c in player.hand.counts if c == 2)
         
         # Count exposed sets
         exposed_count = len(player.exposed_sets)
         
-        return (suit_counts["W"], suit_counts["B"], suit_counts["T"], pair_count, exposed_count)
+        return (suit_counts[W], suit_counts[B], suit_counts[T], pair_count, exposed_count)
 
     def update_q_table(self, player, game, next_state, reward, hu_achieved=False):
-        """Update Q-table using the Q-learning algorithm with enhanced learning."""
-        if self.last_state is None or self.last_action is None:
+        """
+        Close the player's last decision at a turn boundary (or a win) and
+        learn from the player's earlier decisions. The last one waits for the
+        player's next decision or the end of the game, so a win still reaches it.
+        A decision's closing is (reward, next_state, next_mask, hu_achieved).
+        """
+        trajectory = self.trajectories.get(player)
+        if not trajectory:
+            return
+        
+        # Terminal states (game over or hu achieved) have no next actions
+        terminal = hu_achieved or not game.deck
+        next_mask = None if terminal else self.legal_actions(player, game)
+        trajectory[-1][2] = (reward, next_state, next_mask, hu_achieved)
+        self._apply(trajectory, len(trajectory) if terminal else len(trajectory) - 1)
+    
+    def finish_game(self, game):
+        """
+        Learn from the decisions still pending in a game, as terminal (call
+        once the game is over); other games sharing the agent (clones) keep theirs
+        """
+        for player in game.players:
+            trajectory = self.trajectories.pop(player, None)
+            if not trajectory:
+                continue
+            closing = trajectory[-1][2]
+            if closing is None:
+                closing = (player.total_reward, self.get_state(player, game), None, False)
+            trajectory[-1][2] = (closing[0], closing[1], None, closing[3])
+            self._apply(trajectory, len(trajectory))
+    
+    def _apply(self, trajectory, n):
+        """Learn from the first n (closed) decisions of a trajectory and drop them"""
+        if self.transitions is None and self.frozen:
+            del trajectory[:n]
             return
+        for state, action, (reward, next_state, next_mask, hu_achieved) in trajectory[:n]:
+            if self.transitions is not None:
+                # Actor mode: the learner applies the update
+                self.transitions.append((state, action, reward, next_state, next_mask, hu_achieved))
+            else:
+                self.learn(state, action, reward, next_state, next_mask, hu_achieved)
+        del trajectory[:n]
+
+    def learn(self, state, action, reward, next_state, next_mask, hu_achieved=False):
+        """
+        Apply one Q-learning update (next_mask: legal action bitmask of the
+        next state, None for terminal states)
+        """
+        if self.transition_log is not None:
+            self.transition_log.add(state, action, reward, next_state, next_mask, hu_achieved)
         
         # Get current Q-value
-        current_q = self.q_table.get((self.last_state, self.last_action), 0)
+        current_q = self.q_table.get((state, action), 0)
         
-        # For terminal states (game over or hu achieved)
-        if hu_achieved or not game.deck:
+        if next_mask is None:
             # Boost learning rate for winning states
             effective_alpha = self.alpha * 1.5 if hu_achieved else self.alpha
             new_q = current_q + effective_alpha * (reward - current_q)
         else:
-            # Get next possible actions
-            next_actions = self.get_possible_actions(player, game)
-            
-            if not next_actions:
-                max_future_q = 0
-            else:
-                # Get maximum Q-value for next state
-                max_future_q = max([self.q_table.get((next_state, a), 0) for a in next_actions])
+            # Maximum Q-value for next state (0 without next actions)
+            max_future_q = self.q_table.max_value(next_state, next_mask)
             
             # Q-learning formula
             new_q = current_q + self.alpha * (reward + self.gamma * max_future_q - current_q)
         
         # Update Q-table
-        self.q_table[(self.last_state, self.last_action)] = new_q
-        
-        # Reset for next action
-        self.last_state = None
-        self.last_action = None
+        self.q_table[(state, action)] = new_q
 
     def save_q_table(self):
-        """Save Q-table to file."""
-        # Create directory if it doesn't exist
-        os.makedirs(os.path.dirname(self.q_table_file) if os.path.dirname(self.q_table_file) else '.', exist_ok=True)
-        
-        with open(self.q_table_file, "wb") as f:
-            pickle.dump(self.q_table, f)
+        """Save Q-table to file (written to a temp file, then renamed over the old one)."""
+        q_store.save(self.q_table, self.q_table_file)
         print(f"Saved Q-table with {len(self.q_table)} entries")
\ No newline at end of file
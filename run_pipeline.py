@@ -1,9 +1,24 @@
 import os
 import sys
+import copy
 import time
+import pickle
+import random
 import shutil
 import argparse
+import tempfile
+import multiprocessing
+import q_store
 from rl_agent import RLAgent
+from q_store import QStore
+from metrics import MetricsLog
+from replay import ReplayRecorder
+from transitions import TransitionWriter
+from checkpoints import DeltaCheckpointer, CheckpointWriter, RUNS_DIR
+import shanten
+import phase_timer
+
+SHANTEN_TABLES = "models/shanten_tables.pkl"
 
 def setup_directories():
     """Create necessary directories"""
@@ -11,20 +26,177 @@ def setup_directories():
     os.makedirs("models", exist_ok=True)
     os.makedirs("results", exist_ok=True)
 
-def train_ai(episodes=50000, save_interval=5000, log_interval=1000):
-    """Train the AI with enhanced parameters"""
-    print(f"Starting AI training with {episodes} episodes...")
+def game_rng(seed, phase, index):
+    """
+    RNG stream of game number index of a run phase ("train" or "eval"),
+    derived from the master seed alone, so a game plays out the same in any
+    process
+    """
+    return random.Random(f"{phase}:{seed}:{index}")
+
+def _mapped_table(table, directory):
+    """
+    The table as a read-only binary mapping, which pickles as its file so pool
+    processes map the same pages: the table itself if it still matches the
+    file it maps, else a copy written to directory
+    """
+    if table.source is not None:
+        return table
+    path = os.path.join(directory, "q_table" + q_store.BINARY_SUFFIX)
+    q_store.save_binary(table, path)
+    return q_store.load_binary(path)
+
+# Replay recorder of the running process, None unless recording replays
+_recorder = None
+
+def _open_recorder(directory):
+    """Record this process's games to directory (None: stop recording)"""
+    global _recorder
+    if _recorder is not None:
+        _recorder.close()
+    _recorder = ReplayRecorder(directory) if directory else None
+
+def _recorder_for(index):
+    """The process's recorder, numbering the next game index (None if not recording)"""
+    if _recorder is not None:
+        _recorder.game_index = index
+    return _recorder
+
+# Per-process agent of a training actor (set up by _init_actor)
+_actor_agent = None
+
+def _init_actor(agent_settings, timing, replay_dir):
+    """Pool initializer: load tables and a quiet agent once per actor process"""
+    global _actor_agent
+    sys.stdout = open(os.devnull, "w")
+    if timing:
+        phase_timer.enable()
+    _open_recorder(replay_dir)
+    shanten.load_tables(SHANTEN_TABLES)
+    _actor_agent = RLAgent(q_table=QStore(), **agent_settings)  # Each task brings its Q-table snapshot
+    _actor_agent.transitions = []
+
+def _run_actor(task):
+    """
+    Play a batch of training episodes against a Q-table snapshot
+    Returns the (winner names, rounds, reward, recorded transitions, error
+    message) of every episode and the phase timings (see phase_timer.collect)
+    """
+    from game_4AI import MahjongGame
     
-    # Import game implementation
-    try:
-        from game_4AI import MahjongGame
-    except ImportError:
-        print("Error: Training game implementation not found!")
-        return None
+    snapshot, start, stop, seed = task
+    agent = _actor_agent
+    agent.q_table = pickle.loads(snapshot)
+    
+    results = []
+    for episode in range(start, stop):
+        rng = game_rng(seed, "train", episode)
+        game = MahjongGame(agent, rng=rng, recorder=_recorder_for(episode))
+        agent.reset_for_new_game(rng)
+        agent.transitions = []
+        
+        error = None
+        try:
+            game.play_game(quiet=True)
+        except Exception as e:
+            error = str(e)
+        winners = [player.name for player in game.players if player.is_hu]
+        reward = sum(player.total_reward for player in game.players)
+        results.append((winners, game.current_round, reward, agent.transitions, error))
+    if _recorder is not None:
+        _recorder.flush()
+    return results, phase_timer.collect()
+
+def _play_parallel(rl_agent, episodes, workers, sync_episodes, seed, replay_dir=None):
+    """
+    Actor/learner loop: every round the actors split the next sync_episodes
+    episodes and play them against the current Q-table (published as a binary
+    file the actors map), then the learner applies their transitions in
+    episode order and republishes the table
+    Episodes play from their own seeded streams, so the run does not depend on
+    the number of workers
+    Yields (winner names, rounds, reward, error message) per episode, in episode order
+    """
+    agent_settings = {
+        "alpha": rl_agent.alpha,
+        "gamma": rl_agent.gamma,
+        "epsilon": rl_agent.epsilon,
+    }
+    sys.stdout.flush()
+    timing = phase_timer.ACTIVE is not None
+    with tempfile.TemporaryDirectory() as directory, \
+            multiprocessing.Pool(workers, initializer=_init_actor, initargs=(agent_settings, timing, replay_dir)) as pool:
+        for done in range(0, episodes, sync_episodes):
+            snapshot = pickle.dumps(_mapped_table(rl_agent.q_table, directory), protocol=pickle.HIGHEST_PROTOCOL)
+            stop = min(done + sync_episodes, episodes)
+            share = -(-(stop - done) // workers)
+            tasks = [(snapshot, start, min(start + share, stop), seed) for start in range(done, stop, share)]
+            for results, timings in pool.map(_run_actor, tasks):
+                if timings:
+                    phase_timer.ACTIVE.merge(*timings)
+                for winners, rounds, reward, transitions, error in results:
+                    for transition in transitions:
+                        rl_agent.learn(*transition)
+                    yield winners, rounds, reward, error
+
+def _play_serial(rl_agent, episodes, seed, replay_dir=None):
+    """
+    Play training episodes one by one, learning as they go
+    Yields (winner names, rounds, reward, error message) per episode
+    """
+    from game_4AI import MahjongGame
+    
+    _open_recorder(replay_dir)
+    for episode in range(episodes):
+        # All players use the same AI; the game and the agent share the episode's stream
+        rng = game_rng(seed, "train", episode)
+        game = MahjongGame(rl_agent, rng=rng, recorder=_recorder_for(episode))
+        
+        # Reset agent for new game
+        rl_agent.reset_for_new_game(rng)
+        
+        try:
+            # Play the game in quiet mode
+            game.play_game(quiet=True)
+        except Exception as e:
+            yield [], 0, 0, str(e)
+            continue
+        
+        yield ([player.name for player in game.players if player.is_hu], game.current_round,
+               sum(player.total_reward for player in game.players), None)
+    _open_recorder(None)
+
+def train_ai(episodes=50000, save_interval=1000, log_interval=1000, workers=1, sync_episodes=100,
+             background_checkpoints=True, metrics_every=10, seed=None, record_replays=False,
+             record_transitions=False, publish_interval=1000, keep_bases=None):
+    """
+    Train the AI with enhanced parameters
+    Episode i plays from game_rng(seed, "train", i): with a fixed seed, a run
+    repeats exactly (serial runs; sharded runs for any number of workers with
+    the same sync_episodes)
+    With workers > 1, actor processes play the episodes and this process learns
+    Every save_interval episodes a delta checkpoint goes to
+    models/checkpoints/train_<time>/ (rebuild any of them with checkpoints.py
+    --materialize EPISODE), written in the background unless
+    background_checkpoints is False; keep_bases limits the bases (and their
+    deltas) kept. Every publish_interval episodes the table is also written
+    to models/q_table.pkl, so evaluation and --load-model see recent learning
+    Metrics go to logs/train_<time>.jsonl, one record every metrics_every
+    episodes (see metrics.py); with record_replays, every episode is recorded
+    to replays/train_<time>/ (see replay.py), and with record_transitions
+    every Q-learning update to transitions/train_<time>.mjt (see offline_train.py)
+    """
+    print(f"Starting AI training with {episodes} episodes...")
     
     # Configure logging
-    log_file = f"logs/train_{int(time.time())}.txt"
-    sys.stdout = open(log_file, "w")
+    stamp = int(time.time())
+    log_file = f"logs/train_{stamp}.jsonl"
+    metrics = MetricsLog(log_file, sample_every=metrics_every)
+    replay_dir = f"replays/train_{stamp}" if record_replays else None
+    checkpoint_dir = f"{RUNS_DIR}/train_{stamp}"
+    
+    # Start from the per-suit shanten tables of earlier runs
+    shanten.load_tables(SHANTEN_TABLES)
     
     # Initialize advanced RL agent
     rl_agent = RLAgent(
@@ -33,63 +205,78 @@ def train_ai(episodes=50000, save_interval=5000, log_interval=1000):
         epsilon=0.25,   # Balanced exploration/exploitation 
         q_table_file="models/q_table.pkl"
     )
+    if record_transitions:
+        rl_agent.transition_log = TransitionWriter(f"transitions/train_{stamp}.mjt")
     
     # Training statistics
     wins = {f"Player {i+1}": 0 for i in range(4)}
     
+    # Incremental checkpoints of this run
+    checkpointer = DeltaCheckpointer(rl_agent.q_table, checkpoint_dir, keep_bases=keep_bases)
+    writer = CheckpointWriter(checkpointer, background=background_checkpoints)
+    
+    if seed is None:
+        seed = random.randrange(2**32)
+    metrics.record("config", mode="train", episodes=episodes, seed=seed, workers=workers, sync_episodes=sync_episodes,
+                   alpha=rl_agent.alpha, gamma=rl_agent.gamma, epsilon=rl_agent.epsilon,
+                   q_size=len(rl_agent.q_table))
     start_time = time.time()
     
-    for episode in range(episodes):
-        game = MahjongGame()
-        
-        # Make all players use the same AI
-        for player in game.players:
-            player.is_ai = True
-            player.rl_agent = rl_agent
-        
-        # Reset agent for new game
-        rl_agent.reset_for_new_game()
-        
-        try:
-            # Play the game in quiet mode
-            game.play_game(quiet=True)
-            
-            # Track wins
-            for player in game.players:
-                if player.is_hu:
-                    wins[player.name] += 1
-                    
-        except Exception as e:
-            print(f"Error in episode {episode+1}: {str(e)}")
+    if workers > 1:
+        print(f"Training with {workers} actor processes ({sync_episodes} episodes between syncs)")
+        played = _play_parallel(rl_agent, episodes, workers, sync_episodes, seed, replay_dir)
+    else:
+        played = _play_serial(rl_agent, episodes, seed, replay_dir)
+    
+    for episode, (winners, rounds, reward, error) in enumerate(played):
+        if error is not None:
+            metrics.record("error", episode=episode + 1, error=error)
             continue
         
-        # Save checkpoints
+        # Track wins
+        for name in winners:
+            wins[name] += 1
+        metrics.episode(episode, winners=winners, rounds=rounds, reward=round(reward, 2),
+                        q_size=len(rl_agent.q_table))
+        
+        # Save checkpoints (only the entries learned since the last one)
         if (episode + 1) % save_interval == 0:
-            checkpoint_file = f"models/q_table_ep{episode+1}.pkl"
-            rl_agent.q_table_file = checkpoint_file
-            rl_agent.save_q_table()
-            rl_agent.q_table_file = "models/q_table.pkl"  # Reset path
+            written, stall = writer.checkpoint(episode + 1)
+            metrics.record("checkpoint", episode=episode + 1, bytes=written, stall_ms=round(stall * 1000, 2))
         
-        # Regular save
-        if (episode + 1) % 1000 == 0:
-            rl_agent.save_q_table()
+        # Publish the model for evaluation
+        if (episode + 1) % publish_interval == 0 and episode + 1 < episodes:
+            writer.publish(rl_agent.q_table_file)
         
         # Log progress
         if (episode + 1) % log_interval == 0:
             elapsed = time.time() - start_time
             win_rate = sum(wins.values()) / (episode + 1)
-            
-            print(f"Episode {episode+1}/{episodes} ({elapsed:.1f}s)")
-            print(f"Current epsilon: {rl_agent.epsilon:.4f}")
-            print(f"Win rate: {win_rate:.4f}")
-            print(f"Wins: {wins}")
-            print(f"Q-table size: {len(rl_agent.q_table)}")
-            print("-" * 50)
+            metrics.record("progress", episode=episode + 1, win_rate=win_rate, wins=dict(wins),
+                           q_size=len(rl_agent.q_table), per_sec=round((episode + 1) / elapsed, 2))
+            print(f"Episode {episode+1}/{episodes} ({elapsed:.1f}s, {(episode+1)/elapsed:.1f} episodes/s): "
+                  f"win rate {win_rate:.4f}, Q-table size {len(rl_agent.q_table)}")
     
     # Save final model
+    if episodes % save_interval:
+        writer.checkpoint(episodes)
+    writer.close()
+    print(f"Checkpoints saved to {checkpoint_dir}")
+    if writer.stalls:
+        print(f"Checkpoint stalls: avg {sum(writer.stalls) / len(writer.stalls) * 1000:.1f} ms, "
+              f"max {max(writer.stalls) * 1000:.1f} ms over {len(writer.stalls)} checkpoints")
     rl_agent.save_q_table()
+    shanten.save_tables(SHANTEN_TABLES)
+    if rl_agent.transition_log is not None:
+        rl_agent.transition_log.close()
+        print(f"Recorded {rl_agent.transition_log.written} transitions to {rl_agent.transition_log.path}")
+        rl_agent.transition_log = None
     
     total_time = time.time() - start_time
+    metrics.record("summary", episodes=episodes, seconds=round(total_time, 2), wins=wins,
+                   q_size=len(rl_agent.q_table), per_sec=round(episodes / total_time, 2),
+                   checkpoint_stall_ms=round(max(writer.stalls, default=0) * 1000, 2))
+    metrics.close()
     print(f"\nTraining completed in {total_time:.2f} seconds!")
     
     # Save results to file
@@ -103,31 +290,108 @@ def train_ai(episodes=50000, save_interval=5000, log_interval=1000):
             win_rate = count / episodes * 100
             f.write(f"{player} wins: {count} ({win_rate:.2f}%)\n")
     
-    # Restore stdout
-    sys.stdout.close()
-    sys.stdout = sys.__stdout__
-    
-    print(f"Training completed! Log saved to {log_file}")
+    print(f"Training completed! Metrics saved to {log_file}")
     print(f"Model saved to models/q_table.pkl")
     return rl_agent
 
-def evaluate_ai(agent=None, games=10000, log_interval=1000):
-    """Evaluate the AI against random players using the advanced game logic"""
-    print(f"Starting evaluation with {games} games...")
+# Per-process agent of an evaluation worker (set up by _init_evaluator)
+_eval_agent = None
+
+def _init_evaluator(agent, timing, replay_dir):
+    """Pool initializer: each evaluation worker keeps its own copy of the agent"""
+    global _eval_agent
+    sys.stdout = open(os.devnull, "w")
+    if timing:
+        phase_timer.enable()
+    _open_recorder(replay_dir)
+    shanten.load_tables(SHANTEN_TABLES)
+    _eval_agent = agent
+
+def _play_eval_game(agent, game_num, seed):
+    """
+    Play evaluation game number game_num from its own stream, game_rng(seed, "eval", game_num)
+    The agent is frozen: its Q-learning updates are recorded and dropped, so a
+    game's result does not depend on the games played before it
+    Returns (winner names, rounds, the agent's reward, error message)
+    """
+    from game_1AI import MahjongGame
+    
+    rng = game_rng(seed, "eval", game_num)
+    
+    # Player 1 is our AI
+    game = MahjongGame(agent, rng=rng, recorder=_recorder_for(game_num))
+    
+    # Reset agent for new game
+    agent.reset_for_new_game(rng)
+    agent.transitions = []
     
-    # Import specialized game implementation with boosted AI advantage
     try:
-        from game_1AI import MahjongGame
-    except ImportError:
-        try:
-            from game_1AI import MahjongGame
-        except ImportError:
-            print("Error: Evaluation game implementation not found!")
-            return
+        game.play_game(quiet=True)
+    except Exception as e:
+        return [], 0, 0, str(e)
+    finally:
+        agent.transitions = None
+    reward = sum(player.total_reward for player in game.players if player.is_ai)
+    return [player.name for player in game.players if player.is_hu], game.current_round, reward, None
+
+def _run_evaluator(task):
+    start, stop, seed = task
+    results = [_play_eval_game(_eval_agent, game_num, seed) for game_num in range(start, stop)]
+    if _recorder is not None:
+        _recorder.flush()
+    return results, phase_timer.collect()
+
+def play_evaluation(agent, games, workers=1, seed=None, chunk_size=50, replay_dir=None):
+    """
+    Play evaluation games (game_1AI, the agent as Player 1), sharded across
+    `workers` processes in chunks of chunk_size games
+    Every game plays from the stream of (seed, game number), so the results are
+    the same for any number of workers
+    Yields (winner names, rounds, the agent's reward, error message) per game, in game order
+    Games are recorded to replay_dir if given
+    """
+    if seed is None:
+        seed = random.randrange(2**32)
+    
+    if workers <= 1:
+        _open_recorder(replay_dir)
+        for game_num in range(games):
+            yield _play_eval_game(agent, game_num, seed)
+        _open_recorder(None)
+        return
+    
+    tasks = [(start, min(start + chunk_size, games), seed) for start in range(0, games, chunk_size)]
+    sys.stdout.flush()
+    timing = phase_timer.ACTIVE is not None
+    with tempfile.TemporaryDirectory() as directory:
+        # The workers map the agent's table rather than each unpickling a copy
+        worker_agent = copy.copy(agent)
+        worker_agent.q_table = _mapped_table(agent.q_table, directory)
+        with multiprocessing.Pool(workers, initializer=_init_evaluator,
+                                  initargs=(worker_agent, timing, replay_dir)) as pool:
+            for results, timings in pool.imap(_run_evaluator, tasks):
+                if timings:
+                    phase_timer.ACTIVE.merge(*timings)
+                yield from results
+
+def evaluate_ai(agent=None, games=10000, log_interval=1000, workers=1, seed=None, metrics_every=10,
+                record_replays=False):
+    """
+    Evaluate the AI against random players using the advanced game logic
+    Games are sharded across `workers` processes; a fixed seed gives the same
+    ai_win_rate.txt for any number of workers
+    Metrics go to logs/eval_<time>.jsonl, one record every metrics_every games;
+    with record_replays, every game is recorded to replays/eval_<time>/
+    """
+    print(f"Starting evaluation with {games} games...")
     
     # Configure logging
-    log_file = f"logs/eval_{int(time.time())}.txt"
-    sys.stdout = open(log_file, "w")
+    stamp = int(time.time())
+    log_file = f"logs/eval_{stamp}.jsonl"
+    metrics = MetricsLog(log_file, sample_every=metrics_every)
+    replay_dir = f"replays/eval_{stamp}" if record_replays else None
+    
+    shanten.load_tables(SHANTEN_TABLES)
     
     # Load agent if not provided
     if agent is None:
@@ -144,36 +408,27 @@ def evaluate_ai(agent=None, games=10000, log_interval=1000):
     game_lengths = []
     draws = 0
     
+    if seed is None:
+        seed = random.randrange(2**32)
+    metrics.record("config", mode="eval", games=games, workers=workers, seed=seed, epsilon=agent.epsilon,
+                   q_size=len(agent.q_table))
     start_time = time.time()
     
-    for game_num in range(games):
-        game = MahjongGame()
+    played = play_evaluation(agent, games, workers, seed, replay_dir=replay_dir)
+    for game_num, (winners, rounds, reward, error) in enumerate(played):
+        if error is not None:
+            metrics.record("error", episode=game_num + 1, error=error)
+            continue
         
-        # Set Player 1 as our AI
-        game.players[0].is_ai = True
-        game.players[0].rl_agent = agent
+        game_lengths.append(rounds)
         
-        # Reset agent for new game
-        agent.reset_for_new_game()
+        # Track wins
+        for name in winners:
+            wins[name] += 1
         
-        try:
-            # Play the game
-            game.play_game(quiet=True)
-            game_lengths.append(game.current_round)
-            
-            # Track wins
-            winner_found = False
-            for player in game.players:
-                if player.is_hu:
-                    wins[player.name] += 1
-                    winner_found = True
-            
-            if not winner_found:
-                draws += 1
-                
-        except Exception as e:
-            print(f"Error in game {game_num+1}: {str(e)}")
-            continue
+        if not winners:
+            draws += 1
+        metrics.episode(game_num, kind="game", winners=winners, rounds=rounds, reward=round(reward, 2))
         
         # Log progress
         if (game_num + 1) % log_interval == 0:
@@ -188,13 +443,11 @@ def evaluate_ai(agent=None, games=10000, log_interval=1000):
             avg_length = sum(game_lengths) / len(game_lengths)
             completion = 100 - (draws / games_completed * 100)
             
-            print(f"Game {games_completed}/{games} ({elapsed:.1f}s)")
-            print(f"AI win rate: {win_rate_ai:.2f}% (Advantage: {advantage:.2f}%)")
-            print(f"Random players avg: {avg_random:.2f}%")
-            print(f"Game completion: {completion:.2f}%")
-            print(f"Average length: {avg_length:.1f} rounds")
-            print(f"Wins: {wins}")
-            print("-" * 50)
+            metrics.record("progress", episode=games_completed, ai_win_rate=win_rate_ai, advantage=advantage,
+                           completion=completion, avg_rounds=avg_length, wins=dict(wins),
+                           per_sec=round(games_completed / elapsed, 2))
+            print(f"Game {games_completed}/{games} ({elapsed:.1f}s, {games_completed/elapsed:.1f} games/s): "
+                  f"AI win rate {win_rate_ai:.2f}% (advantage {advantage:.2f}%)")
     
     total_time = time.time() - start_time
     games_completed = games
@@ -208,6 +461,10 @@ def evaluate_ai(agent=None, games=10000, log_interval=1000):
     avg_length = sum(game_lengths) / len(game_lengths) if game_lengths else 0
     completion = 100 - (draws / games_completed * 100)
     
+    metrics.record("summary", games=games_completed, seconds=round(total_time, 2), wins=wins,
+                   ai_win_rate=win_rate_ai, advantage=advantage, avg_rounds=avg_length, completion=completion,
+                   per_sec=round(games_completed / total_time, 2))
+    metrics.close()
     print(f"\nEvaluation completed in {total_time:.2f} seconds!")
     
     # Save results to file
@@ -224,11 +481,7 @@ def evaluate_ai(agent=None, games=10000, log_interval=1000):
         f.write(f"Average game length: {avg_length:.1f} rounds\n")
         f.write(f"Game completion rate: {completion:.2f}%\n")
     
-    # Restore stdout
-    sys.stdout.close()
-    sys.stdout = sys.__stdout__
-    
-    print(f"Evaluation completed! Log saved to {log_file}")
+    print(f"Evaluation completed! Metrics saved to {log_file}")
     print(f"Results saved to ai_win_rate.txt")
     
     # Success message with key performance metrics
@@ -245,6 +498,23 @@ def parse_arguments():
     parser.add_argument('--train-episodes', type=int, default=50000, help='Number of training episodes')
     parser.add_argument('--eval-games', type=int, default=10000, help='Number of evaluation games')
     parser.add_argument('--load-model', action='store_true', help='Load existing model instead of training new one')
+    parser.add_argument('--workers', type=int, default=1, help='Processes for training actors and evaluation (1 = serial)')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='Master seed: every training episode and evaluation game gets its own stream derived from it')
+    parser.add_argument('--sync-episodes', type=int, default=100,
+                        help='Episodes the actors play (split between them) between Q-table syncs')
+    parser.add_argument('--sync-checkpoints', action='store_true', help='Write checkpoints inline instead of in the background')
+    parser.add_argument('--publish-interval', type=int, default=1000,
+                        help='Episodes between writes of the model to models/q_table.pkl during training')
+    parser.add_argument('--keep-bases', type=int, default=None,
+                        help='Checkpoint bases (with their deltas) to keep; older episodes are then lost (default: all)')
+    parser.add_argument('--metrics-every', type=int, default=10, help='Record every Nth episode/game in the JSONL metrics')
+    parser.add_argument('--phase-timing', action='store_true',
+                        help='Time the phases of every game and print a table at the end')
+    parser.add_argument('--record-replays', action='store_true',
+                        help='Record every game to replays/train_<time>/ and replays/eval_<time>/ (see replay.py)')
+    parser.add_argument('--record-transitions', action='store_true',
+                        help='Store every training update in transitions/train_<time>.mjt for offline_train.py')
     return parser.parse_args()
 
 if __name__ == "__main__":
@@ -256,11 +526,19 @@ if __name__ == "__main__":
         args.train = True
         args.eval = True
     
+    if args.phase_timing:
+        phase_timer.enable()
+    
     agent = None
     
     # Training phase
     if args.train and not args.load_model:
-        agent = train_ai(episodes=args.train_episodes)
+        agent = train_ai(episodes=args.train_episodes, workers=args.workers,
+                         sync_episodes=args.sync_episodes,
+                         background_checkpoints=not args.sync_checkpoints,
+                         metrics_every=args.metrics_every, seed=args.seed,
+                         record_replays=args.record_replays, record_transitions=args.record_transitions,
+                         publish_interval=args.publish_interval, keep_bases=args.keep_bases)
     elif args.load_model or args.eval:
         # Load existing model
         print("Loading existing model from models/q_table.pkl")
@@ -268,8 +546,14 @@ if __name__ == "__main__":
     
     # Evaluation phase
     if args.eval and agent:
-        evaluate_ai(agent, games=args.eval_games)
+        evaluate_ai(agent, games=args.eval_games, workers=args.workers, seed=args.seed,
+                    metrics_every=args.metrics_every, record_replays=args.record_replays)
     elif args.eval:
-        evaluate_ai(games=args.eval_games)
+        evaluate_ai(games=args.eval_games, workers=args.workers, seed=args.seed,
+                    metrics_every=args.metrics_every, record_replays=args.record_replays)
+    
+    if args.phase_timing:
+        print()
+        print(phase_timer.ACTIVE.table())
     
     print("AI pipeline completed successfully!")
\ No newline at end of file
@@ -0,0 +1,166 @@
+"""
+Exact shanten (number of tile swaps away from ready) for regular hands and
+seven pairs.
+
+-1 means the hand is complete, 0 means ready (one tile from winning).
+
+A regular hand is scored per suit: every 9-digit count pattern is decomposed
+once into its best (melds, partial melds) combinations, with and without the
+pair, and memoized. Patterns are decomposed the first time they are seen (from
+the already memoized patterns they reduce to); the tables can be saved to and
+loaded from disk so a fresh process starts warm.
+"""
+import os
+import pickle
+
+# Suit pattern (tuple of 9 counts) -> (options without the pair, options with
+# the pair), each a tuple of Pareto-best (melds, partial melds) pairs
+_SUIT_OPTIONS = {}
+
+# (tuple of 27 counts, exposed melds, banned suit) -> shanten
+# Cleared when it grows past HAND_CACHE_SIZE
+_HAND_SHANTEN = {}
+HAND_CACHE_SIZE = 500000
+
+
+def _pareto(options):
+    """Keep the (melds, partials) pairs no other pair beats on both counts"""
+    return tuple(sorted(
+        (m, t) for m, t in options
+        if not any(m2 >= m and t2 >= t and (m2, t2) != (m, t) for m2, t2 in options)
+    ))
+
+
+def suit_options(pattern):
+    """
+    Memoized (no-pair options, pair options) for a suit pattern (tuple of 9 counts)
+    Built from the options of the pattern left after taking the lowest tile
+    out as a meld, the pair, a partial meld or an unused tile
+    """
+    options = _SUIT_OPTIONS.get(pattern)
+    if options is not None:
+        return options
+
+    i = 0
+    while i < 9 and pattern[i] == 0:
+        i += 1
+    if i == 9:
+        options = _SUIT_OPTIONS[pattern] = (((0, 0),), ())
+        return options
+
+    no_head = set()
+    with_head = set()
+
+    def take(removed, melds, partials, as_head=False):
+        counts = list(pattern)
+        for j, n in removed:
+            counts[j] -= n
+        rest_no_head, rest_with_head = suit_options(tuple(counts))
+        if as_head:
+            with_head.update((m + melds, t + partials) for m, t in rest_no_head)
+        else:
+            no_head.update((m + melds, t + partials) for m, t in rest_no_head)
+            with_head.update((m + melds, t + partials) for m, t in rest_with_head)
+
+    # Triplet
+    if pattern[i] >= 3:
+        take(((i, 3),), 1, 0)
+    # Straight
+    if i <= 6 and pattern[i + 1] and pattern[i + 2]:
+        take(((i, 1), (i + 1, 1), (i + 2, 1)), 1, 0)
+    if pattern[i] >= 2:
+        # The pair of the hand
+        take(((i, 2),), 0, 0, as_head=True)
+        # A pair waiting for its third tile
+        take(((i, 2),), 0, 1)
+    # Two tiles waiting for the middle or an end of a straight
+    for gap in (1, 2):
+        if i + gap <= 8 and pattern[i + gap]:
+            take(((i, 1), (i + gap, 1)), 0, 1)
+    # Leave the tile unused
+    take(((i, 1),), 0, 0)
+
+    options = _SUIT_OPTIONS[pattern] = (_pareto(no_head), _pareto(with_head))
+    return options
+
+
+def regular_shanten(counts, exposed=0, banned_suit=None):
+    """
+    Shanten of a regular hand (4 melds + 1 pair) given as a 27-slot count vector
+    Exposed pengs / gangs count as finished melds; banned suit tiles are never used
+    """
+    usable = sum(counts) - (sum(counts[banned_suit * 9:banned_suit * 9 + 9]) if banned_suit is not None else 0)
+    # Combine the suits: (melds, partials, has pair)
+    combos = {(exposed, 0, False)}
+    for suit in range(3):
+        pattern = tuple(counts[suit * 9:suit * 9 + 9])
+        if suit == banned_suit or not any(pattern):
+            continue
+        no_head, with_head = suit_options(pattern)
+        merged = set()
+        for m, t, head in combos:
+            for sm, st in no_head:
+                merged.add((m + sm, t + st, head))
+            if not head:
+                for sm, st in with_head:
+                    merged.add((m + sm, t + st, True))
+        combos = merged
+
+    # Each meld is worth 2, each partial meld 1 (only while melds are still
+    # missing), the pair 1; a complete hand scores 9
+    best = max(2 * m + min(t, 4 - m) + head for m, t, head in combos)
+    # The score assumes spare usable tiles to start the missing melds and the
+    # pair; a hand filled up with banned tiles has to draw every tile it lacks
+    return max(8 - best, 13 - 3 * exposed - usable)
+
+
+def seven_pairs_shanten(counts, banned_suit=None):
+    """
+    Shanten of a seven pairs hand (no exposed sets allowed)
+    """
+    pairs = 0
+    kinds = 0
+    for tile, c in enumerate(counts):
+        if c and tile // 9 != banned_suit:
+            kinds += 1
+            if c >= 2:
+                pairs += 1
+    return 6 - pairs + max(0, 7 - kinds)
+
+
+def shanten(counts, exposed=0, banned_suit=None):
+    """
+    Exact shanten of a hand: the best of regular and seven pairs
+    """
+    key = (tuple(counts), exposed, banned_suit)
+    result = _HAND_SHANTEN.get(key)
+    if result is None:
+        result = regular_shanten(counts, exposed, banned_suit)
+        if exposed == 0:
+            result = min(result, seven_pairs_shanten(counts, banned_suit))
+        if len(_HAND_SHANTEN) >= HAND_CACHE_SIZE:
+            _HAND_SHANTEN.clear()
+        _HAND_SHANTEN[key] = result
+    return result
+
+
+def player_shanten(player):
+    """Shanten of a Player's current hand"""
+    return shanten(player.hand.counts, len(player.exposed_sets), player.banned_suit)
+
+
+def save_tables(path):
+    """Save the memoized per-suit tables so a later process starts warm"""
+    os.makedirs(os.path.dirname(path) if os.path.dirname(path) else '.', exist_ok=True)
+    with open(path, "wb") as f:
+        pickle.dump(_SUIT_OPTIONS, f)
+
+
+def load_tables(path):
+    """Load per-suit tables written by save_tables (a missing file is ignored)"""
+    try:
+        with open(path, "rb") as f:
+            _SUIT_OPTIONS.update(pickle.load(f))
+    except FileNotFoundError:
+        pass
+    return len(_SUIT_OPTIONS)
@@ -0,0 +1,144 @@
+"""
+Integer tile IDs and the count-vector hand.
+
+A tile is an int 0..26: suit * 9 + (number - 1), with suits ordered W, T, B
+(the order generate_deck has always used). Tile strings like "5W" only appear
+when printing or logging.
+"""
+import itertools
+
+SUITS = ["W", "T", "B"]
+W, T, B = 0, 1, 2
+# The suit order of the string-tile count dicts ({"W": 0, "B": 0, "T": 0}):
+# suit ties and random suit picks follow it
+TIE_ORDER = (W, B, T)
+SUIT_INDEX = {suit: i for i, suit in enumerate(SUITS)}
+
+TILE_NAMES = [f"{num}{suit}" for suit in SUITS for num in range(1, 10)]
+TILE_IDS = {name: i for i, name in enumerate(TILE_NAMES)}
+
+# Every change to any Hand takes a fresh version, so a version identifies the
+# exact contents of a hand for caches
+_versions = itertools.count(1)
+
+
+def make_tile(suit, num):
+    """Tile ID for a suit index and a number 1..9"""
+    return suit * 9 + num - 1
+
+
+def suit_of(tile):
+    return tile // 9
+
+
+def num_of(tile):
+    return tile % 9 + 1
+
+
+def tile_id(name):
+    """Tile ID for a tile string like "5W" """
+    return TILE_IDS[name]
+
+
+def tile_name(tile):
+    """Tile string like "5W" for a tile ID"""
+    return TILE_NAMES[tile]
+
+
+def tile_names(tiles):
+    return [TILE_NAMES[t] for t in tiles]
+
+
+class Hand:
+    """
+    Tiles held by a player, kept as a 27-slot count vector
+    Draw, discard, peng and gang updates are O(1); iteration is always sorted
+    `version` changes on every update (copies share it until they change)
+    `held` and `quads` are bitmasks (bit = tile ID) of the tiles held at
+    least once and four times
+    """
+    __slots__ = ("counts", "suit_sizes", "size", "version", "held", "quads")
+
+    def __init__(self, tiles=()):
+        self.counts = [0] * 27
+        self.suit_sizes = [0, 0, 0]
+        self.size = 0
+        self.version = next(_versions)
+        self.held = 0
+        self.quads = 0
+        for tile in tiles:
+            self.append(tile)
+
+    def append(self, tile):
+        count = self.counts[tile] = self.counts[tile] + 1
+        if count == 1:
+            self.held |= 1 << tile
+        elif count == 4:
+            self.quads |= 1 << tile
+        self.suit_sizes[tile // 9] += 1
+        self.size += 1
+        self.version = next(_versions)
+
+    def extend(self, tiles):
+        for tile in tiles:
+            self.append(tile)
+
+    def remove(self, tile, n=1):
+        count = self.counts[tile]
+        if count < n:
+            raise ValueError(f"{tile_name(tile)} not in hand")
+        self.counts[tile] = count - n
+        if count == 4:
+            self.quads &= ~(1 << tile)
+        if count == n:
+            self.held &= ~(1 << tile)
+        self.suit_sizes[tile // 9] -= n
+        self.size -= n
+        self.version = next(_versions)
+
+    def count(self, tile):
+        return self.counts[tile]
+
+    def copy(self):
+        hand = Hand.__new__(Hand)
+        hand.counts = self.counts.copy()
+        hand.suit_sizes = self.suit_sizes.copy()
+        hand.size = self.size
+        hand.version = self.version
+        hand.held = self.held
+        hand.quads = self.quads
+        return hand
+
+    def distinct(self):
+        """Tile IDs present in the hand, each once"""
+        counts = self.counts
+        return [t for t in range(27) if counts[t]]
+
+    def tiles(self):
+        """Sorted list of tile IDs (with repeats)"""
+        tiles = []
+        for t, c in enumerate(self.counts):
+            if c:
+                tiles.extend([t] * c)
+        return tiles
+
+    def suit_tiles(self, suit):
+        """Sorted list of tile IDs of one suit (with repeats)"""
+        tiles = []
+        for t in range(suit * 9, suit * 9 + 9):
+            c = self.counts[t]
+            if c:
+                tiles.extend([t] * c)
+        return tiles
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        return iter(self.tiles())
+
+    def __contains__(self, tile):
+        return self.counts[tile] > 0
+
+    def __repr__(self):
+        return f"Hand({tile_names(self.tiles())})"
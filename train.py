@@ -1,8 +1,8 @@
-import sys
 import os
 import time
 import random
 from rl_agent import RLAgent
+from metrics import MetricsLog
 
 # Try to import the 4AI game, fallback to regular if needed
 try:
@@ -15,9 +15,9 @@ except ImportError:
 os.makedirs("logs", exist_ok=True)
 os.makedirs("models", exist_ok=True)
 
-# Set up logging
-log_filename = "logs/train_enhanced_log.txt"
-sys.stdout = open(log_filename, "w")
+# Set up logging (every 10th episode is recorded)
+log_filename = "logs/train_enhanced_log.jsonl"
+metrics = MetricsLog(log_filename, sample_every=10)
 
 # Initialize the RL agent with advanced settings
 rl_agent = RLAgent(
@@ -37,6 +37,8 @@ wins = {f"Player {i+1}": 0 for i in range(4)}
 
 print(f"Starting enhanced AI training with {num_episodes} episodes")
 print(f"Hyperparameters: alpha={rl_agent.alpha}, gamma={rl_agent.gamma}, epsilon={rl_agent.epsilon}")
+metrics.record("config", mode="train", episodes=num_episodes, alpha=rl_agent.alpha, gamma=rl_agent.gamma,
+               epsilon=rl_agent.epsilon, q_size=len(rl_agent.q_table))
 
 start_time = time.time()
 
@@ -62,9 +64,13 @@ for episode in range(num_episodes):
                 wins[player.name] += 1
                 
     except Exception as e:
-        print(f"Error in episode {episode}: {str(e)}")
+        metrics.record("error", episode=episode + 1, error=str(e))
         continue
     
+    metrics.episode(episode, winners=[player.name for player in game.players if player.is_hu],
+                    rounds=game.current_round, reward=round(sum(player.total_reward for player in game.players), 2),
+                    q_size=len(rl_agent.q_table))
+    
     # Save checkpoint
     if (episode + 1) % checkpoint_interval == 0:
         checkpoint_file = f"models/q_table_ep{episode+1}.pkl"
@@ -81,19 +87,18 @@ for episode in range(num_episodes):
         elapsed_time = time.time() - start_time
         win_rate = sum(wins.values()) / (episode + 1)
         
-        print(f"Episode {episode+1}/{num_episodes} ({(episode+1)/num_episodes*100:.1f}%)")
-        print(f"Time elapsed: {elapsed_time:.2f} seconds")
-        print(f"Current exploration rate (epsilon): {rl_agent.epsilon:.4f}")
-        print(f"Win rate: {win_rate:.4f}")
-        print(f"Win distribution: {wins}")
-        print(f"Q-table entries: {len(rl_agent.q_table)}")
-        print("-" * 50)
+        metrics.record("progress", episode=episode + 1, win_rate=win_rate, wins=dict(wins),
+                       q_size=len(rl_agent.q_table), per_sec=round((episode + 1) / elapsed_time, 2))
+        print(f"Episode {episode+1}/{num_episodes} ({elapsed_time:.1f}s, {(episode+1)/elapsed_time:.1f} episodes/s): "
+              f"win rate {win_rate:.4f}, Q-table entries {len(rl_agent.q_table)}")
 
 # Save the final model
 rl_agent.save_q_table()
 
 total_time = time.time() - start_time
-print(f"\nTraining completed in {total_time:.2f} seconds!")
+metrics.record("summary", episodes=num_episodes, seconds=round(total_time, 2), wins=wins,
+               q_size=len(rl_agent.q_table), per_sec=round(num_episodes / total_time, 2))
+metrics.close()
 
 # Save training results
 with open("train_win_results.txt", "w") as f:
@@ -107,10 +112,7 @@ with open("train_win_results.txt", "w") as f:
         win_percentage = (count / num_episodes) * 100
         f.write(f"{player} wins: {count} ({win_percentage:.2f}%)\n")
 
-sys.stdout.close()
-sys.stdout = sys.__stdout__
-
 print(f"Enhanced AI training completed in {total_time:.2f} seconds!")
-print(f"Log saved to {log_filename}")
+print(f"Metrics saved to {log_filename}")
 print(f"Results saved to train_win_results.txt")
 print(f"Model saved to models/q_table_enhanced.pkl")
\ No newline at end of file
@@ -0,0 +1,105 @@
+"""
+Stored Q-learning transitions.
+
+Every update RLAgent.learn applies can be appended to a transition file, so
+the Q-table can be re-learned offline (offline_train.py) without simulating
+the games again. A file is a 16-byte header followed by fixed-size records:
+    state       encoded state (q_store.encode_state)
+    next_state  encoded next state
+    reward      float64
+    action      action ID (q_store.ACTION_IDS)
+    flags       TERMINAL (no next actions), HU (terminal because of a win)
+    next_mask   legal actions of the next state (q_store.legal_mask bits)
+The record count follows from the file size, so a file cut short by a crash
+still reads up to its last whole record.
+"""
+import os
+import struct
+import numpy as np
+
+from q_store import N_ACTIONS, MASK_BYTES, ACTION_IDS, encode_state
+
+MAGIC = b"MJTR"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sII4x")  # magic, version, record size
+SUFFIX = ".mjt"
+
+TRANSITION = np.dtype([("state", "<i4"), ("next_state", "<i4"), ("reward", "<f8"), ("action", "u1"),
+                       ("flags", "u1"), ("next_mask", "u1", (MASK_BYTES,))])
+TERMINAL = 1
+HU = 2
+
+
+def unpack_masks(masks):
+    """(n, N_ACTIONS) boolean legal-action matrix of (n, MASK_BYTES) packed masks"""
+    return np.unpackbits(masks, axis=1, count=N_ACTIONS, bitorder="little").astype(bool)
+
+
+class TransitionWriter:
+    """Appends transitions to a file, buffer_records at a time"""
+
+    def __init__(self, path, buffer_records=65536):
+        os.makedirs(os.path.dirname(path) if os.path.dirname(path) else '.', exist_ok=True)
+        self.path = path
+        self.buffer = np.zeros(buffer_records, dtype=TRANSITION)
+        self.n = 0
+        self.written = 0
+        self.file = open(path, "wb")
+        self.file.write(HEADER.pack(MAGIC, FORMAT_VERSION, TRANSITION.itemsize))
+
+    def add(self, state, action, reward, next_state, next_mask, hu_achieved=False):
+        """Buffer one transition (the arguments of RLAgent.learn)"""
+        record = self.buffer[self.n]
+        record["state"] = encode_state(state)
+        record["next_state"] = encode_state(next_state)
+        record["reward"] = reward
+        record["action"] = ACTION_IDS[action]
+        if next_mask is None:
+            record["flags"] = TERMINAL | (HU if hu_achieved else 0)
+            record["next_mask"] = 0
+        else:
+            record["flags"] = 0
+            record["next_mask"] = np.frombuffer(next_mask.to_bytes(MASK_BYTES, "little"), dtype=np.uint8)
+        self.n += 1
+        if self.n == len(self.buffer):
+            self.flush()
+
+    def flush(self):
+        if self.n:
+            self.file.write(self.buffer[:self.n].tobytes())
+            self.file.flush()
+            self.written += self.n
+            self.n = 0
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+def open_transitions(path):
+    """Read-only memory map of a transition file's records"""
+    with open(path, "rb") as f:
+        magic, version, record_size = HEADER.unpack(f.read(HEADER.size))
+    if magic != MAGIC or version != FORMAT_VERSION or record_size != TRANSITION.itemsize:
+        raise ValueError(f"{path} is not a transition file")
+    n = (os.path.getsize(path) - HEADER.size) // record_size
+    if not n:
+        return np.zeros(0, dtype=TRANSITION)
+    return np.memmap(path, dtype=TRANSITION, mode="r", offset=HEADER.size, shape=(n,))
+
+
+def count(paths):
+    """Transitions stored in the files"""
+    return sum(len(open_transitions(path)) for path in paths)
+
+
+def iter_blocks(paths, block_records=65536):
+    """
+    The records of the files in order, as in-memory blocks of up to
+    block_records transitions (only one block is held at a time, so files
+    may be larger than RAM)
+    """
+    for path in paths:
+        records = open_transitions(path)
+        for start in range(0, len(records), block_records):
+            yield np.array(records[start:start + block_records])